@@ -1,65 +1,47 @@
 import pandas as pd
 import os
+import io
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # =====================================
-# 1. FILE PATH (ABSOLUTE, NO GUESSING)
+# 1. CONFIG
 # =====================================
-file_path = r"C:\Users\akank\OneDrive\Desktop\AverxaAI\SAS-Chatbot\Team Updates\Akanksha\DECEMBER SALE.xls"
+# Usage:
+#   python preprocessing.py "DECEMBER SALE.xls"
+#   python preprocessing.py exports/ --out output --workers 4
+#   python preprocessing.py "exports/*SALE*.xls" --load      (COPY into Postgres)
+#
+# Output layout (all Parquet):
+#   <out>/cleaned/month=YYYY-MM/<file>.parquet        parent + child rows
+#   <out>/product_level/month=YYYY-MM/<file>.parquet  product rows only
+#
+# <file> is the export's path relative to the input root (the directory
+# given, or a glob's base directory) with "/" written as "__", so
+# same-named exports from different folders never overwrite each other.
+# That relative path is also sales_register_lines.source_file.
+#   <out>/firm_wise_sales_summary.parquet
+#   <out>/product_wise_sales_summary.parquet
+#   <out>/_manifest.json                              content hash per input
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+INPUT_EXTENSIONS = (".xls", ".xlsx")
+HEADER_ROWS = 8  # Tally sales register: title block above the header row
 
-if not os.path.exists(file_path):
-    raise FileNotFoundError(f"File not found at: {file_path}")
-
-# =====================================
-# 2. READ EXCEL & BASIC CLEANUP
-# =====================================
-df = pd.read_excel(file_path, skiprows=8)
-
-# clean column names
-df.columns = df.columns.str.strip()
-
-print("Initial columns:")
-print(df.columns.tolist())
-print("Initial shape:", df.shape)
-
-# =====================================
-# 3. DROP UNWANTED COLUMNS
-# =====================================
 cols_to_drop = [
     "SALES @18% Inter-State",
     "IGST @18%",
     "Freight"
 ]
 
-df = df.drop(columns=cols_to_drop, errors="ignore")
-
-print("\nColumns after dropping:")
-print(df.columns.tolist())
-
-# =====================================
-# 4. HIERARCHICAL TRANSFORMATION
-#    Parent: Firm / Invoice row
-#    Child : Product row
-# =====================================
-
-# Rule:
-# Date NOT NULL  -> Firm / Invoice row
-# Date NULL      -> Product row
-
-df["is_firm_row"] = df["Date"].notna()
-
-# Firm name from invoice rows
-df["FIRM"] = df["Particulars"].where(df["is_firm_row"])
-df["FIRM"] = df["FIRM"].ffill()
-
-# Product name from product rows
-df["FIRM_PRODUCT"] = df["Particulars"].where(~df["is_firm_row"])
-
-# Drop helper + old column (semantic cleanup)
-df = df.drop(columns=["Particulars", "is_firm_row"])
-
-# =====================================
-# 5. REORDER COLUMNS (SAFE)
-# =====================================
 priority_cols = [
     "Date",
     "FIRM",
@@ -69,107 +51,353 @@ priority_cols = [
     "GSTIN/UIN"
 ]
 
-priority_cols = [c for c in priority_cols if c in df.columns]
+# Excel column -> sales_register_lines column (missing ones load as NULL)
+LOAD_COLUMNS = {
+    "Date": "date",
+    "FIRM": "firm",
+    "FIRM_PRODUCT": "firm_product",
+    "Voucher Type": "voucher_type",
+    "Voucher No.": "voucher_no",
+    "GSTIN/UIN": "gstin",
+    "Quantity": "quantity",
+    "Rate": "rate",
+    "Value": "value",
+    "Gross Total": "gross_total",
+    "CGST@9%": "cgst",
+    "SGST@9%": "sgst",
+}
+
+LOAD_DDL = """
+CREATE TABLE IF NOT EXISTS sales_register_lines (
+    source_file   TEXT NOT NULL,
+    source_hash   TEXT NOT NULL,
+    line_no       INT  NOT NULL,
+    month         TEXT,
+    date          DATE,
+    firm          TEXT,
+    firm_product  TEXT,
+    voucher_type  TEXT,
+    voucher_no    TEXT,
+    gstin         TEXT,
+    quantity      NUMERIC,
+    rate          NUMERIC,
+    value         NUMERIC,
+    gross_total   NUMERIC,
+    cgst          NUMERIC,
+    sgst          NUMERIC,
+    PRIMARY KEY (source_file, line_no)
+);
+"""
 
-df = df[
-    priority_cols +
-    [col for col in df.columns if col not in priority_cols]
-]
 
+# =====================================
+# 2. HIERARCHICAL TRANSFORMATION
+#    Parent: Firm / Invoice row
+#    Child : Product row
+# =====================================
+def clean_sales_register(df):
+    # clean column names
+    df.columns = df.columns.str.strip()
 
-# 6. FINAL VERIFICATION VIEW
-
-print("\nFINAL DATA PREVIEW:")
-print(df.head(20).to_string(index=False))
-print("\nFinal shape:", df.shape)
-
-
-# 7. SAVE CLEANED DATASET
-
-output_path = r"C:\Users\akank\OneDrive\Desktop\AverxaAI\SAS-Chatbot\Team Updates\Akanksha\cleaned_sales_dataset.xlsx"
-df.to_excel(output_path, index=False)
-
-print(f"\nSaved cleaned dataset to:\n{output_path}")
-
+    df = df.drop(columns=cols_to_drop, errors="ignore")
 
-# 8. PRODUCT-ONLY DATASET
+    # Rule:
+    # Date NOT NULL  -> Firm / Invoice row
+    # Date NULL      -> Product row
+    is_firm_row = df["Date"].notna()
 
+    # Firm name from invoice rows
+    df["FIRM"] = df["Particulars"].where(is_firm_row).ffill()
 
-product_df = df[df["FIRM_PRODUCT"].notna()].copy()
+    # Product name from product rows
+    df["FIRM_PRODUCT"] = df["Particulars"].where(~is_firm_row)
 
-print("\nPRODUCT-LEVEL DATA PREVIEW:")
-print(
-    product_df[
-        [
-            "Date",
-            "FIRM",
-            "FIRM_PRODUCT",
-            "Quantity",
-            "Rate",
-            "Value"
-        ]
-    ].head(20).to_string(index=False)
-)
+    df = df.drop(columns=["Particulars"])
 
-print("\nProduct-level shape:", product_df.shape)
+    ordered = [c for c in priority_cols if c in df.columns]
+    return df[ordered + [col for col in df.columns if col not in ordered]]
 
-product_output_path = r"C:\Users\akank\OneDrive\Desktop\AverxaAI\SAS-Chatbot\Team Updates\Akanksha\product_level_sales.xlsx"
 
-product_df.to_excel(product_output_path, index=False)
+def month_of(df):
+    """Invoice month for every row; product rows take their invoice's date."""
+    return pd.to_datetime(df["Date"]).ffill().dt.strftime("%Y-%m").fillna("unknown")
 
-print(f"\nSaved product-level dataset to:\n{product_output_path}")
 
-# 9. FIRM-WISE AGGREGATION
+# =====================================
+# 3. AGGREGATIONS
+# =====================================
+def firm_summary(product_df):
+    return (
+        product_df
+        .groupby("FIRM", dropna=False)
+        .agg(
+            total_quantity=("Quantity", "sum"),
+            total_sales_value=("Value", "sum"),
+            total_cgst=("CGST@9%", "sum"),
+            total_sgst=("SGST@9%", "sum"),
+            distinct_products=("FIRM_PRODUCT", "nunique"),
+            line_items=("FIRM_PRODUCT", "count")
+        )
+        .reset_index()
+    )
 
 
-firm_agg_df = (
-    product_df
-    .groupby("FIRM", dropna=False)
-    .agg(
-        total_quantity=("Quantity", "sum"),
-        total_sales_value=("Value", "sum"),
-        total_cgst=("CGST@9%", "sum"),
-        total_sgst=("SGST@9%", "sum"),
-        distinct_products=("FIRM_PRODUCT", "nunique"),
-        line_items=("FIRM_PRODUCT", "count")
+def product_summary(product_df):
+    return (
+        product_df
+        .groupby("FIRM_PRODUCT", dropna=False)
+        .agg(
+            total_quantity=("Quantity", "sum"),
+            total_sales_value=("Value", "sum"),
+            total_cgst=("CGST@9%", "sum"),
+            total_sgst=("SGST@9%", "sum"),
+            distinct_firms=("FIRM", "nunique"),
+            line_items=("FIRM", "count")
+        )
+        .reset_index()
+        .sort_values("total_sales_value", ascending=False)
     )
-    .reset_index()
-)
 
-print("\nFIRM-WISE AGGREGATED DATA:")
-print(firm_agg_df.head(20).to_string(index=False))
-print("\nFirm-level shape:", firm_agg_df.shape)
 
-firm_output_path = r"C:\Users\akank\OneDrive\Desktop\AverxaAI\SAS-Chatbot\Team Updates\Akanksha\firm_wise_sales_summary.xlsx"
+# =====================================
+# 4. INPUTS + CONTENT HASHES
+# =====================================
+def _glob_root(spec):
+    root = os.path.dirname(spec)
+    while re.search(r"[*?[]", root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def discover_inputs(specs):
+    """
+    Directories, globs or plain paths -> sorted [(path, source_key)]:
+    the absolute path and the path relative to the input root.
+    """
+    found = {}
+    for spec in specs:
+        if os.path.isdir(spec):
+            root = spec
+            paths = [os.path.join(spec, name) for name in os.listdir(spec)]
+        else:
+            root = _glob_root(spec)
+            paths = glob.glob(spec) or [spec]
+        for path in paths:
+            name = os.path.basename(path)
+            if name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith("~$"):
+                found[os.path.abspath(path)] = os.path.relpath(path, root).replace(os.sep, "/")
+
+    owners = {}
+    for path, key in found.items():
+        if owners.setdefault(key, path) != path:
+            raise ValueError(
+                f"{owners[key]} and {path} are both '{key}'; pass their common parent directory instead"
+            )
+    return sorted(found.items())
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, "_manifest.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
 
-firm_agg_df.to_excel(firm_output_path, index=False)
 
-print(f"\nSaved firm-wise summary to:\n{firm_output_path}")
+# =====================================
+# 5. PER-FILE WORKER (runs in a child process)
+# =====================================
+def write_partitions(df, months, out_dir, dataset, name):
+    outputs = []
+    for month, part in df.groupby(months, sort=True):
+        part_dir = os.path.join(out_dir, dataset, f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"{name}.parquet")
+        part.to_parquet(path, index=False)
+        outputs.append(os.path.relpath(path, out_dir))
+    return outputs
+
+
+def copy_to_postgres(df, months, source_file, source_hash, dsn):
+    """Replace this file's rows in sales_register_lines, in one transaction."""
+    import psycopg2
+
+    rows = pd.DataFrame({"source_file": source_file, "source_hash": source_hash,
+                         "line_no": range(len(df)), "month": months.values})
+    for src, dest in LOAD_COLUMNS.items():
+        rows[dest] = df[src].values if src in df.columns else None
+
+    buf = io.BytesIO(rows.to_csv(index=False, header=False, date_format="%Y-%m-%d").encode("utf-8"))
+
+    conn = psycopg2.connect(dsn)
+    conn.set_client_encoding("UTF8")
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM sales_register_lines WHERE source_file = %s", (source_file,))
+            cur.copy_expert(
+                f"COPY sales_register_lines ({', '.join(rows.columns)}) FROM STDIN WITH (FORMAT csv)",
+                buf
+            )
+    finally:
+        conn.close()
+
+
+def process_file(path, source_key, source_hash, out_dir, old_outputs=(), dsn=None):
+    started = time.perf_counter()
+
+    df = clean_sales_register(pd.read_excel(path, skiprows=HEADER_ROWS))
+    months = month_of(df)
+
+    # a changed file may no longer cover the same months
+    for rel in old_outputs:
+        full = os.path.join(out_dir, rel)
+        if os.path.exists(full):
+            os.remove(full)
+
+    name = os.path.splitext(source_key)[0].replace("/", "__")
+    is_product = df["FIRM_PRODUCT"].notna()
+    outputs = write_partitions(df, months, out_dir, "cleaned", name)
+    outputs += write_partitions(df[is_product], months[is_product], out_dir, "product_level", name)
+
+    if dsn:
+        copy_to_postgres(df, months, source_key, source_hash, dsn)
+
+    return {
+        "path": path,
+        "sha256": source_hash,
+        "rows": len(df),
+        "product_rows": int(is_product.sum()),
+        "months": sorted(months.unique().tolist()),
+        "outputs": outputs,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
 
 
-# 10. PRODUCT-WISE AGGREGATION
+# =====================================
+# 6. PIPELINE
+# =====================================
+def write_summaries(out_dir):
+    product_dir = os.path.join(out_dir, "product_level")
+    if not os.path.isdir(product_dir):
+        return
+    product_df = pd.read_parquet(product_dir).drop(columns=["month"], errors="ignore")
+    firm_summary(product_df).to_parquet(os.path.join(out_dir, "firm_wise_sales_summary.parquet"), index=False)
+    product_summary(product_df).to_parquet(os.path.join(out_dir, "product_wise_sales_summary.parquet"), index=False)
+
+
+def run(inputs, out_dir=DEFAULT_OUTPUT_DIR, workers=None, dsn=None, force=False):
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    keys = dict(discover_inputs(inputs))
+    paths = sorted(keys)
+    if not paths:
+        raise FileNotFoundError(f"No {'/'.join(INPUT_EXTENSIONS)} files found in: {inputs}")
+
+    if dsn:
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(LOAD_DDL)
+        finally:
+            conn.close()
+
+    manifest = load_manifest(out_dir)
+    hashes = {path: file_hash(path) for path in paths}
+    todo = [
+        path for path in paths
+        if force
+        or manifest.get(path, {}).get("sha256") != hashes[path]
+        or (dsn and not manifest[path].get("loaded"))
+    ]
+
+    results, failed = [], []
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    process_file, path, keys[path], hashes[path], out_dir,
+                    manifest.get(path, {}).get("outputs", []), dsn
+                ): path
+                for path in todo
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append({"path": path, "error": str(e)})
+                    print(f"❌ {keys[path]}: {e}")
+                    continue
+                results.append(result)
+                manifest[path] = {k: result[k] for k in ("sha256", "rows", "product_rows", "months", "outputs")}
+                manifest[path]["loaded"] = bool(dsn)
+                # saved per file so an interrupted run keeps its progress
+                save_manifest(out_dir, manifest)
+                print(
+                    f"✅ {keys[path]}: {result['rows']} rows "
+                    f"({result['product_rows']} products) {', '.join(result['months'])} "
+                    f"in {result['seconds']}s"
+                )
+
+    summary_missing = not os.path.exists(os.path.join(out_dir, "product_wise_sales_summary.parquet"))
+    if results or summary_missing:
+        write_summaries(out_dir)
+
+    return {
+        "files": len(paths),
+        "processed": len(results),
+        "skipped": len(paths) - len(todo),
+        "failed": failed,
+        "rows": sum(r["rows"] for r in results),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
 
 
-product_agg_df = (
-    product_df
-    .groupby("FIRM_PRODUCT", dropna=False)
-    .agg(
-        total_quantity=("Quantity", "sum"),
-        total_sales_value=("Value", "sum"),
-        total_cgst=("CGST@9%", "sum"),
-        total_sgst=("SGST@9%", "sum"),
-        distinct_firms=("FIRM", "nunique"),
-        line_items=("FIRM", "count")
+# =====================================
+# 7. ENTRY POINT
+# =====================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean Tally sales register exports into Parquet.")
+    parser.add_argument("inputs", nargs="+", help="export files, directories or glob patterns")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT_DIR, help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--load", action="store_true", help="COPY cleaned rows into Postgres (DATABASE_URL)")
+    parser.add_argument("--force", action="store_true", help="reprocess files even if unchanged")
+    args = parser.parse_args(argv)
+
+    dsn = None
+    if args.load:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL not set")
+        dsn = DATABASE_URL
+
+    summary = run(args.inputs, args.out, args.workers, dsn, args.force)
+    print(
+        f"\n✅ {summary['processed']} processed, {summary['skipped']} unchanged, "
+        f"{len(summary['failed'])} failed of {summary['files']} files "
+        f"({summary['rows']} rows) in {summary['seconds']}s"
     )
-    .reset_index()
-    .sort_values("total_sales_value", ascending=False)
-)
-
-print("\nPRODUCT-WISE AGGREGATED DATA:")
-print(product_agg_df.head(20).to_string(index=False))
-print("\nProduct-level shape:", product_agg_df.shape)
-product_summary_path = r"C:\Users\akank\OneDrive\Desktop\AverxaAI\SAS-Chatbot\Team Updates\Akanksha\product_wise_sales_summary.xlsx"
+    print(f"Output: {os.path.abspath(args.out)}")
+    return 1 if summary["failed"] else 0
 
-product_agg_df.to_excel(product_summary_path, index=False)
 
-print(f"\nSaved product-wise summary to:\n{product_summary_path}")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,681 @@
+# app/core/bench.py
+#
+# End-to-end /chat benchmark: the app under uvicorn, the stub LLM
+# (mock_llm.py), chat history in memory (CHAT_MEMORY_BACKEND=local) and
+# synthetic data in a local Postgres, driven by concurrent clients.
+#
+#   python -m app.core.bench seed --rows 1m
+#   python -m app.core.bench run --concurrency 32 --duration 30 --out bench.json
+#   python -m app.core.bench compare bench.json --baseline baseline.json
+#   python -m app.core.bench startup --import-budget-ms 1500 --ready-budget-ms 5000
+#
+# Per-stage latencies come from the Server-Timing header of /chat.
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import itertools
+import subprocess
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import httpx
+
+# =========================
+# ENV
+# =========================
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL", "")
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEMANTIC_PATH = os.path.join(os.path.dirname(CORE_DIR), "semantic.json")
+SCHEMA_PATH = os.path.join(CORE_DIR, "schema.sql")
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1", ""}
+
+# Mix of rule-matched questions (fast path) and free-form ones that go to
+# the LLM; the stub answers those from its canned intents.
+DEFAULT_QUESTIONS = [
+    "total sales by customer",
+    "units sold by item",
+    "revenue by item last month",
+    "current stock by item",
+    "sales by day this year",
+    "which customers keep us busiest lately",
+    "how are the units moving on the shelves",
+    "where does our revenue come from product wise",
+    "stock position across the warehouse",
+]
+
+PERCENTILES = (50, 95, 99)
+
+# startup budgets (ms, median of --repeat cold starts) for `startup`
+BENCH_IMPORT_BUDGET_MS = float(os.getenv("BENCH_IMPORT_BUDGET_MS", "1500"))
+BENCH_LIVE_BUDGET_MS = float(os.getenv("BENCH_LIVE_BUDGET_MS", "3000"))
+BENCH_READY_BUDGET_MS = float(os.getenv("BENCH_READY_BUDGET_MS", "6000"))
+
+
+# =========================
+# SYNTHETIC DATA
+# =========================
+def parse_rows(value: str) -> int:
+    """'10k' / '1m' / '10M' / '25000' → int."""
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def _require_local(dsn: str, allow_remote: bool):
+    host = urlsplit(dsn).hostname or ""
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(
+            f"Refusing to benchmark against non-local database host '{host}'. "
+            f"Point BENCH_DATABASE_URL at a scratch Postgres or pass --allow-remote."
+        )
+
+
+def seed(dsn: str, rows: int, days: int = 730):
+    """
+    Replace the semantic-layer tables with synthetic data: `rows`
+    sales_items lines, a third as many invoices, half as many stock
+    movements, and customers/items scaled to match. Generated server-side.
+    """
+    import psycopg2
+
+    n_sales = max(1, rows // 3)
+    n_customers = max(100, rows // 1000)
+    n_items = min(5000, max(100, rows // 2000))
+    n_movements = max(1, rows // 2)
+    params = {
+        "rows": rows, "sales": n_sales, "customers": n_customers,
+        "items": n_items, "movements": n_movements, "days": days,
+    }
+
+    with open(SEMANTIC_PATH, "r", encoding="utf-8") as f:
+        rollup_tables = [spec["table"] for spec in json.load(f).get("rollups", {}).values()]
+
+    started = time.perf_counter()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("SET synchronous_commit = off")
+            cur.execute("SELECT setseed(0.42)")
+            # rollups are rebuilt from the new data by `run --rollups`
+            for table in rollup_tables + ["rollup_dirty_days"]:
+                cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+            cur.execute("DROP TABLE IF EXISTS customers, sales, sales_items, stock_items, stock_movements CASCADE")
+            cur.execute("""
+                CREATE TABLE customers (id INT PRIMARY KEY, name TEXT, created_at TIMESTAMPTZ DEFAULT now());
+                CREATE TABLE sales (voucher_no TEXT PRIMARY KEY, voucher_date DATE, customer_id INT,
+                                    customer_name TEXT, total_amount NUMERIC);
+                CREATE TABLE sales_items (voucher_no TEXT, item_name TEXT, quantity NUMERIC,
+                                          rate NUMERIC, amount NUMERIC);
+                CREATE TABLE stock_items (item_name TEXT PRIMARY KEY, opening_qty NUMERIC);
+                CREATE TABLE stock_movements (item_name TEXT, movement_type TEXT, quantity NUMERIC,
+                                              movement_date DATE);
+            """)
+            cur.execute("""
+                INSERT INTO customers (id, name)
+                SELECT g, 'Customer ' || g FROM generate_series(1, %(customers)s) g;
+
+                INSERT INTO stock_items
+                SELECT 'Item ' || g, 50 + (g * 37) %% 500 FROM generate_series(1, %(items)s) g;
+
+                INSERT INTO sales_items
+                SELECT 'V' || (1 + g %% %(sales)s),
+                       'Item ' || (1 + (g * 31) %% %(items)s),
+                       q, r, q * r
+                FROM generate_series(1, %(rows)s) g,
+                     LATERAL (SELECT 1 + g %% 5 AS q, 50 + (g * 13) %% 950 AS r) v;
+
+                INSERT INTO sales
+                SELECT 'V' || g,
+                       current_date - (g %% %(days)s),
+                       c, 'Customer ' || c,
+                       COALESCE(t.amount, 0)
+                FROM generate_series(1, %(sales)s) g
+                CROSS JOIN LATERAL (SELECT 1 + (g * 7919) %% %(customers)s AS c) k
+                LEFT JOIN (SELECT voucher_no, SUM(amount) AS amount FROM sales_items GROUP BY voucher_no) t
+                       ON t.voucher_no = 'V' || g;
+
+                INSERT INTO stock_movements
+                SELECT 'Item ' || (1 + (g * 17) %% %(items)s),
+                       CASE WHEN random() < 0.4 THEN 'PURCHASE' ELSE 'SALE' END,
+                       1 + g %% 10,
+                       current_date - (g %% %(days)s)
+                FROM generate_series(1, %(movements)s) g;
+            """, params)
+
+            with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+                cur.execute(f.read())
+            cur.execute("UPDATE data_version SET version = version + 1, updated_at = now() WHERE id = 1")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE customers, sales, sales_items, stock_items, stock_movements")
+    finally:
+        conn.close()
+
+    return {**params, "seconds": round(time.perf_counter() - started, 2)}
+
+
+# =========================
+# PROCESSES
+# =========================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process, timeout: float = 60.0, interval: float = 0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def start_stack(args) -> tuple:
+    """Stub LLM + uvicorn running the app; returns (base_url, processes)."""
+    llm_port, app_port = _free_port(), _free_port()
+    base_env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+
+    llm_env = {
+        **base_env,
+        "MOCK_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "MOCK_LLM_LATENCY_DIST": args.llm_latency_dist,
+        "MOCK_LLM_LATENCY_JITTER_MS": str(args.llm_jitter_ms),
+        "MOCK_LLM_LATENCY_SIGMA": str(args.llm_sigma),
+        "MOCK_LLM_FAIL_RATE": str(args.llm_fail_rate),
+    }
+    if args.llm_intents:
+        llm_env["MOCK_LLM_INTENTS_PATH"] = os.path.abspath(args.llm_intents)
+
+    app_env = {
+        **base_env,
+        "DATABASE_URL": args.dsn,
+        "GROQ_API_KEY": "bench",
+        "GROQ_URL": f"http://localhost:{llm_port}/v1/chat/completions",
+        "CHAT_MEMORY_BACKEND": "local",
+        "ROLLUPS_ENABLED": "true" if args.rollups else "false",
+        "COLUMNAR_ENABLED": "true" if args.columnar else "false",
+    }
+    if args.no_cache:
+        app_env["CACHE_TTL_SECONDS"] = "0"
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+
+    processes = []
+    try:
+        llm = subprocess.Popen([sys.executable, "-m", "app.core.mock_llm", str(llm_port)], env=llm_env)
+        processes.append(llm)
+
+        if args.rollups:
+            subprocess.run([sys.executable, "-m", "app.core.rollups", "init"], env=app_env, check=True)
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.core.main:app",
+             "--host", "127.0.0.1", "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            env=app_env,
+        )
+        processes.append(server)
+
+        base_url = f"http://127.0.0.1:{app_port}"
+        _wait_ready(f"{base_url}/readyz", server)
+        if args.columnar:
+            # let the first snapshot land so the run measures steady state
+            deadline = time.monotonic() + 120
+            while time.monotonic() < deadline:
+                if httpx.get(f"{base_url}/columnar/stats").json().get("enabled"):
+                    break
+                time.sleep(0.5)
+        return base_url, processes
+    except BaseException:
+        stop_stack(processes)
+        raise
+
+
+def stop_stack(processes: list):
+    for process in reversed(processes):
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# =========================
+# LOAD
+# =========================
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(value)
+    return stages
+
+
+async def drive(base_url: str, questions: list, concurrency: int, duration: float = 0,
+                requests: int = 0, sessions: int = 100, unique: bool = False) -> dict:
+    """
+    `concurrency` clients in closed loop until `duration` seconds or
+    `requests` requests. Returns the raw samples and wall time.
+    """
+    samples = []
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration if duration else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        async def client_loop():
+            while True:
+                n = next(counter)
+                if requests and n >= requests:
+                    return
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                question = questions[n % len(questions)]
+                if unique:
+                    # defeats the exact-question and result caches' key reuse
+                    question = f"{question} #{n}"
+                payload = {"session_id": f"bench-{n % sessions}", "question": question}
+
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json=payload)
+                    status = response.status_code
+                    stages = parse_server_timing(response.headers.get("server-timing", ""))
+                except httpx.HTTPError as e:
+                    status, stages = type(e).__name__, {}
+                samples.append({
+                    "latency_ms": (time.perf_counter() - started) * 1000,
+                    "status": status,
+                    "stages": stages,
+                })
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {"samples": samples, "wall_seconds": wall}
+
+
+def _percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    summary = {f"p{p}": round(_percentile(values, p), 3) for p in PERCENTILES}
+    summary.update({
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    })
+    return summary
+
+
+def report(run: dict) -> dict:
+    samples = run["samples"]
+    ok = [s for s in samples if s["status"] == 200]
+
+    statuses = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+
+    stage_names = []
+    for s in ok:
+        for name in s["stages"]:
+            if name not in stage_names:
+                stage_names.append(name)
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "status_codes": statuses,
+        "wall_seconds": round(run["wall_seconds"], 3),
+        "throughput_rps": round(len(ok) / run["wall_seconds"], 2) if run["wall_seconds"] else 0.0,
+        "latency_ms": {
+            "total": summarize([s["latency_ms"] for s in ok]),
+            # stages a request skipped (e.g. execute on a cache hit) are not counted
+            "stages": {
+                name: summarize([s["stages"][name] for s in ok if name in s["stages"]])
+                for name in stage_names
+            },
+        },
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=CORE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args) -> dict:
+    _require_local(args.dsn, args.allow_remote)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    base_url, processes = start_stack(args)
+    try:
+        if args.warmup:
+            asyncio.run(drive(base_url, questions, args.concurrency, duration=args.warmup,
+                              sessions=args.sessions, unique=args.unique))
+        result = asyncio.run(drive(base_url, questions, args.concurrency,
+                                   duration=args.duration, requests=args.requests,
+                                   sessions=args.sessions, unique=args.unique))
+        server = {}
+        for name, path in (("cache", "/cache/stats"), ("llm", "/llm/stats"), ("prompt", "/prompt/stats"),
+                           ("db_pool", "/db/pool")):
+            try:
+                server[name] = httpx.get(base_url + path, timeout=5).json()
+            except (httpx.HTTPError, ValueError):
+                server[name] = None
+    finally:
+        stop_stack(processes)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "sessions": args.sessions,
+                "unique_questions": args.unique,
+                "questions": len(questions),
+                "workers": args.workers,
+                "rollups": args.rollups,
+                "columnar": args.columnar,
+                "no_cache": args.no_cache,
+                "llm_latency_ms": args.llm_latency_ms,
+                "llm_latency_dist": args.llm_latency_dist,
+                "llm_fail_rate": args.llm_fail_rate,
+                "server_env": args.server_env,
+            },
+        },
+        **report(result),
+        "server": server,
+    }
+
+
+# =========================
+# STARTUP
+# =========================
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.core.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_startup(args) -> dict:
+    """
+    Cold-start cost of a worker, each in a fresh process: importing
+    app.core.main, spawn → /livez answering, spawn → /readyz 200 (warm-up
+    done). Nothing else runs; the LLM is never called during startup.
+    """
+    _require_local(args.dsn, args.allow_remote)
+    env = {
+        **os.environ,
+        "PYTHONUNBUFFERED": "1",
+        "DATABASE_URL": args.dsn,
+        "GROQ_API_KEY": "bench",
+        "GROQ_URL": "http://127.0.0.1:9/v1/chat/completions",
+        "CHAT_MEMORY_BACKEND": "local",
+        "ROLLUPS_ENABLED": "false",
+        "COLUMNAR_ENABLED": "false",
+    }
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    import_ms, live_ms, ready_ms, steps = [], [], [], {}
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env,
+                             capture_output=True, text=True, check=True)
+        import_ms.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+
+    for _ in range(args.repeat):
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.core.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            _wait_ready(f"{base_url}/livez", server, args.timeout, interval=0.01)
+            live_ms.append((time.perf_counter() - started) * 1000)
+            _wait_ready(f"{base_url}/readyz", server, args.timeout, interval=0.01)
+            ready_ms.append((time.perf_counter() - started) * 1000)
+            for name, c in httpx.get(f"{base_url}/readyz").json()["components"].items():
+                steps.setdefault(name, []).append(c["seconds"] * 1000)
+        finally:
+            stop_stack([server])
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {"repeat": args.repeat, "server_env": args.server_env},
+        },
+        "import_ms": summarize(import_ms),
+        "live_ms": summarize(live_ms),
+        "ready_ms": summarize(ready_ms),
+        "warm_up_steps_ms": {name: summarize(values) for name, values in steps.items()},
+    }
+
+
+def check_budgets(result: dict, budgets: dict) -> list:
+    """Medians over their budget: [{metric, budget, current}]."""
+    return [
+        {"metric": metric, "budget": budget, "current": result[metric]["p50"]}
+        for metric, budget in budgets.items()
+        if result[metric].get("p50") is not None and result[metric]["p50"] > budget
+    ]
+
+
+# =========================
+# REGRESSIONS
+# =========================
+def compare(current: dict, baseline: dict, tolerance: float = 0.10, min_ms: float = 1.0) -> list:
+    """
+    Latency percentiles that grew by more than `tolerance` (and `min_ms`),
+    plus throughput that dropped by more than `tolerance`.
+    """
+    regressions = []
+
+    def check(label, now, before):
+        for p in PERCENTILES:
+            key = f"p{p}"
+            if now.get(key) is None or before.get(key) is None:
+                continue
+            if now[key] > before[key] * (1 + tolerance) and now[key] - before[key] >= min_ms:
+                regressions.append({
+                    "metric": f"{label}.{key}", "baseline": before[key], "current": now[key],
+                    "change": round(now[key] / before[key] - 1, 3) if before[key] else None,
+                })
+
+    check("latency_ms.total", current["latency_ms"]["total"], baseline["latency_ms"]["total"])
+    for stage, stats in current["latency_ms"]["stages"].items():
+        if stage in baseline["latency_ms"]["stages"]:
+            check(f"latency_ms.stages.{stage}", stats, baseline["latency_ms"]["stages"][stage])
+
+    before, now = baseline.get("throughput_rps") or 0, current.get("throughput_rps") or 0
+    if before and now < before * (1 - tolerance):
+        regressions.append({
+            "metric": "throughput_rps", "baseline": before, "current": now,
+            "change": round(now / before - 1, 3),
+        })
+    if current.get("errors", 0) > baseline.get("errors", 0):
+        regressions.append({
+            "metric": "errors", "baseline": baseline.get("errors", 0), "current": current["errors"],
+            "change": None,
+        })
+    return regressions
+
+
+def _print_report(result: dict):
+    total = result["latency_ms"]["total"]
+    print(
+        f"✅ {result['requests']} requests, {result['errors']} errors, "
+        f"{result['throughput_rps']} req/s"
+    )
+    print(f"{'stage':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'count':>8}")
+    for name, stats in [("total", total)] + list(result["latency_ms"]["stages"].items()):
+        if stats.get("count"):
+            print(f"{name:<14}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}{stats['count']:>8}")
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.core.bench", description="End-to-end /chat benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="load synthetic data into a local Postgres")
+    p_seed.add_argument("--rows", default="10k", help="sales_items rows: 10k, 1m, 10m, ...")
+    p_seed.add_argument("--days", type=int, default=730)
+    p_seed.add_argument("--dsn", default=BENCH_DATABASE_URL)
+    p_seed.add_argument("--allow-remote", action="store_true")
+
+    p_run = sub.add_parser("run", help="start the stack and drive /chat")
+    p_run.add_argument("--dsn", default=BENCH_DATABASE_URL)
+    p_run.add_argument("--allow-remote", action="store_true")
+    p_run.add_argument("--concurrency", type=int, default=16)
+    p_run.add_argument("--duration", type=float, default=20.0, help="seconds (0 → use --requests)")
+    p_run.add_argument("--requests", type=int, default=0)
+    p_run.add_argument("--warmup", type=float, default=3.0, help="seconds, not measured")
+    p_run.add_argument("--sessions", type=int, default=100)
+    p_run.add_argument("--questions", help="file with one question per line")
+    p_run.add_argument("--unique", action="store_true", help="make every question distinct")
+    p_run.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    p_run.add_argument("--rollups", action="store_true", help="build and use rollup tables")
+    p_run.add_argument("--columnar", action="store_true", help="enable the columnar backend")
+    p_run.add_argument("--no-cache", action="store_true", help="CACHE_TTL_SECONDS=0")
+    p_run.add_argument("--llm-latency-ms", type=float, default=300.0)
+    p_run.add_argument("--llm-latency-dist", default="lognormal",
+                       choices=["fixed", "uniform", "exponential", "lognormal"])
+    p_run.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    p_run.add_argument("--llm-sigma", type=float, default=0.5)
+    p_run.add_argument("--llm-fail-rate", type=float, default=0.0)
+    p_run.add_argument("--llm-intents", help="JSON {question substring: intent} for the stub")
+    p_run.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    p_run.add_argument("--out", help="write the JSON report here")
+    p_run.add_argument("--baseline", help="fail if this run regresses against that report")
+    p_run.add_argument("--tolerance", type=float, default=0.10)
+
+    p_start = sub.add_parser("startup", help="measure import / live / ready time against budgets")
+    p_start.add_argument("--dsn", default=BENCH_DATABASE_URL)
+    p_start.add_argument("--allow-remote", action="store_true")
+    p_start.add_argument("--repeat", type=int, default=3, help="cold starts per measurement")
+    p_start.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /readyz")
+    p_start.add_argument("--import-budget-ms", type=float, default=BENCH_IMPORT_BUDGET_MS)
+    p_start.add_argument("--live-budget-ms", type=float, default=BENCH_LIVE_BUDGET_MS)
+    p_start.add_argument("--ready-budget-ms", type=float, default=BENCH_READY_BUDGET_MS)
+    p_start.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    p_start.add_argument("--out", help="write the JSON report here")
+
+    p_cmp = sub.add_parser("compare", help="compare two JSON reports")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--baseline", required=True)
+    p_cmp.add_argument("--tolerance", type=float, default=0.10)
+    p_cmp.add_argument("--min-ms", type=float, default=1.0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        if not args.dsn:
+            raise SystemExit("Set BENCH_DATABASE_URL or pass --dsn")
+        _require_local(args.dsn, args.allow_remote)
+        print(f"✅ Seeded {seed(args.dsn, parse_rows(args.rows), args.days)}")
+        return 0
+
+    if args.command == "run":
+        if not args.dsn:
+            raise SystemExit("Set BENCH_DATABASE_URL or pass --dsn")
+        result = run(args)
+        _print_report(result)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, default=str)
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare(result, json.load(f), args.tolerance)
+            for r in regressions:
+                print(f"❌ {r['metric']}: {r['baseline']} → {r['current']}")
+            return 1 if regressions else 0
+        return 0
+
+    if args.command == "startup":
+        if not args.dsn:
+            raise SystemExit("Set BENCH_DATABASE_URL or pass --dsn")
+        result = measure_startup(args)
+        result["budgets_ms"] = {
+            "import_ms": args.import_budget_ms,
+            "live_ms": args.live_budget_ms,
+            "ready_ms": args.ready_budget_ms,
+        }
+        for metric in ("import_ms", "live_ms", "ready_ms"):
+            print(f"{metric:<10}p50 {result[metric]['p50']:>9.1f}  max {result[metric]['max']:>9.1f}"
+                  f"  budget {result['budgets_ms'][metric]:>7.0f}")
+        for name, stats in result["warm_up_steps_ms"].items():
+            print(f"  {name:<16}p50 {stats['p50']:>9.1f}")
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, default=str)
+        over = check_budgets(result, result["budgets_ms"])
+        for r in over:
+            print(f"❌ {r['metric']}: {r['current']} ms > budget {r['budget']} ms")
+        return 1 if over else 0
+
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance, args.min_ms)
+    print(json.dumps({"regressions": regressions}, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,43 +2,42 @@
 
 import os
 import json
+import time
+import sqlite3
 import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from typing import Optional
 
+from app.core.startup import Lazy, resolve, is_initialized
+
 # =========================
 # ENV
 # =========================
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "semantic-cache")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "900"))
+CACHE_INTENT_TTL_SECONDS = float(os.getenv("CACHE_INTENT_TTL_SECONDS", "86400"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")  # empty → L1 only
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "5"))
 
-USE_PINECONE = bool(PINECONE_API_KEY)
 
 # =========================
-# INIT PINECONE (OPTIONAL)
+# UTILS
 # =========================
-if USE_PINECONE:
-    from pinecone import Pinecone
-
-    pc = Pinecone(api_key=PINECONE_API_KEY)
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
 
-    # Create index if not exists
-    existing_indexes = pc.list_indexes().names()
-    if PINECONE_INDEX_NAME not in existing_indexes:
-        pc.create_index(
-            name=PINECONE_INDEX_NAME,
-            dimension=8,  # dummy dimension (we store metadata, not vectors)
-            metric="cosine",
-            spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
-        )
 
-    index = pc.Index(PINECONE_INDEX_NAME)
-else:
-    index = None
+def _dumps(value) -> str:
+    return json.dumps(value, sort_keys=True, default=json_default)
 
 
-# =========================
-# UTILS
-# =========================
 def _hash_key(data: dict) -> str:
     """
     Stable hash for semantic intent
@@ -48,6 +47,311 @@ def _hash_key(data: dict) -> str:
     return hashlib.sha256(raw.encode()).hexdigest()
 
 
+def canonical_intent(intent: dict) -> dict:
+    """Order-insensitive form so ["item", "customer"] == ["customer", "item"]."""
+    return {
+        "metric": intent.get("metric"),
+        "dimensions": sorted(intent.get("dimensions") or []),
+        "filters": intent.get("filters") or {},
+    }
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+# =========================
+# L1: IN-PROCESS LRU
+# =========================
+class LRUCache:
+    """
+    Byte-budgeted LRU with per-entry TTL.
+    Sizes are the JSON length of the value, which is close enough
+    to the real footprint to keep the budget meaningful.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expires_at, version, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, version: Optional[int] = None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, entry_version, size = entry
+            if expires_at < time.monotonic() or (
+                version is not None and entry_version != version
+            ):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value, ttl: float, version: Optional[int] = None, size: Optional[int] = None):
+        size = size if size is not None else len(_dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + ttl, version, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# =========================
+# L2: LOCAL SQLITE (OPTIONAL)
+# =========================
+class SQLiteCache:
+    """Survives worker restarts; shared by workers on the same host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    version INTEGER
+                )
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, version: Optional[int] = None):
+        row = self._conn().execute(
+            "SELECT value, expires_at, version FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or row[1] < time.time() or (
+            version is not None and row[2] != version
+        ):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float, version: Optional[int] = None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, version) VALUES (?, ?, ?, ?)",
+                (key, _dumps(value), time.time() + ttl, version),
+            )
+
+    def purge(self, version: Optional[int] = None):
+        """Drop expired rows and, if given, rows from older data versions."""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            if version is not None:
+                conn.execute(
+                    "DELETE FROM cache WHERE version IS NOT NULL AND version != ?",
+                    (version,),
+                )
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+
+# =========================
+# TIERED CACHE
+# =========================
+class TieredCache:
+
+    def __init__(self, l1: LRUCache, l2: Optional[SQLiteCache] = None):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, key: str, version: Optional[int] = None):
+        value = self.l1.get(key, version)
+        if value is not None or self.l2 is None:
+            return value
+
+        value = self.l2.get(key, version)
+        if value is not None:
+            # promote; the remaining TTL is not tracked across tiers
+            self.l1.set(key, value, CACHE_TTL_SECONDS, version)
+        return value
+
+    def set(self, key: str, value, ttl: float, version: Optional[int] = None):
+        self.l1.set(key, value, ttl, version)
+        if self.l2 is not None:
+            self.l2.set(key, value, ttl, version)
+
+    def clear(self):
+        self.l1.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+
+    def stats(self) -> dict:
+        s = {"l1": self.l1.stats()}
+        # stats never open the SQLite file; it has none until first use
+        if self.l2 is not None and is_initialized(self.l2):
+            s["l2"] = self.l2.stats()
+        return s
+
+
+# =========================
+# DATA VERSION
+# =========================
+class DataVersion:
+    """
+    Monotonic counter bumped by ingestion (see schema.sql, data_version).
+
+    Result entries are tagged with the version they were computed at,
+    so one bump invalidates every cached result across all workers.
+    The version is polled at most every DATA_VERSION_POLL_SECONDS.
+    """
+
+    def __init__(self, poll_seconds: float = DATA_VERSION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def _fetch(self) -> int:
+        from app.core.db_pool import get_pool
+
+        with get_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT version FROM data_version WHERE id = 1")
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def current(self) -> int:
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_seconds:
+            return self._version
+
+        with self._lock:
+            if now - self._checked_at >= self.poll_seconds:
+                try:
+                    self._observe(self._fetch())
+                except Exception:
+                    # keep serving the last known version if the DB is unreachable
+                    pass
+                self._checked_at = now
+        return self._version
+
+    def _observe(self, version: int):
+        if version != self._version:
+            self._version = version
+            self.invalidations += 1
+
+    def refresh(self) -> int:
+        """Read the version now; unlike current(), raises if the DB is unreachable."""
+        version = self._fetch()
+        with self._lock:
+            self._observe(version)
+            self._checked_at = time.monotonic()
+        return version
+
+    def expire(self):
+        """Re-read the version on the next lookup instead of waiting for the poll."""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+# =========================
+# INSTANCES
+# =========================
+# the SQLite file is opened on first use, or by warm_up()
+_l2 = Lazy(lambda: SQLiteCache(CACHE_SQLITE_PATH), "sqlite_cache") if CACHE_SQLITE_PATH else None
+
+intent_cache = TieredCache(LRUCache(CACHE_MAX_BYTES // 8), _l2)
+result_cache = TieredCache(LRUCache(CACHE_MAX_BYTES), _l2)
+data_version = DataVersion()
+
+
+def warm_up():
+    """Open the L2 tier and read the current data_version (startup)."""
+    if _l2 is not None:
+        resolve(_l2)
+    data_version.refresh()
+
+
+# =========================
+# CACHE: INTENT
+# =========================
+def _intent_key(question: str, history: list) -> str:
+    return "intent:" + _hash_key({
+        "question": normalize_question(question),
+        "history": [h.get("intent") for h in history or []],
+    })
+
+
+def get_cached_intent(question: str, history: list) -> Optional[dict]:
+    return intent_cache.get(_intent_key(question, history))
+
+
+def _seconds_until_midnight() -> float:
+    now = datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+
+def store_intent(question: str, history: list, intent: dict):
+    # dates in an intent may be resolved from "today" or "last month":
+    # it expires with the day it was extracted on
+    ttl = min(CACHE_INTENT_TTL_SECONDS, _seconds_until_midnight())
+    intent_cache.set(_intent_key(question, history), intent, ttl)
+
+
 # =========================
 # CACHE: GET
 # =========================
@@ -59,37 +363,33 @@ def get_from_cache(intent: dict) -> Optional[dict]:
         "dimensions": ["customer"],
         "filters": {}
     }
-    """
-    if not index:
-        return None
-
-    key = _hash_key(intent)
-
-    try:
-        res = index.fetch(ids=[key])
-        if key in res.vectors:
-            return json.loads(res.vectors[key].metadata["response"])
-    except Exception:
-        return None
 
-    return None
+    Returns {"sql": ..., "result": [...]} or None.
+    """
+    key = "result:" + _hash_key(canonical_intent(intent))
+    return result_cache.get(key, data_version.current())
 
 
 # =========================
 # CACHE: STORE
 # =========================
 def store_in_cache(intent: dict, response: dict):
-    if not index:
-        return
+    key = "result:" + _hash_key(canonical_intent(intent))
+    result_cache.set(key, response, CACHE_TTL_SECONDS, data_version.current())
 
-    key = _hash_key(intent)
 
-    index.upsert([
-        {
-            "id": key,
-            "values": [0.0] * 8,  # dummy vector
-            "metadata": {
-                "response": json.dumps(response)
-            }
-        }
-    ])
+def invalidate_results():
+    """In-process invalidation, e.g. right after a local ingestion."""
+    # L2 is shared with the intent cache; its rows are version-tagged
+    # and fall out on their own once the new version is observed.
+    result_cache.l1.clear()
+    data_version.expire()
+
+
+def cache_stats() -> dict:
+    return {
+        "data_version": data_version._version,
+        "invalidations": data_version.invalidations,
+        "intent": intent_cache.stats(),
+        "result": result_cache.stats(),
+    }
@@ -1,33 +1,341 @@
 import os
-from supabase import create_client
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from app.core.startup import Lazy, resolve
+
 # ✅ Load env vars HERE
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("SUPABASE_URL or SUPABASE_KEY not set")
+# "supabase" (default) or "local" for the in-process stand-in (tests, offline dev)
+CHAT_MEMORY_BACKEND = os.getenv("CHAT_MEMORY_BACKEND", "supabase")
+
+CHAT_MEMORY_SESSIONS = int(os.getenv("CHAT_MEMORY_SESSIONS", "10000"))
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "20"))
+CHAT_MEMORY_BATCH_SIZE = int(os.getenv("CHAT_MEMORY_BATCH_SIZE", "200"))
+CHAT_MEMORY_FLUSH_INTERVAL = float(os.getenv("CHAT_MEMORY_FLUSH_INTERVAL", "0.5"))
+CHAT_MEMORY_QUEUE_MAX = int(os.getenv("CHAT_MEMORY_QUEUE_MAX", "10000"))
+CHAT_MEMORY_MAX_RETRIES = int(os.getenv("CHAT_MEMORY_MAX_RETRIES", "5"))
+
+
+def _create_client():
+    # imported here: the supabase package is slow to import, and a worker
+    # without credentials should still start (and report not-ready)
+    if CHAT_MEMORY_BACKEND == "local":
+        from app.core.mock_supabase import create_client
+    else:
+        from supabase import create_client
+
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("SUPABASE_URL or SUPABASE_KEY not set")
+
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+# created on first read/write, or by warm_up()
+supabase = Lazy(_create_client, "supabase")
+
+logger = logging.getLogger("app.core.chat_memory")
+
+
+def _instant(value):
+    """created_at as a comparable datetime; chat_history and our rows format it differently."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value or datetime.min.replace(tzinfo=timezone.utc)
+
+
+# =========================
+# SESSION MEMORY
+# =========================
+class SessionMemory:
+    """
+    Last CHAT_MEMORY_TURNS messages per session in a ring buffer, with
+    LRU eviction across sessions. Writes land locally at once and reach
+    chat_history through a background batch writer; Supabase is only
+    read when a session is not held locally.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_sessions: int = CHAT_MEMORY_SESSIONS,
+        turns: int = CHAT_MEMORY_TURNS,
+        batch_size: int = CHAT_MEMORY_BATCH_SIZE,
+        flush_interval: float = CHAT_MEMORY_FLUSH_INTERVAL,
+        queue_max: int = CHAT_MEMORY_QUEUE_MAX,
+        max_retries: int = CHAT_MEMORY_MAX_RETRIES,
+    ):
+        self.client = client
+        self.max_sessions = max_sessions
+        self.turns = turns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_max = queue_max
+        self.max_retries = max_retries
+
+        self._sessions = OrderedDict()  # session_id -> deque of {question, intent}
+        self._lock = threading.Lock()
+        # session_id -> its rows not yet in chat_history (queued, being
+        # written or failed), so a read can see them without a flush
+        self._pending = {}
+        self._queue = queue.Queue(maxsize=queue_max)
+        # rows are only taken off the queue under _flush_lock, so flush()
+        # cannot return while the writer holds rows it has not written
+        self._flush_lock = threading.Lock()
+        self._failed = []  # rows whose batch used up its retries, oldest first
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._stopping = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.overflowed = 0
+
+    # ----------------------
+    # READ
+    # ----------------------
+    def get_last_messages(self, session_id: str, limit: int = 5) -> list:
+        with self._lock:
+            ring = self._sessions.get(session_id)
+            if ring is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return list(ring)[-limit:] if limit else []
+            self.misses += 1
+
+        # Session not held locally (new, evicted or another worker's).
+        # Its unwritten rows are merged in from memory: a flush here would
+        # put the writer's retries and backoff on the request path. Taken
+        # before the select, so a row written meanwhile is seen at least once.
+        with self._lock:
+            pending = list(self._pending.get(session_id, ()))
+        res = (
+            self.client
+            .table("chat_history")
+            .select("question, intent, created_at")
+            .eq("session_id", session_id)
+            .order("created_at", desc=True)
+            .limit(self.turns)
+            .execute()
+        )
+        rows = list(reversed(res.data)) if res.data else []
+        if pending:
+            seen = {(_instant(r.get("created_at")), r.get("question")) for r in rows}
+            rows += [r for r in pending if (_instant(r["created_at"]), r["question"]) not in seen]
+            rows.sort(key=lambda r: _instant(r.get("created_at")))
+        rows = [{"question": r.get("question"), "intent": r.get("intent")} for r in rows[-self.turns:]]
+
+        with self._lock:
+            ring = self._sessions.get(session_id)
+            if ring is None:
+                ring = self._install(session_id, rows)
+            return list(ring)[-limit:] if limit else []
+
+    def _install(self, session_id: str, rows: list) -> deque:
+        ring = deque(rows, maxlen=self.turns)
+        self._sessions[session_id] = ring
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return ring
+
+    # ----------------------
+    # WRITE
+    # ----------------------
+    def save_message(self, session_id: str, question: str, intent: dict):
+        message = {"question": question, "intent": intent}
+        with self._lock:
+            ring = self._sessions.get(session_id)
+            if ring is not None:
+                ring.append(message)
+                self._sessions.move_to_end(session_id)
+            # not held locally: leave it to the next read to load the
+            # full history, rather than caching a partial one
+
+        row = {
+            "session_id": session_id,
+            "question": question,
+            "intent": intent,
+            # explicit timestamp: a batch shares one transaction, and
+            # now() would give every row in it the same created_at
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+        self._ensure_writer()
+        with self._lock:
+            self._pending.setdefault(session_id, []).append(row)
+        try:
+            self._queue.put_nowait(row)
+            self._wakeup.set()
+        except queue.Full:
+            # never write on the request path: save_message runs on the
+            # event loop, and a full queue means chat_history is already
+            # not keeping up. The turn stays in the local ring.
+            self._forget([row])
+            with self._lock:
+                self.overflowed += 1
+                self.dropped += 1
+            logger.warning("chat memory queue full, dropped a row for session %s", session_id)
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._stopping.clear()
+                self._writer = threading.Thread(
+                    target=self._run, name="chat-memory-writer", daemon=True
+                )
+                self._writer.start()
+
+    # ----------------------
+    # WRITE-BEHIND
+    # ----------------------
+    def _run(self):
+        while not self._stopping.is_set():
+            # failed rows are retried every flush_interval even when idle
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+
+    def _drain(self):
+        """
+        Write the failed rows and everything queued, in batch_size chunks.
+        A batch that fails after max_retries is kept, with the rows after
+        it, for the next drain.
+        """
+        with self._flush_lock:
+            batch, self._failed = self._failed, []
+            while True:
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                chunk, batch = batch[:self.batch_size], batch[self.batch_size:]
+                if not self._insert(chunk):
+                    self._keep(chunk + batch)
+                    return
+
+    def _keep(self, rows: list):
+        # bounded like the queue; the oldest rows go first
+        overflow = max(0, len(rows) - self.queue_max)
+        self._failed = rows[overflow:]
+        if overflow:
+            self._forget(rows[:overflow])
+            with self._lock:
+                self.dropped += overflow
+            logger.warning("chat history unavailable, dropped %d rows", overflow)
+
+    def _insert(self, rows: list) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.client.table("chat_history").insert(rows).execute()
+                self._forget(rows)
+                with self._lock:
+                    self.written += len(rows)
+                    self.batches += 1
+                return True
+            except Exception:
+                if attempt == self.max_retries:
+                    return False
+                with self._lock:
+                    self.retries += 1
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+
+    def _forget(self, rows: list):
+        """Drop rows from _pending once written (or dropped)."""
+        with self._lock:
+            for row in rows:
+                pending = self._pending.get(row["session_id"])
+                if pending is None:
+                    continue
+                pending[:] = [r for r in pending if r is not row]
+                if not pending:
+                    del self._pending[row["session_id"]]
+
+    def flush(self):
+        """Write everything queued so far; returns once it is in chat_history (or kept as failed)."""
+        self._drain()
+
+    def close(self, timeout: float = 10.0):
+        """Stop the writer and flush what is left. Safe to call twice."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        self.flush()
+        if self._failed:
+            self._forget(self._failed)
+            with self._lock:
+                self.dropped += len(self._failed)
+            logger.warning("chat history unavailable at close, dropped %d rows", len(self._failed))
+            self._failed = []
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "queued": self._queue.qsize(),
+                "failed_pending": len(self._failed),
+                "written": self.written,
+                "batches": self.batches,
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "overflowed": self.overflowed,
+            }
+
+
+memory = SessionMemory(supabase)
+
+# last-chance flush if the process exits without the FastAPI shutdown hook
+atexit.register(memory.close)
+
+
+def warm_up():
+    resolve(supabase)
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def save_message(session_id: str, question: str, intent: dict):
-    supabase.table("chat_history").insert({
-        "session_id": session_id,
-        "question": question,
-        "intent": intent
-    }).execute()
+    memory.save_message(session_id, question, intent)
+
 
 def get_last_messages(session_id: str, limit: int = 5):
-    res = (
-        supabase
-        .table("chat_history")
-        .select("question, intent")
-        .eq("session_id", session_id)
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
-    return list(reversed(res.data)) if res.data else []
+    return memory.get_last_messages(session_id, limit)
+
+
+def flush():
+    memory.flush()
+
+
+def close():
+    memory.close()
+
+
+def memory_stats() -> dict:
+    return memory.stats()
@@ -0,0 +1,683 @@
+# app/core/columnar.py
+
+import os
+import re
+import json
+import time
+import shutil
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# ENV
+# =========================
+COLUMNAR_ENABLED = os.getenv("COLUMNAR_ENABLED", "true").lower() == "true"
+COLUMNAR_REFRESH_SECONDS = float(os.getenv("COLUMNAR_REFRESH_SECONDS", "2"))
+# default freshness requirement: 0 → only answer from a snapshot of the
+# current data_version; N → also accept a snapshot up to N seconds old
+COLUMNAR_MAX_STALENESS_SECONDS = float(os.getenv("COLUMNAR_MAX_STALENESS_SECONDS", "0"))
+COLUMNAR_SNAPSHOT_DIR = os.getenv("COLUMNAR_SNAPSHOT_DIR", "")  # empty → memory only
+
+
+class UnsupportedExpression(ValueError):
+    pass
+
+
+# =========================
+# METRIC EXPRESSIONS
+# =========================
+# Metric expressions are SQL. The subset used by the semantic layer —
+# sums/differences of SUM()/COUNT() over column arithmetic and CASE WHEN
+# with comparisons, AND/OR, CURRENT_DATE and INTERVAL 'n days' — is
+# compiled to vectorized pandas. Anything else raises
+# UnsupportedExpression and that metric stays on Postgres.
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:"
+    r"(?P<string>'(?:[^']|'')*')"
+    r"|(?P<number>\d+(?:\.\d+)?)"
+    r"|(?P<ident>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)"
+    r"|(?P<op>>=|<=|<>|!=|[=<>+\-*/(),])"
+    r")"
+)
+
+_INTERVAL_RE = re.compile(r"^\s*(\d+)\s+days?\s*$", re.IGNORECASE)
+
+_COMPARE = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "!=": lambda a, b: a != b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+}
+
+
+def _tokenize(expression: str) -> list:
+    tokens, pos = [], 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        m = _TOKEN_RE.match(expression, pos)
+        if not m or m.end() == pos:
+            raise UnsupportedExpression(f"Cannot parse near: {expression[pos:pos + 20]!r}")
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "ident" and "." not in value:
+            upper = value.upper()
+            if upper in {"SUM", "COUNT", "CASE", "WHEN", "THEN", "ELSE", "END", "AND",
+                         "OR", "NOT", "CURRENT_DATE", "INTERVAL", "NULL"}:
+                kind, value = "kw", upper
+        tokens.append((kind, value))
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over the tokens. Row-level nodes compile to
+    functions (env) -> Series | scalar; the top level is a signed list of
+    aggregates, so SUM(a) - SUM(b) stays exact under NULLs.
+    """
+
+    def __init__(self, expression: str):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.columns = set()
+
+    # ---- token helpers ----
+    def peek(self, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if value is not None and token[1] != value:
+            return None
+        return token
+
+    def take(self, value=None):
+        token = self.peek(value)
+        if token is None:
+            raise UnsupportedExpression(f"Expected {value or 'token'} at position {self.pos}")
+        self.pos += 1
+        return token
+
+    # ---- top level: ±AGG(...) ± AGG(...) ----
+    def parse(self) -> list:
+        aggregates = self.aggregate_sum(1)
+        if self.pos != len(self.tokens):
+            raise UnsupportedExpression(f"Unexpected {self.tokens[self.pos][1]!r}")
+        return aggregates
+
+    def aggregate_sum(self, sign: int) -> list:
+        aggregates = self.aggregate_term(sign)
+        while self.peek("+") or self.peek("-"):
+            op = self.take()[1]
+            aggregates += self.aggregate_term(sign if op == "+" else -sign)
+        return aggregates
+
+    def aggregate_term(self, sign: int) -> list:
+        if self.peek("-"):
+            self.take()
+            return self.aggregate_term(-sign)
+        if self.peek("("):
+            self.take()
+            aggregates = self.aggregate_sum(sign)
+            self.take(")")
+            return aggregates
+        token = self.take()
+        if token not in (("kw", "SUM"), ("kw", "COUNT")):
+            raise UnsupportedExpression("Only sums and differences of SUM()/COUNT() are supported")
+        self.take("(")
+        if token[1] == "COUNT" and self.peek("*"):
+            self.take()
+            row = lambda env: 1.0
+        else:
+            inner = self.expr()
+            row = inner if token[1] == "SUM" else (lambda env, f=inner: _as_series(f(env), env).notna().astype(float))
+        self.take(")")
+        return [(sign, row)]
+
+    # ---- row level ----
+    def expr(self):
+        node = self.term()
+        while self.peek("+") or self.peek("-"):
+            op = self.take()[1]
+            right = self.term()
+            node = (lambda env, l=node, r=right: l(env) + r(env)) if op == "+" else \
+                   (lambda env, l=node, r=right: l(env) - r(env))
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek("*") or self.peek("/"):
+            op = self.take()[1]
+            right = self.factor()
+            node = (lambda env, l=node, r=right: l(env) * r(env)) if op == "*" else \
+                   (lambda env, l=node, r=right: l(env) / r(env))
+        return node
+
+    def factor(self):
+        if self.peek("-"):
+            self.take()
+            inner = self.factor()
+            return lambda env: -inner(env)
+        if self.peek("("):
+            self.take()
+            node = self.expr()
+            self.take(")")
+            return node
+
+        kind, value = self.take()
+        if kind == "number":
+            number = float(value)
+            return lambda env: number
+        if kind == "string":
+            text = value[1:-1].replace("''", "'")
+            return lambda env: text
+        if kind == "ident":
+            self.columns.add(value)
+            return lambda env: env.column(value)
+        if value == "NULL":
+            return lambda env: np.nan
+        if value == "CURRENT_DATE":
+            return lambda env: env.today
+        if value == "INTERVAL":
+            m = _INTERVAL_RE.match(self.take()[1].strip("'"))
+            if not m:
+                raise UnsupportedExpression("Only INTERVAL 'n days' is supported")
+            delta = pd.Timedelta(days=int(m.group(1)))
+            return lambda env: delta
+        if value == "CASE":
+            return self.case()
+        raise UnsupportedExpression(f"Unsupported token {value!r}")
+
+    def case(self):
+        branches = []
+        while self.peek("WHEN"):
+            self.take()
+            condition = self.condition()
+            self.take("THEN")
+            branches.append((condition, self.expr()))
+        default = None
+        if self.peek("ELSE"):
+            self.take()
+            default = self.expr()
+        self.take("END")
+
+        def evaluate(env):
+            result = _as_series(default(env) if default else np.nan, env)
+            for condition, value in reversed(branches):
+                result = _as_series(value(env), env).where(_as_series(condition(env), env), result)
+            return result
+        return evaluate
+
+    def condition(self):
+        node = self.conjunction()
+        while self.peek("OR"):
+            self.take()
+            right = self.conjunction()
+            node = lambda env, l=node, r=right: l(env) | r(env)
+        return node
+
+    def conjunction(self):
+        node = self.comparison()
+        while self.peek("AND"):
+            self.take()
+            right = self.comparison()
+            node = lambda env, l=node, r=right: l(env) & r(env)
+        return node
+
+    def comparison(self):
+        if self.peek("NOT"):
+            self.take()
+            inner = self.comparison()
+            return lambda env: ~inner(env)
+        left = self.expr()
+        op = self.take()[1]
+        if op not in _COMPARE:
+            raise UnsupportedExpression(f"Unsupported comparison {op!r}")
+        right = self.expr()
+        compare = _COMPARE[op]
+        return lambda env: compare(left(env), right(env))
+
+
+def _as_series(value, env) -> pd.Series:
+    if isinstance(value, pd.Series):
+        return value
+    return pd.Series(value, index=env.frame.index)
+
+
+def compile_metric(expression: str):
+    """SQL metric expression → ([(sign, row_fn)], referenced columns)."""
+    parser = _Parser(expression)
+    return parser.parse(), parser.columns
+
+
+# =========================
+# SNAPSHOT
+# =========================
+def _to_columnar(values: list) -> pd.Series:
+    """psycopg2 values → a typed column (Decimal → float, date → datetime64)."""
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, Decimal):
+        return pd.Series([float(v) if v is not None else np.nan for v in values], dtype="float64")
+    if isinstance(sample, datetime):
+        return pd.to_datetime(pd.Series(values), utc=sample.tzinfo is not None)
+    if isinstance(sample, date):
+        return pd.to_datetime(pd.Series(values))
+    return pd.Series(values, dtype="object" if sample is None or isinstance(sample, str) else None)
+
+
+class _View:
+    """
+    One joined frame plus what queries over it reuse: dimension columns
+    factorized to integer codes, and evaluated measure arrays.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self._codes = {}
+        self._measures = {}
+        self._lock = threading.Lock()
+
+    def codes(self, column: str):
+        """(int64 codes, uniques) for a column; NULL is a value of its own."""
+        cached = self._codes.get(column)
+        if cached is None:
+            codes, uniques = pd.factorize(self.frame[column], use_na_sentinel=False)
+            cached = self._codes[column] = (codes.astype(np.int64), uniques)
+        return cached
+
+    def measures(self, key, compute):
+        cached = self._measures.get(key)
+        if cached is None:
+            with self._lock:
+                cached = self._measures.get(key)
+                if cached is None:
+                    cached = self._measures[key] = compute()
+        return cached
+
+
+class Snapshot:
+    """Every semantic model as a DataFrame, all read at one data_version."""
+
+    def __init__(self, frames: dict, version: int, loaded_at: float):
+        self.frames = frames
+        self.version = version
+        self.loaded_at = loaded_at
+        self.rows = sum(len(f) for f in frames.values())
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def view(self, key, build) -> _View:
+        view = self._views.get(key)
+        if view is None:
+            with self._lock:
+                view = self._views.get(key)
+                if view is None:
+                    view = self._views[key] = _View(build())
+        return view
+
+
+class _Env:
+    def __init__(self, frame, resolve, today):
+        self.frame = frame
+        self.resolve = resolve
+        self.today = today
+
+    def column(self, name):
+        return self.frame[self.resolve(name)]
+
+
+# =========================
+# BACKEND
+# =========================
+class ColumnarBackend:
+    """
+    In-process execution of intents over a snapshot of the semantic
+    models, as an alternative to running build_sql on Postgres.
+
+    A background thread re-snapshots whenever data_version moves (i.e.
+    after ingestion). choose() picks this backend per query only if the
+    snapshot satisfies the caller's freshness requirement and the metric
+    compiles; otherwise the query goes to Postgres as before.
+    """
+
+    def __init__(self, semantic, pool, refresh_seconds: float = COLUMNAR_REFRESH_SECONDS,
+                 snapshot_dir: str = COLUMNAR_SNAPSHOT_DIR):
+        self.semantic = semantic
+        self.pool = pool
+        self.refresh_seconds = refresh_seconds
+        self.snapshot_dir = snapshot_dir
+
+        self.table_models = {spec["table"]: name for name, spec in semantic.models.items()}
+        self.metrics = {}
+        self.unsupported = {}
+        for name, spec in semantic.metrics.items():
+            try:
+                self.metrics[name] = compile_metric(spec["expression"])
+            except UnsupportedExpression as e:
+                self.unsupported[name] = str(e)
+
+        self.snapshot: Optional[Snapshot] = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        self.served = 0
+        self.served_stale = 0
+        self.fallbacks = 0
+        self.refreshes = 0
+        self.last_refresh_ms = 0.0
+        self.last_error = None
+
+    # ----------------------
+    # SNAPSHOT
+    # ----------------------
+    def load(self) -> Snapshot:
+        """Read every model in one REPEATABLE READ transaction."""
+        started = time.perf_counter()
+        frames = {}
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SELECT version FROM data_version WHERE id = 1")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+
+            persisted = self._read_persisted(version)
+            if persisted is not None:
+                frames = persisted
+            else:
+                for model, spec in self.semantic.models.items():
+                    columns = spec.get("columns", [])
+                    cur.execute(f"SELECT {', '.join(columns)} FROM {spec['table']}")
+                    rows = cur.fetchall()
+                    frames[model] = pd.DataFrame({
+                        f"{model}.{c}": _to_columnar([r[i] for r in rows])
+                        for i, c in enumerate(columns)
+                    })
+                self._write_persisted(frames, version)
+
+        snapshot = Snapshot(frames, version, time.time())
+        with self._lock:
+            self.snapshot = snapshot
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        from app.core.cache import data_version
+        data_version.expire()
+        return snapshot
+
+    def _read_persisted(self, version: int) -> Optional[dict]:
+        if not self.snapshot_dir:
+            return None
+        meta_path = os.path.join(self.snapshot_dir, "snapshot.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != version:
+                return None
+            return {
+                model: pd.read_parquet(os.path.join(self.snapshot_dir, f"{model}.parquet"))
+                for model in self.semantic.models
+            }
+        except (OSError, ValueError):
+            return None
+
+    def _write_persisted(self, frames: dict, version: int):
+        """Parquet copy so other workers / restarts skip the table scans."""
+        if not self.snapshot_dir:
+            return
+        tmp = f"{self.snapshot_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for model, frame in frames.items():
+            frame.to_parquet(os.path.join(tmp, f"{model}.parquet"), index=False)
+        with open(os.path.join(tmp, "snapshot.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": version, "written_at": time.time()}, f)
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        os.replace(tmp, self.snapshot_dir)
+
+    # ----------------------
+    # BACKGROUND REFRESH
+    # ----------------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="columnar-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        from app.core.cache import data_version
+
+        while not self._stopping.is_set():
+            try:
+                if self.snapshot is None or self.snapshot.version != data_version.current():
+                    self.load()
+                self.last_error = None
+            except Exception as e:
+                # keep the old snapshot; choose() decides whether it is fresh enough
+                self.last_error = str(e)
+            self._stopping.wait(self.refresh_seconds)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ----------------------
+    # ROUTING
+    # ----------------------
+    def choose(self, intent: dict, max_staleness: float = None) -> Optional[Snapshot]:
+        """
+        The snapshot to answer `intent` from, or None for Postgres.
+        Fresh = taken at the current data_version; otherwise the snapshot
+        is only used if it is at most `max_staleness` seconds old.
+        """
+        from app.core.cache import data_version
+
+        snapshot = self.snapshot
+        if snapshot is None or intent.get("metric") not in self.metrics:
+            self.fallbacks += 1
+            return None
+
+        if snapshot.version == data_version.current():
+            return snapshot
+
+        if max_staleness is None:
+            max_staleness = COLUMNAR_MAX_STALENESS_SECONDS
+        if max_staleness and time.time() - snapshot.loaded_at <= max_staleness:
+            self.served_stale += 1
+            return snapshot
+
+        self.fallbacks += 1
+        return None
+
+    def is_fresh(self, snapshot: Snapshot) -> bool:
+        from app.core.cache import data_version
+
+        return snapshot.version == data_version.current()
+
+    # ----------------------
+    # EXECUTION
+    # ----------------------
+    def _frame(self, snapshot: Snapshot, base: str, models: list):
+        """Base model joined to `models` along the semantic layer's join paths."""
+        joined = {base}
+        self.semantic.join_clauses(base, models, joined)
+        key = (base, tuple(sorted(joined)))
+
+        def build():
+            frame = snapshot.frames[base]
+            paths = self.semantic.join_paths[base]
+            done = {base}
+            for model in models:
+                for hop_model, condition in paths[model]:
+                    if hop_model in done:
+                        continue
+                    left, right = (side.strip() for side in condition.split("="))
+                    hop_col, other_col = (
+                        (left, right) if left.split(".")[0] == self.semantic.models[hop_model]["table"]
+                        else (right, left)
+                    )
+                    frame = frame.merge(
+                        snapshot.frames[hop_model],
+                        how="inner",
+                        left_on=self._qualified(other_col),
+                        right_on=self._qualified(hop_col),
+                    )
+                    done.add(hop_model)
+            return frame
+
+        return snapshot.view(key, build), joined
+
+    def _qualified(self, table_column: str) -> str:
+        table, column = table_column.split(".")
+        return f"{self.table_models[table]}.{column}"
+
+    def _resolver(self, base: str, joined: set):
+        def resolve(name: str) -> str:
+            if "." in name:
+                return self._qualified(name)
+            if name in self.semantic.models[base].get("columns", []):
+                return f"{base}.{name}"
+            for model in joined:
+                if name in self.semantic.models[model].get("columns", []):
+                    return f"{model}.{name}"
+            raise KeyError(name)
+        return resolve
+
+    def _filter_mask(self, view: _View, filters: dict):
+        ops = {"eq": "=", "gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+        mask = None
+        for d, cond in filters.items():
+            column = self._qualified(self.semantic.dimension_columns[d])
+            for op, value in (cond if isinstance(cond, dict) else {"eq": cond}).items():
+                if op == "eq" and not self.semantic.is_date_dimension(d):
+                    # integer compare against the value's code
+                    codes, uniques = view.codes(column)
+                    code = uniques.get_indexer([value])[0]
+                    m = codes == code if code >= 0 else np.zeros(len(codes), dtype=bool)
+                else:
+                    values = view.frame[column].to_numpy()
+                    if self.semantic.is_date_dimension(d):
+                        value = np.datetime64(pd.Timestamp(value))
+                    m = _COMPARE[ops[op]](values, value)
+                mask = m if mask is None else mask & m
+        return mask
+
+    def execute(self, intent: dict, snapshot: Snapshot = None, max_rows: int = 0) -> list:
+        """
+        Rows shaped like run_sql(build_sql(intent)): metric first, then
+        dimensions. max_rows is the LIMIT sql_guard puts on the Postgres
+        query (0 = none), so both backends return the same number of groups.
+        """
+        snapshot = snapshot or self.snapshot
+        self.served += 1
+        metric = intent["metric"]
+        dims = list(intent.get("dimensions") or [])
+        filters = intent.get("filters") or {}
+        aggregates, _ = self.metrics[metric]
+
+        base = self.semantic.metrics[metric]["base_model"]
+        needed = list(self.semantic.metric_models[metric])
+        needed += [self.semantic.dimensions[d]["model"] for d in dims + [f for f in filters if f not in dims]]
+        view, joined = self._frame(snapshot, base, needed)
+
+        today = pd.Timestamp(date.today())
+
+        def compute():
+            # per aggregate: values with NULL as 0, and a non-NULL flag
+            env = _Env(view.frame, self._resolver(base, joined), today)
+            out = []
+            for _, row in aggregates:
+                values = _as_series(row(env), env).to_numpy(dtype="float64", na_value=np.nan)
+                present = ~np.isnan(values)
+                out.append((np.where(present, values, 0.0), present.astype("float64")))
+            return out
+
+        measures = view.measures((metric, today), compute)
+        signs = [sign for sign, _ in aggregates]
+
+        mask = self._filter_mask(view, filters)
+        if mask is not None:
+            measures = [(values[mask], present[mask]) for values, present in measures]
+
+        if not dims:
+            total = 0.0
+            for sign, (values, present) in zip(signs, measures):
+                if present.any():
+                    total += sign * values.sum()
+                else:
+                    # SQL: SUM over no non-NULL rows is NULL
+                    return [{metric: None}]
+            return [{metric: total}]
+
+        # one integer group id per row from the factorized dimension codes
+        dim_codes = [view.codes(self._qualified(self.semantic.dimension_columns[d])) for d in dims]
+        shape = tuple(len(uniques) for _, uniques in dim_codes)
+        group = np.ravel_multi_index(
+            [codes if mask is None else codes[mask] for codes, _ in dim_codes], shape
+        ) if len(dims) > 1 else (dim_codes[0][0] if mask is None else dim_codes[0][0][mask])
+
+        size = int(np.prod(shape))
+        if size <= max(1 << 16, 4 * len(group)):
+            rows_per_group = np.bincount(group, minlength=size)
+            groups = np.flatnonzero(rows_per_group)
+            inverse = None
+        else:
+            groups, inverse = np.unique(group, return_inverse=True)
+
+        result = np.zeros(len(groups))
+        for sign, (values, present) in zip(signs, measures):
+            if inverse is None:
+                sums = np.bincount(group, weights=values, minlength=size)[groups]
+                counts = np.bincount(group, weights=present, minlength=size)[groups]
+            else:
+                sums = np.bincount(inverse, weights=values, minlength=len(groups))
+                counts = np.bincount(inverse, weights=present, minlength=len(groups))
+            result += sign * np.where(counts > 0, sums, np.nan)
+
+        if max_rows:
+            groups, result = groups[:max_rows], result[:max_rows]
+        group_codes = np.unravel_index(groups, shape) if len(dims) > 1 else (groups,)
+        out_columns = []
+        for d, (_, uniques), codes in zip(dims, dim_codes, group_codes):
+            values = uniques.take(codes)
+            if self.semantic.is_date_dimension(d):
+                out_columns.append([None if pd.isna(v) else v.date() for v in values])
+            else:
+                out_columns.append([None if pd.isna(v) else v for v in values])
+
+        rows = []
+        for i, value in enumerate(result.tolist()):
+            row = {metric: None if value != value else value}
+            for d, col in zip(dims, out_columns):
+                row[d] = col[i]
+            rows.append(row)
+        return rows
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "enabled": snapshot is not None,
+            "snapshot_version": snapshot.version if snapshot else None,
+            "snapshot_age_seconds": round(time.time() - snapshot.loaded_at, 1) if snapshot else None,
+            "snapshot_rows": snapshot.rows if snapshot else 0,
+            "served": self.served,
+            "served_stale": self.served_stale,
+            "fallbacks": self.fallbacks,
+            "refreshes": self.refreshes,
+            "last_refresh_ms": self.last_refresh_ms,
+            "unsupported_metrics": self.unsupported,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,340 @@
+# app/core/db_pool.py
+
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+# =========================
+# ENV
+# =========================
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_CHECKOUT_TIMEOUT = float(os.getenv("DB_CHECKOUT_TIMEOUT", "10"))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+DB_MAX_IDLE = float(os.getenv("DB_MAX_IDLE", "300"))
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+# =========================
+# SYNC POOL
+# =========================
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool.
+
+    Connections are created lazily up to max_size, health-checked
+    when they have been idle for a while and carry a session-level
+    statement_timeout. Callers block (up to checkout_timeout) when
+    the pool is exhausted instead of failing immediately.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS,
+        checkout_timeout: float = DB_CHECKOUT_TIMEOUT,
+        health_check_interval: float = DB_HEALTH_CHECK_INTERVAL,
+        max_idle: float = DB_MAX_IDLE,
+    ):
+        if not dsn:
+            raise RuntimeError("DATABASE_URL not set")
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_timeout_ms = statement_timeout_ms
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle = max_idle
+
+        self._idle = []  # [(conn, last_used_monotonic)]
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "health_checks": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+            "checkout_total_ms": 0.0,
+            "checkout_max_ms": 0.0,
+        }
+
+    # ----------------------
+    # CONNECTION LIFECYCLE
+    # ----------------------
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        # SET instead of the "options" startup parameter: PgBouncer-style
+        # poolers (Neon "-pooler" hosts) reject unknown startup params.
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = %s", (self.statement_timeout_ms,))
+        conn.commit()
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        self._stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def open(self):
+        """Eagerly create min_size connections (used by warm-up)."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    # ----------------------
+    # CHECKOUT / CHECKIN
+    # ----------------------
+    def getconn(self, timeout: Optional[float] = None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            last_used = None
+            must_create = False
+
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        must_create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {timeout}s"
+                        )
+                    self._cond.wait(remaining)
+
+            waited = time.monotonic() - started
+
+            if must_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            else:
+                idle_for = time.monotonic() - last_used
+                stale = self.max_idle and idle_for > self.max_idle
+                if stale or conn.closed or (
+                    idle_for > self.health_check_interval and not self._is_healthy(conn)
+                ):
+                    self._discard(conn)
+                    continue
+
+            self._record_checkout(waited, time.monotonic() - started)
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Borrow a connection for one unit of work.
+        Commits on success, rolls back on error, always returns it.
+        """
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken or conn.closed)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def _record_checkout(self, waited: float, total: float):
+        waited_ms = waited * 1000
+        total_ms = total * 1000
+        with self._cond:
+            s = self._stats
+            s["checkouts"] += 1
+            s["wait_total_ms"] += waited_ms
+            s["wait_max_ms"] = max(s["wait_max_ms"], waited_ms)
+            s["checkout_total_ms"] += total_ms
+            s["checkout_max_ms"] = max(s["checkout_max_ms"], total_ms)
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            s["size"] = self._size
+            s["idle"] = len(self._idle)
+            s["in_use"] = self._size - len(self._idle)
+            s["min_size"] = self.min_size
+            s["max_size"] = self.max_size
+        n = s["checkouts"] or 1
+        s["wait_avg_ms"] = s["wait_total_ms"] / n
+        s["checkout_avg_ms"] = s["checkout_total_ms"] / n
+        return s
+
+
+# =========================
+# ASYNC POOL
+# =========================
+class AsyncConnectionPool:
+    """
+    asyncio facade over ConnectionPool.
+
+    psycopg2 is blocking, so every unit of work runs in the default
+    executor; a semaphore sized to max_size keeps coroutines queued on
+    the event loop instead of piling up threads waiting on the pool.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._sem = asyncio.Semaphore(pool.max_size)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(conn, *args, **kwargs) on a pooled connection."""
+        def work():
+            with self.pool.connection() as conn:
+                return fn(conn, *args, **kwargs)
+
+        async with self._sem:
+            return await asyncio.get_running_loop().run_in_executor(None, work)
+
+    async def fetch_all(self, sql: str, params=None):
+        return await self.run(_fetch_all, sql, params)
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._sem:
+            loop = asyncio.get_running_loop()
+            conn = await loop.run_in_executor(None, self.pool.getconn)
+            try:
+                yield conn
+                await loop.run_in_executor(None, conn.commit)
+            finally:
+                # putconn rolls back anything left open by a failed body
+                await loop.run_in_executor(None, self.pool.putconn, conn)
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+
+def _fetch_all(conn, sql: str, params=None):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in rows]
+
+
+# =========================
+# SHARED REGISTRY
+# =========================
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: Optional[str] = None, **kwargs) -> ConnectionPool:
+    """
+    One pool per DSN per process, shared by the chat API,
+    the tally connector and the ingestion backend.
+    """
+    dsn = dsn or os.getenv("DATABASE_URL")
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(dsn, **kwargs)
+            _pools[dsn] = pool
+        return pool
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
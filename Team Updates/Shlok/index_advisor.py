@@ -0,0 +1,518 @@
+# app/core/index_advisor.py
+#
+# Index proposals for the tables behind the semantic layer, from the
+# joins, filters and metric windows of an observed (or synthesized)
+# intent workload, with DDL and a before/after benchmark per index.
+#
+#   python -m app.core.index_advisor propose [--log queries.jsonl]
+#   python -m app.core.index_advisor bench   [--log queries.jsonl] --out indexes.json
+#   python -m app.core.index_advisor ddl     [--report indexes.json]
+#
+# The log is what main.py writes to QUERY_LOG_PATH (one executed intent
+# per line). `bench` runs against a local Postgres (see app.core.bench
+# seed): each index is built alone, the queries it targets are timed
+# with EXPLAIN ANALYZE before and after, and it is dropped again unless
+# --keep. `ddl --report` emits only the indexes that paid for themselves.
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import statistics
+from datetime import date, datetime, timedelta, timezone
+
+from app.core.semantic import SemanticLayer
+
+# =========================
+# ENV
+# =========================
+ADVISOR_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL", "")
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEMANTIC_PATH = os.path.join(os.path.dirname(CORE_DIR), "semantic.json")
+
+RANGE_OPS = ("gte", "gt", "lte", "lt")
+SQL_OPS = {"eq": "=", "gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+
+_LITERAL_PREDICATE_RE = re.compile(r"\b([a-z_][a-z0-9_]*)\s*=\s*'([^']*)'", re.IGNORECASE)
+_IDENT_RE = re.compile(r"'[^']*'|\b([a-z_][a-z0-9_]*)\b", re.IGNORECASE)
+
+
+# =========================
+# WORKLOAD
+# =========================
+def _shape(intent: dict) -> tuple:
+    """What an index cares about: metric, dimensions, filtered columns and operators."""
+    filters = intent.get("filters") or {}
+    return (
+        intent["metric"],
+        tuple(sorted(intent.get("dimensions") or [])),
+        tuple(sorted(
+            (d, tuple(sorted(cond)) if isinstance(cond, dict) else ("eq",))
+            for d, cond in filters.items()
+        )),
+    )
+
+
+def load_log(paths: list) -> list:
+    """[(intent, count)] per query shape; cache and columnar answers never reached Postgres."""
+    shapes = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record.get("backend", "postgres") != "postgres":
+                    continue
+                intent = record["intent"]
+                entry = shapes.setdefault(_shape(intent), [intent, 0])
+                entry[1] += 1
+    return [(intent, count) for intent, count in shapes.values()]
+
+
+def synthesize(semantic: SemanticLayer) -> list:
+    """
+    Without a log: every metric, alone and by each dimension, unfiltered,
+    over the last 90 days and for one customer / item. Filter values are
+    placeholders until bench() fills them from the data.
+    """
+    since = (date.today() - timedelta(days=90)).isoformat()
+    filter_sets = [{}]
+    for d in semantic.dimensions:
+        filter_sets.append({d: {"gte": since}} if semantic.is_date_dimension(d) else {d: None})
+
+    workload = []
+    for metric in semantic.metrics:
+        for dimensions in [[]] + [[d] for d in semantic.dimensions]:
+            for filters in filter_sets:
+                intent = {"metric": metric, "dimensions": dimensions, "filters": filters}
+                try:
+                    semantic.validate({**intent, "filters": {
+                        d: (c if c is not None else "x") for d, c in filters.items()}})
+                except (ValueError, KeyError):
+                    continue
+                workload.append((intent, 1))
+    return workload
+
+
+# =========================
+# PROPOSALS
+# =========================
+def _index_name(table: str, columns: list, suffix: str) -> str:
+    name = f"{table}_{'_'.join(columns)}_{suffix}"
+    if len(name) > 63:
+        name = f"{name[:54]}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+    return name
+
+
+def _column_owner(semantic: SemanticLayer, column: str, models: list):
+    for model in models:
+        if column in semantic.models[model].get("columns", []):
+            return model
+    return None
+
+
+def _expression_columns(expression: str) -> list:
+    return [m.group(1) for m in _IDENT_RE.finditer(expression) if m.group(1)]
+
+
+class IndexAdvisor:
+    """Turns a workload of intents into weighted index proposals."""
+
+    def __init__(self, semantic: SemanticLayer):
+        self.semantic = semantic
+        self.proposals = {}
+
+    def _propose(self, table: str, kind: str, columns: list, include: list = (), where: str = None,
+                 reason: str = "", intent: dict = None, weight: int = 1):
+        """Same table, method, key and predicate → one index whose INCLUDE covers every query."""
+        include = [c for c in include if c not in columns]
+        if kind == "covering" and not include:
+            kind = "btree"
+        primary_key = self.semantic.models[_model_of_table(self.semantic, table)].get("primary_key")
+        if kind == "btree" and columns == [primary_key]:
+            return
+
+        key = (table, kind, tuple(columns), where)
+        proposal = self.proposals.get(key)
+        if proposal is None:
+            suffix = {"btree": "idx", "covering": "cov_idx", "brin": "brin_idx", "partial": "part_idx"}[kind]
+            proposal = self.proposals[key] = {
+                "name": _index_name(table, list(columns), suffix),
+                "table": table,
+                "kind": kind,
+                "columns": list(columns),
+                "include": [],
+                "where": where,
+                "weight": 0,
+                "reasons": {},
+                "queries": {},
+            }
+        proposal["include"] = sorted(set(proposal["include"]) | set(include))
+        proposal["weight"] += weight
+        proposal["reasons"][reason] = proposal["reasons"].get(reason, 0) + weight
+        if intent is not None:
+            proposal["queries"].setdefault(_shape(intent), [intent, 0])[1] += weight
+
+    def analyze(self, workload: list) -> list:
+        for intent, weight in workload:
+            self._analyze_intent(intent, weight)
+        return self.ranked()
+
+    def _analyze_intent(self, intent: dict, weight: int):
+        semantic = self.semantic
+        spec = semantic.metrics[intent["metric"]]
+        base = spec["base_model"]
+        filters = intent.get("filters") or {}
+        dimensions = intent.get("dimensions") or []
+
+        # models on the join path, as compile_query builds it
+        needed = list(semantic.metric_models[intent["metric"]])
+        needed += [semantic.dimensions[d]["model"] for d in list(dimensions) + list(filters)]
+        hops = []
+        for model in needed:
+            for hop in semantic.join_paths[base][model]:
+                if hop not in hops:
+                    hops.append(hop)
+        models = [base] + [m for m, _ in hops]
+
+        # columns the query reads, per model
+        reads = {m: set() for m in models}
+        for column in _expression_columns(spec["expression"]):
+            owner = _column_owner(semantic, column, models)
+            if owner:
+                reads[owner].add(column)
+        for d in dimensions:
+            reads[semantic.dimensions[d]["model"]].add(semantic.dimensions[d]["column"])
+
+        # 1. join keys: the many side of every hop
+        for model, condition in hops:
+            many, one = (side.strip().split(".") for side in condition.split("="))
+            reads.setdefault(_model_of_table(semantic, many[0]), set()).add(many[1])
+            reads.setdefault(_model_of_table(semantic, one[0]), set()).add(one[1])
+            if many[1] != semantic.models[_model_of_table(semantic, many[0])].get("primary_key"):
+                self._propose(many[0], "btree", [many[1]], reason=f"join {many[0]}.{many[1]} = {one[0]}.{one[1]}",
+                              intent=intent, weight=weight)
+
+        # 2. filters: equality and range columns per model, covering what the query reads
+        by_model = {}
+        for d, cond in filters.items():
+            dim = semantic.dimensions[d]
+            ops = tuple(cond) if isinstance(cond, dict) else ("eq",)
+            kind = "range" if any(op in RANGE_OPS for op in ops) else "eq"
+            by_model.setdefault(dim["model"], {"eq": [], "range": []})[kind].append(dim["column"])
+
+        for model, cols in by_model.items():
+            table = semantic.models[model]["table"]
+            key = sorted(cols["eq"]) + sorted(cols["range"])
+            for column in cols["range"]:
+                self._propose(table, "brin", [column], reason=f"range filter on {table}.{column}",
+                              intent=intent, weight=weight)
+            self._propose(table, "covering", key, include=sorted(reads.get(model, set()) - set(key)),
+                          reason=f"filter on {table}({', '.join(key)}), reading {intent['metric']} inputs",
+                          intent=intent, weight=weight)
+
+        # Only predicates compile_query puts in the WHERE can use an index;
+        # a CASE inside SUM() (the growth periods, current_stock's
+        # movement types) is evaluated per row after the scan.
+        bounds = semantic.compile_query(intent["metric"], tuple(dimensions), tuple(filters))["where"]
+
+        # 3. the metric's window bound on its date dimension
+        window = spec.get("window")
+        if window and bounds:
+            dim = semantic.dimensions[window["dimension"]]
+            table = semantic.models[dim["model"]]["table"]
+            self._propose(table, "brin", [dim["column"]],
+                          reason=f"{intent['metric']} reads the last {window['days']} days of {table}.{dim['column']}",
+                          intent=intent, weight=weight)
+
+        # 4. constant predicates in the WHERE → partial index
+        literals = {}
+        for column, value in _LITERAL_PREDICATE_RE.findall(" AND ".join(bounds)):
+            literals.setdefault(column, []).append(value)
+        for column, values in literals.items():
+            table = semantic.models[base]["table"]
+            joins = [c for c in sorted(reads[base]) if c != column and c not in
+                     _expression_columns(spec["expression"])]
+            key = joins or [column]
+            where = f"{column} IN ({', '.join(_literal(v) for v in dict.fromkeys(values))})"
+            self._propose(table, "partial", key, include=sorted(reads[base] - set(key)), where=where,
+                          reason=f"{intent['metric']} only counts rows where {where}",
+                          intent=intent, weight=weight)
+
+    def ranked(self) -> list:
+        return sorted(self.proposals.values(), key=lambda p: (-p["weight"], p["name"]))
+
+
+def _model_of_table(semantic: SemanticLayer, table: str) -> str:
+    return next(m for m, spec in semantic.models.items() if spec["table"] == table)
+
+
+def _literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# =========================
+# DDL
+# =========================
+def ddl(proposal: dict, concurrently: bool = True) -> str:
+    method = " USING brin" if proposal["kind"] == "brin" else ""
+    statement = (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {proposal['name']} "
+        f"ON {proposal['table']}{method} ({', '.join(proposal['columns'])})"
+    )
+    if proposal["include"]:
+        statement += f" INCLUDE ({', '.join(proposal['include'])})"
+    if proposal["where"]:
+        statement += f" WHERE {proposal['where']}"
+    return statement
+
+
+def existing_indexes(cur, tables: list) -> dict:
+    """table → [(method, key columns, include columns, has predicate)]."""
+    cur.execute("""
+        SELECT t.relname, am.amname, i.indnkeyatts,
+               array_agg(a.attname ORDER BY k.ord), i.indpred IS NOT NULL
+        FROM pg_index i
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE t.relname = ANY(%s)
+        GROUP BY t.relname, c.relname, am.amname, i.indnkeyatts, i.indpred
+    """, (list(tables),))
+    found = {}
+    for table, method, n_keys, columns, partial in cur.fetchall():
+        found.setdefault(table, []).append((method, columns[:n_keys], columns[n_keys:], partial))
+    return found
+
+
+def is_covered(proposal: dict, indexes: list) -> bool:
+    """An existing index already serves this proposal."""
+    method = "brin" if proposal["kind"] == "brin" else "btree"
+    for existing_method, keys, include, partial in indexes:
+        if existing_method != method or (partial and proposal["kind"] != "partial"):
+            continue
+        if keys[:len(proposal["columns"])] == proposal["columns"] and \
+                set(proposal["include"]) <= set(keys) | set(include) and not proposal["where"]:
+            return True
+    return False
+
+
+# =========================
+# BENCHMARK
+# =========================
+def query_sql(semantic: SemanticLayer, intent: dict) -> str:
+    """Raw-table SQL for an intent (rollups bypassed: they are what the indexes compete with)."""
+    filters = intent.get("filters") or {}
+    template = semantic.compile_query(intent["metric"], tuple(intent["dimensions"]), tuple(filters))
+    parts = [template["head"]]
+    where = list(template["where"])
+    for d, cond in filters.items():
+        for op, value in (cond if isinstance(cond, dict) else {"eq": cond}).items():
+            where.append(f"{semantic.dimension_columns[d]} {SQL_OPS[op]} {_literal(value)}")
+    if where:
+        parts.append(f"WHERE {' AND '.join(where)}")
+    if template["group_by"]:
+        parts.append(template["group_by"])
+    return " ".join(parts)
+
+
+def _fill_placeholders(cur, semantic: SemanticLayer, intent: dict) -> dict:
+    """Synthesized equality filters get the most common value of their column."""
+    filters = {}
+    for d, cond in (intent.get("filters") or {}).items():
+        if cond is None:
+            dim = semantic.dimensions[d]
+            table = semantic.models[dim["model"]]["table"]
+            cur.execute(f"SELECT {dim['column']} FROM {table} GROUP BY 1 ORDER BY count(*) DESC LIMIT 1")
+            row = cur.fetchone()
+            cond = row[0] if row else ""
+        filters[d] = cond
+    return {**intent, "filters": filters}
+
+
+def _uses_index(plan: dict, name: str) -> bool:
+    if plan.get("Index Name") == name:
+        return True
+    return any(_uses_index(child, name) for child in plan.get("Plans", []))
+
+
+def explain_analyze(cur, sql: str, runs: int, index_name: str = None) -> dict:
+    """Median server-side execution time over `runs` (after one warm-up) and whether the index was used."""
+    times, used = [], False
+    for i in range(runs + 1):
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql)
+        plan = cur.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        if i:
+            times.append(plan[0]["Execution Time"])
+        if index_name:
+            used = used or _uses_index(plan[0]["Plan"], index_name)
+    return {"ms": statistics.median(times), "used": used}
+
+
+def bench(dsn: str, semantic: SemanticLayer, proposals: list, runs: int = 5,
+          min_speedup: float = 1.1, keep: bool = False) -> list:
+    """
+    One index at a time: time its queries, build it, ANALYZE, time them
+    again. Verdict "keep" needs the planner to use it and a weighted
+    speedup of at least `min_speedup`.
+    """
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    results = []
+    try:
+        with conn.cursor() as cur:
+            existing = existing_indexes(cur, {p["table"] for p in proposals})
+            for proposal in proposals:
+                result = {k: v for k, v in proposal.items() if k not in ("queries", "reasons")}
+                result["reasons"] = [f"{r} ({n})" for r, n in proposal["reasons"].items()]
+                result["ddl"] = ddl(proposal, concurrently=False)
+
+                if is_covered(proposal, existing.get(proposal["table"], [])):
+                    results.append({**result, "verdict": "exists"})
+                    print(f"= {proposal['name']}: already covered by an existing index")
+                    continue
+
+                queries = []
+                for intent, count in proposal["queries"].values():
+                    intent = _fill_placeholders(cur, semantic, intent)
+                    queries.append({"intent": intent, "sql": query_sql(semantic, intent), "weight": count})
+
+                for q in queries:
+                    q["before_ms"] = explain_analyze(cur, q["sql"], runs)["ms"]
+
+                started = time.perf_counter()
+                cur.execute(result["ddl"])
+                result["build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                cur.execute(f"ANALYZE {proposal['table']}")
+                cur.execute("SELECT pg_relation_size(%s::regclass)", (proposal["name"],))
+                result["size_bytes"] = cur.fetchone()[0]
+
+                try:
+                    for q in queries:
+                        after = explain_analyze(cur, q["sql"], runs, proposal["name"])
+                        q["after_ms"], q["used"] = after["ms"], after["used"]
+                        q["speedup"] = round(q["before_ms"] / after["ms"], 3) if after["ms"] else None
+                finally:
+                    verdict = _verdict(queries, min_speedup)
+                    if not (keep and verdict == "keep"):
+                        cur.execute(f"DROP INDEX IF EXISTS {proposal['name']}")
+
+                total_weight = sum(q["weight"] for q in queries)
+                result.update(
+                    queries=queries,
+                    used=any(q["used"] for q in queries),
+                    speedup=round(_weighted_geomean(queries), 3) if queries else None,
+                    saved_ms_per_run=round(sum((q["before_ms"] - q["after_ms"]) * q["weight"]
+                                               for q in queries) / (total_weight or 1), 3),
+                    verdict=verdict,
+                )
+                results.append(result)
+                print(f"{'✅' if verdict == 'keep' else '❌'} {proposal['name']}: "
+                      f"{result['speedup']}x over {len(queries)} queries, "
+                      f"{result['size_bytes'] // 1024} kB, used={result['used']}")
+    finally:
+        conn.close()
+    return results
+
+
+def _weighted_geomean(queries: list) -> float:
+    total = sum(q["weight"] for q in queries) or 1
+    return math.exp(sum(math.log(q["speedup"] or 1) * q["weight"] for q in queries) / total)
+
+
+def _verdict(queries: list, min_speedup: float) -> str:
+    if not queries or not all("speedup" in q for q in queries):
+        return "error"
+    if not any(q["used"] for q in queries):
+        return "unused"
+    return "keep" if _weighted_geomean(queries) >= min_speedup else "no_gain"
+
+
+# =========================
+# CLI
+# =========================
+def _workload(args, semantic: SemanticLayer) -> list:
+    if args.log:
+        workload = load_log(args.log)
+        print(f"Workload: {sum(n for _, n in workload)} logged queries, {len(workload)} shapes", file=sys.stderr)
+    else:
+        workload = synthesize(semantic)
+        print(f"Workload: {len(workload)} synthesized query shapes (no --log)", file=sys.stderr)
+    return workload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.core.index_advisor",
+                                     description="Index proposals from the semantic layer and the query log")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_propose = sub.add_parser("propose", help="list proposed indexes with their reasons")
+    p_ddl = sub.add_parser("ddl", help="print CREATE INDEX statements")
+    p_ddl.add_argument("--report", help="only indexes a bench report marked 'keep'")
+    p_ddl.add_argument("--no-concurrently", action="store_true")
+    p_bench = sub.add_parser("bench", help="measure every proposal against a local Postgres")
+    p_bench.add_argument("--dsn", default=ADVISOR_DATABASE_URL)
+    p_bench.add_argument("--allow-remote", action="store_true")
+    p_bench.add_argument("--runs", type=int, default=5)
+    p_bench.add_argument("--min-speedup", type=float, default=1.1)
+    p_bench.add_argument("--keep", action="store_true", help="leave indexes with verdict 'keep' in place")
+    p_bench.add_argument("--out", help="write the JSON report here")
+    for p in (p_propose, p_ddl, p_bench):
+        p.add_argument("--log", action="append", help="QUERY_LOG_PATH file(s); default: synthesized workload")
+        p.add_argument("--semantic", default=SEMANTIC_PATH)
+    args = parser.parse_args(argv)
+
+    semantic = SemanticLayer(args.semantic)
+
+    if args.command == "ddl" and args.report:
+        with open(args.report, "r", encoding="utf-8") as f:
+            proposals = [p for p in json.load(f)["indexes"] if p["verdict"] == "keep"]
+    else:
+        proposals = IndexAdvisor(semantic).analyze(_workload(args, semantic))
+
+    if args.command == "propose":
+        for p in proposals:
+            print(f"{p['weight']:>6}  {ddl(p, concurrently=False)}")
+            for reason, n in sorted(p["reasons"].items(), key=lambda r: -r[1]):
+                print(f"        - {reason} ({n})")
+
+    elif args.command == "ddl":
+        for p in proposals:
+            print(ddl(p, concurrently=not args.no_concurrently) + ";")
+
+    elif args.command == "bench":
+        from app.core.bench import _require_local
+        _require_local(args.dsn, args.allow_remote)
+        results = bench(args.dsn, semantic, proposals, runs=args.runs,
+                        min_speedup=args.min_speedup, keep=args.keep)
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "runs": args.runs,
+                "min_speedup": args.min_speedup,
+                "log": args.log,
+            },
+            "indexes": results,
+        }
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, default=str)
+            print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# app/core/intent_matcher.py
+
+import os
+import re
+import time
+import calendar
+import difflib
+import threading
+from datetime import date, timedelta
+from typing import Optional
+
+# =========================
+# ENV
+# =========================
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.75"))
+
+DATE_DIMENSION = "voucher_date"
+
+_WORD_RE = re.compile(r"[a-z0-9+]+")
+
+# Words that carry no metric/dimension meaning; they neither help nor hurt.
+# Not "number", "many", "value" or "amount": "number of sales" asks for a
+# count, which no metric here answers, so they must cost confidence.
+_FILLER = {
+    "a", "an", "the", "of", "for", "in", "on", "by", "to", "per", "each", "all",
+    "me", "my", "our", "we", "i", "us", "is", "are", "was", "were", "be", "been",
+    "show", "give", "get", "list", "display", "tell", "find", "what", "whats",
+    "how", "much", "please", "wise", "and", "with", "from", "can", "you",
+    "total", "overall", "report", "breakdown", "split", "group", "grouped",
+    "across", "every", "do", "did", "does", "have", "has", "had", "there", "it",
+    "which", "who", "where", "current", "till", "about", "now", "so", "far",
+}
+
+_MONTHS = {}
+for _i in range(1, 13):
+    _MONTHS[calendar.month_name[_i].lower()] = _i
+    _MONTHS[calendar.month_abbr[_i].lower()] = _i
+_MONTHS["sept"] = 9
+# month names that are also everyday words ("may I see ..."); only a date
+# next to them makes them a month
+_AMBIGUOUS_MONTHS = {"may"}
+_MONTH_PREPOSITIONS = {"in", "for", "during", "since", "of", "from", "till", "until"}
+
+
+def _stem(word: str) -> str:
+    """Plural → singular, just enough for synonym matching."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("xes", "ches", "shes", "sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _tokens(text: str) -> list:
+    return [_stem(w) for w in _WORD_RE.findall(text.lower())]
+
+
+# =========================
+# DATE PHRASES
+# =========================
+def _month_range(year: int, month: int):
+    start = date(year, month, 1)
+    end = date(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def parse_date_phrase(tokens: list, today: date):
+    """
+    Find one date phrase in the token list.
+    Returns ((gte, lt), consumed_token_indexes) or (None, set()).
+    """
+    n = len(tokens)
+    for i, tok in enumerate(tokens):
+        nxt = tokens[i + 1] if i + 1 < n else ""
+        nxt2 = tokens[i + 2] if i + 2 < n else ""
+
+        if tok == "today":
+            return (today, today + timedelta(days=1)), {i}
+        if tok == "yesterday":
+            return (today - timedelta(days=1), today), {i}
+
+        if tok in ("last", "past", "previous") or (tok == "this" and nxt):
+            # last N days / weeks / months
+            if nxt.isdigit() and nxt2 in ("day", "week", "month"):
+                k = int(nxt)
+                if nxt2 == "day":
+                    start = today - timedelta(days=k - 1)
+                elif nxt2 == "week":
+                    start = today - timedelta(weeks=k)
+                else:
+                    m = today.month - k
+                    start = date(today.year + (m - 1) // 12, (m - 1) % 12 + 1, 1)
+                return (start, today + timedelta(days=1)), {i, i + 1, i + 2}
+
+            if nxt == "week":
+                monday = today - timedelta(days=today.weekday())
+                if tok == "this":
+                    return (monday, today + timedelta(days=1)), {i, i + 1}
+                return (monday - timedelta(weeks=1), monday), {i, i + 1}
+
+            if nxt == "month":
+                if tok == "this":
+                    return _month_range(today.year, today.month), {i, i + 1}
+                first = today.replace(day=1)
+                prev = first - timedelta(days=1)
+                return _month_range(prev.year, prev.month), {i, i + 1}
+
+            if nxt == "year":
+                year = today.year if tok == "this" else today.year - 1
+                return (date(year, 1, 1), date(year + 1, 1, 1)), {i, i + 1}
+
+        if tok in _AMBIGUOUS_MONTHS and not (
+                nxt.isdigit() or (i and (tokens[i - 1] in _MONTH_PREPOSITIONS or tokens[i - 1].isdigit()))):
+            continue
+
+        if tok in _MONTHS:
+            month = _MONTHS[tok]
+            if nxt.isdigit() and len(nxt) == 4:
+                return _month_range(int(nxt), month), {i, i + 1}
+            # bare month name → its most recent occurrence
+            year = today.year if month <= today.month else today.year - 1
+            return _month_range(year, month), {i}
+
+        if tok.isdigit() and len(tok) == 4 and 2000 <= int(tok) <= 2100:
+            year = int(tok)
+            return (date(year, 1, 1), date(year + 1, 1, 1)), {i}
+
+    return None, set()
+
+
+# =========================
+# MATCHER
+# =========================
+class IntentMatcher:
+    """
+    Deterministic question → intent resolver built from the synonyms in
+    semantic_layer.json. Returns None when it is not confident, in which
+    case the caller falls back to the LLM.
+    """
+
+    def __init__(self, semantic, min_confidence: float = FAST_PATH_MIN_CONFIDENCE):
+        self.semantic = semantic
+        self.min_confidence = min_confidence
+
+        # phrase (tuple of stemmed tokens) -> ("metric" | "dimension", name)
+        self.phrases = {}
+        for kind, items in (("metric", semantic.metrics), ("dimension", semantic.dimensions)):
+            for name, spec in items.items():
+                for phrase in [name.replace("_", " ")] + spec.get("synonyms", []):
+                    self.phrases.setdefault(tuple(_tokens(phrase)), (kind, name))
+
+        self.max_phrase_len = max(len(p) for p in self.phrases)
+        self.vocabulary = sorted({t for p in self.phrases for t in p})
+
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.total_us = 0.0
+
+    # ----------------------
+    # MATCH
+    # ----------------------
+    def match(self, question: str, history: Optional[list] = None, today: Optional[date] = None) -> Optional[dict]:
+        started = time.perf_counter()
+        intent = self._match(question, history or [], today or date.today())
+        elapsed_us = (time.perf_counter() - started) * 1e6
+
+        with self._lock:
+            self.attempts += 1
+            self.total_us += elapsed_us
+            if intent is not None:
+                self.hits += 1
+        return intent
+
+    def _match(self, question: str, history: list, today: date) -> Optional[dict]:
+        tokens = _tokens(question)
+        if not tokens:
+            return None
+
+        date_range, used = parse_date_phrase(tokens, today)
+
+        metrics, dimensions = [], []
+        fuzzy_hits = 0
+        i = 0
+        while i < len(tokens):
+            if i in used:
+                i += 1
+                continue
+
+            found = None
+            for size in range(min(self.max_phrase_len, len(tokens) - i), 0, -1):
+                span = tuple(tokens[i:i + size])
+                if span in self.phrases:
+                    found = (self.phrases[span], size)
+                    break
+
+            if found is None and tokens[i] not in _FILLER and len(tokens[i]) > 3:
+                close = difflib.get_close_matches(tokens[i], self.vocabulary, n=1, cutoff=0.85)
+                if close and (close[0],) in self.phrases:
+                    found = (self.phrases[(close[0],)], 1)
+                    fuzzy_hits += 1
+
+            if found is None:
+                i += 1
+                continue
+
+            (kind, name), size = found
+            target = metrics if kind == "metric" else dimensions
+            if name not in target:
+                target.append(name)
+            used.update(range(i, i + size))
+            i += size
+
+        if len(set(metrics)) > 1:
+            return None  # ambiguous, let the LLM decide
+
+        if not metrics:
+            # "what about by item?" → keep the metric from the last turn
+            last = history[-1].get("intent") if history else None
+            if not isinstance(last, dict) or not last.get("metric"):
+                return None
+            metrics = [last["metric"]]
+
+        # a number no phrase consumed ("on 5 december", "top 10") narrows
+        # the question in a way the intent would silently drop
+        unknown = [t for k, t in enumerate(tokens) if k not in used and t not in _FILLER]
+        content = len(unknown) + len(used)
+        confidence = (len(used) - 0.5 * fuzzy_hits) / content if content else 0.0
+        if confidence < self.min_confidence:
+            return None
+
+        filters = {}
+        if date_range is not None:
+            gte, lt = date_range
+            filters[DATE_DIMENSION] = {"gte": gte.isoformat(), "lt": lt.isoformat()}
+
+        intent = {"metric": metrics[0], "dimensions": dimensions, "filters": filters}
+        try:
+            self.semantic.validate(intent)
+        except ValueError:
+            return None
+        return intent
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.attempts if self.attempts else 0.0,
+                "avg_us": self.total_us / self.attempts if self.attempts else 0.0,
+            }
@@ -0,0 +1,210 @@
+# app/core/llm_client.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Optional
+
+import httpx
+
+# =========================
+# ENV
+# =========================
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "4"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+# =========================
+# CLIENT
+# =========================
+class LLMClient:
+    """
+    OpenAI-compatible chat completions client (Groq, or mock_llm.py).
+
+    - one keep-alive AsyncClient per event loop
+    - at most max_concurrency requests in flight upstream
+    - connect/read timeouts, retries with full-jitter backoff
+    - identical concurrent payloads share a single upstream call
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        model: str,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._inflight = {}
+
+        self._stats = {
+            "requests": 0,
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failures": 0,
+            "upstream_ms_total": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    # ----------------------
+    # SESSION
+    # ----------------------
+    def _session(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ----------------------
+    # PUBLIC API
+    # ----------------------
+    async def chat(self, messages: list, temperature: float = 0, **extra) -> str:
+        """Return the assistant message content for a chat completion."""
+        content, _ = await self.chat_with_usage(messages, temperature, **extra)
+        return content
+
+    async def chat_with_usage(self, messages: list, temperature: float = 0, **extra) -> tuple:
+        """(content, usage) where usage holds prompt_tokens / completion_tokens."""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            **extra,
+        }
+        data = await self.complete(payload)
+        usage = data.get("usage") or {}
+        return data["choices"][0]["message"]["content"].strip(), {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+
+    async def complete(self, payload: dict) -> dict:
+        """
+        POST payload to the completions endpoint.
+        Concurrent callers with an identical payload await the same call.
+        """
+        self._session()
+        self._stats["requests"] += 1
+
+        key = hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode()
+        ).hexdigest()
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._call_with_retry(payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+
+        # shield: one caller being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["inflight"] = len(self._inflight)
+        n = s["upstream_calls"] or 1
+        s["upstream_ms_avg"] = s["upstream_ms_total"] / n
+        return s
+
+    # ----------------------
+    # UPSTREAM
+    # ----------------------
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _call_with_retry(self, payload: dict) -> dict:
+        client = self._session()
+        attempt = 0
+
+        while True:
+            retry_after = None
+            try:
+                async with self._sem:
+                    started = time.perf_counter()
+                    self._stats["upstream_calls"] += 1
+                    res = await client.post(self.url, json=payload)
+                    self._stats["upstream_ms_total"] += (
+                        time.perf_counter() - started
+                    ) * 1000
+
+                if res.status_code == 200:
+                    data = res.json()
+                    usage = data.get("usage") or {}
+                    self._stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                    self._stats["completion_tokens"] += usage.get("completion_tokens", 0)
+                    return data
+
+                if res.status_code not in RETRYABLE_STATUS:
+                    self._stats["failures"] += 1
+                    raise LLMError(res.text)
+
+                retry_after = res.headers.get("Retry-After")
+                error = LLMError(f"LLM returned {res.status_code}: {res.text}")
+
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = LLMError(f"LLM request failed: {e!r}")
+
+            if attempt >= self.max_retries:
+                self._stats["failures"] += 1
+                raise error
+
+            self._stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
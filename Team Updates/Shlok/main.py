@@ -1,14 +1,46 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-import psycopg2
+from typing import Optional
 import os
 import json
-import requests
 import re
+import time
+import uuid
+import itertools
+import psycopg2
+from psycopg2 import errors as pg_errors
 from dotenv import load_dotenv
 
 from app.core.semantic import SemanticLayer
-from app.core.chat_memory import save_message, get_last_messages
+from app.core.chat_memory import (
+    save_message,
+    get_last_messages,
+    memory_stats,
+    close as close_memory,
+    warm_up as warm_memory
+)
+from app.core.db_pool import get_pool, AsyncConnectionPool, PoolTimeout
+from app.core.llm_client import LLMClient, LLMError
+from app.core.cache import (
+    get_cached_intent,
+    store_intent,
+    get_from_cache,
+    store_in_cache,
+    cache_stats,
+    json_default,
+    warm_up as warm_caches
+)
+from app.core.semantic_cache import semantic_cache
+from app.core.intent_matcher import IntentMatcher
+from app.core.rollups import RollupManager, ROLLUPS_ENABLED
+from app.core.sql_guard import SQLGuard
+from app.core.prompt_builder import IntentPromptBuilder
+from app.core.startup import Lazy, Readiness, resolve, is_initialized
+from app.core import metrics
+from app.core.metrics import RequestTrace
 
 # ======================
 # ENV
@@ -17,9 +49,17 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# same switch as app.core.columnar, read here so that importing main does
+# not import pandas
+COLUMNAR_ENABLED = os.getenv("COLUMNAR_ENABLED", "true").lower() == "true"
+
 
-if not DATABASE_URL or not GROQ_API_KEY:
-    raise RuntimeError("Missing environment variables")
+def _required(name: str, value: Optional[str]) -> str:
+    # checked when the client is built, not at import: a misconfigured
+    # worker still starts, answers /livez and names the gap on /readyz
+    if not value:
+        raise RuntimeError(f"{name} not set")
+    return value
 
 # ======================
 # PATH
@@ -28,30 +68,177 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SEMANTIC_PATH = os.path.join(BASE_DIR, "semantic.json")
 
 # ======================
-# APP
+# COMPONENTS
 # ======================
-app = FastAPI(title="SAS Chatbot – NL2SQL")
-semantic = SemanticLayer(SEMANTIC_PATH)
+# Nothing is loaded or connected at import: each component is built on
+# first use, and the lifespan warm-up builds them all in parallel.
+semantic = Lazy(lambda: SemanticLayer(SEMANTIC_PATH), "semantic")
+intent_matcher = Lazy(lambda: IntentMatcher(resolve(semantic)), "intent_matcher")
+prompt_builder = Lazy(lambda: IntentPromptBuilder(resolve(semantic)), "prompt_builder")
 
 # ======================
 # GROQ
 # ======================
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
-MODEL = "llama-3.1-8b-instant"
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+
+llm = Lazy(lambda: LLMClient(GROQ_URL, _required("GROQ_API_KEY", GROQ_API_KEY), MODEL), "llm")
 
 # ======================
 # DB
 # ======================
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+db_pool = Lazy(lambda: get_pool(_required("DATABASE_URL", DATABASE_URL)), "db_pool")
+async_db_pool = Lazy(lambda: AsyncConnectionPool(resolve(db_pool)), "async_db_pool")
+
+
+def _columnar_backend():
+    from app.core.columnar import ColumnarBackend
+
+    return ColumnarBackend(resolve(semantic), resolve(db_pool))
+
+
+rollups = Lazy(lambda: RollupManager(resolve(semantic), resolve(db_pool)), "rollups")
+columnar = Lazy(_columnar_backend, "columnar")
+sql_guard = Lazy(lambda: SQLGuard.from_semantic(semantic.schema), "sql_guard")
+
+
+# ======================
+# STARTUP
+# ======================
+def _warm_db():
+    db_pool.open()
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1")
+
+
+def _warm_semantic():
+    semantic.precompile()
+    for component in (intent_matcher, prompt_builder, sql_guard):
+        resolve(component)
+
+
+def _warm_caches():
+    resolve(semantic_cache)
+    warm_caches()
+
+
+def _start_background_jobs():
+    if ROLLUPS_ENABLED:
+        rollups.start()
+    if COLUMNAR_ENABLED:
+        columnar.start()
+
+
+readiness = Readiness({
+    "db_pool": _warm_db,
+    "semantic": _warm_semantic,
+    "caches": _warm_caches,
+    "chat_memory": warm_memory,
+    "llm": lambda: resolve(llm),
+    "background_jobs": _start_background_jobs,
+})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # serve at once; /readyz reports 503 until warm-up has finished
+    readiness.start()
+    yield
+    # close only what warm-up or a request actually created
+    if is_initialized(semantic_cache):
+        semantic_cache.save()
+    if is_initialized(rollups):
+        rollups.stop()
+    if is_initialized(columnar):
+        columnar.stop()
+    await run_in_threadpool(close_memory)
+    if is_initialized(llm):
+        await llm.aclose()
+    if is_initialized(db_pool):
+        db_pool.close()
+
+
+# ======================
+# APP
+# ======================
+app = FastAPI(title="SAS Chatbot – NL2SQL", lifespan=lifespan)
+
+
+def _fetch_rows(conn, sql: str):
+    with conn.cursor() as cur:
+        sql_guard.admit(cur, sql)
+        cur.execute(sql)
+        rows = cur.fetchall()
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in rows]
+
+
 def run_sql(sql: str):
-    conn = psycopg2.connect(DATABASE_URL)
+    with db_pool.connection() as conn:
+        return _fetch_rows(conn, sql)
+
+
+async def run_sql_async(sql: str):
+    return await async_db_pool.run(_fetch_rows, sql)
+
+
+def _ndjson(obj) -> bytes:
+    return (json.dumps(obj, default=json_default) + "\n").encode("utf-8")
+
+
+def stream_sql(sql: str, meta: dict, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    NDJSON generator: one "meta" line with the column names, "rows" lines
+    of positional arrays (one per fetchmany batch), then an "end" line.
+
+    A named (server-side) cursor keeps only one batch in memory; the
+    pooled connection is held until the generator finishes or the client
+    disconnects. The first next() admits and runs the query and raises if
+    that fails; only later errors become an "error" line.
+    """
+    started = time.perf_counter()
+    row_count = 0
+    streaming = False
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
-            cols = [c[0] for c in cur.description]
-            return [dict(zip(cols, r)) for r in rows]
-    finally:
-        conn.close()
+        with db_pool.connection() as conn:
+            # SET LOCAL needs a plain cursor; it holds for the named one too
+            with conn.cursor() as cur:
+                sql_guard.admit(cur, sql)
+            with conn.cursor(name=f"chat_{uuid.uuid4().hex}") as cur:
+                cur.itersize = batch_size
+                cur.execute(sql)
+
+                rows = cur.fetchmany(batch_size)
+                columns = [c[0] for c in cur.description]
+                yield _ndjson({"type": "meta", **meta, "columns": columns})
+                streaming = True
+
+                while rows:
+                    row_count += len(rows)
+                    yield _ndjson({"type": "rows", "rows": [list(r) for r in rows]})
+                    rows = cur.fetchmany(batch_size)
+    except Exception as e:
+        if not streaming:
+            raise
+        yield _ndjson({"type": "error", "detail": str(e)})
+        return
+
+    yield _ndjson({
+        "type": "end",
+        "row_count": row_count,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
+
+def stream_cached(result: list, meta: dict, batch_size: int = STREAM_BATCH_SIZE, cached: bool = True):
+    columns = list(result[0].keys()) if result else []
+    yield _ndjson({"type": "meta", **meta, "columns": columns, "cached": cached})
+    for i in range(0, len(result), batch_size):
+        batch = result[i:i + batch_size]
+        yield _ndjson({"type": "rows", "rows": [[r[c] for c in columns] for r in batch]})
+    yield _ndjson({"type": "end", "row_count": len(result), "elapsed_ms": 0.0})
 
 # ======================
 # REQUEST MODEL
@@ -59,6 +246,8 @@ def run_sql(sql: str):
 class Query(BaseModel):
     session_id: str
     question: str
+    # how old an answer may be, in seconds; None → COLUMNAR_MAX_STALENESS_SECONDS
+    max_staleness_seconds: Optional[float] = None
 
 # ======================
 # INTENT EXTRACTION (WITH MEMORY)
@@ -66,57 +255,17 @@ class Query(BaseModel):
 import re
 import json
 
-def extract_intent(question: str, history: list) -> dict:
-    context = "\n".join(
-        f"Q: {h['question']} | Intent: {h['intent']}"
-        for h in history
-    )
-
-    prompt = f"""
-You are an intent extraction engine.
-
-Conversation history:
-{context}
-
-Return ONLY valid JSON in this EXACT format:
-
-{{
-  "metric": "",
-  "dimensions": [],
-  "filters": {{}}
-}}
-
-Allowed metrics:
-- total_sales_amount
-- units_sold
-- item_revenue
-- current_stock
-
-Allowed dimensions:
-- customer
-- item
-- voucher_date
-"""
-
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": question}
-        ],
-        "temperature": 0
-    }
+async def extract_intent(question: str, history: list, trace: Optional[RequestTrace] = None) -> dict:
+    # only the relevant metrics/dimensions and a compacted history, within PROMPT_TOKEN_BUDGET
+    prompt = prompt_builder.build(question, history)
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    raw, usage = await llm.chat_with_usage(prompt["messages"], temperature=0)
 
-    res = requests.post(GROQ_URL, headers=headers, json=payload)
-    if res.status_code != 200:
-        raise RuntimeError(res.text)
-
-    raw = res.json()["choices"][0]["message"]["content"].strip()
+    prompt_builder.record_usage(prompt, usage)
+    metrics.llm_prompt_tokens.observe(usage["prompt_tokens"])
+    metrics.llm_completion_tokens.observe(usage["completion_tokens"])
+    if trace is not None:
+        trace.set(prompt_estimated_tokens=prompt["estimated_tokens"], **usage)
 
     # 1️⃣ Extract JSON block (non-greedy)
     match = re.search(r"\{[\s\S]*", raw)
@@ -128,6 +277,7 @@ Allowed dimensions:
     # 2️⃣ AUTO-REPAIR missing closing brace
     if json_text.count("{") > json_text.count("}"):
         json_text += "}"
+        metrics.json_repairs.inc()
 
     # 3️⃣ Parse JSON
     try:
@@ -141,62 +291,343 @@ Allowed dimensions:
 
     return intent
 
+async def resolve_intent(question: str, history: list, trace: Optional[RequestTrace] = None) -> dict:
+    """Exact question cache → rule-based fast path → semantic cache → LLM."""
+    mark = trace.mark if trace is not None else (lambda stage: None)
+
+    intent = get_cached_intent(question, history)
+    mark("intent_cache")
+    if intent is not None:
+        metrics.intent_source.inc(source="intent_cache")
+        return intent
+
+    intent = intent_matcher.match(question, history)
+    mark("fast_path")
+    if intent is not None:
+        # not cached: the match is cheap, and dates like "last month" are
+        # resolved against today
+        metrics.intent_source.inc(source="fast_path")
+        return intent
+
+    intent = semantic_cache.lookup(question, history)
+    mark("semantic_cache")
+    if intent is not None:
+        metrics.intent_source.inc(source="semantic_cache")
+    else:
+        intent = await extract_intent(question, history, trace)
+        mark("extract_intent")
+        semantic.validate(intent)
+        mark("validate")
+        metrics.intent_source.inc(source="llm")
+        semantic_cache.add(question, history, intent)
+
+    store_intent(question, history, intent)
+    return intent
+
 # ======================
 # SQL BUILDER
 # ======================
-def build_sql(intent: dict) -> str:
-    metric = semantic.get_metric(intent["metric"])
-    base_model = semantic.get_model(metric["base_model"])
-
-    if not intent["dimensions"]:
-        return f"SELECT {metric['expression']} AS {intent['metric']} FROM {base_model['table']}"
+def _sql_literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
 
-    select = [f"{metric['expression']} AS {intent['metric']}"]
-    group_by = []
-    joins = []
 
-    for d in intent["dimensions"]:
-        dim = semantic.get_dimension(d)
-        dim_model = semantic.get_model(dim["model"])
+def _filter_clauses(filters: dict, columns: dict = None) -> list:
+    ops = {"eq": "=", "gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+    columns = columns or semantic.dimension_columns
+    clauses = []
+    for d, cond in (filters or {}).items():
+        column = columns[d]
+        for op, value in (cond if isinstance(cond, dict) else {"eq": cond}).items():
+            clauses.append(f"{column} {ops[op]} {_sql_literal(value)}")
+    return clauses
 
-        select.append(f"{dim_model['table']}.{dim['column']} AS {d}")
-        group_by.append(f"{dim_model['table']}.{dim['column']}")
 
-        rel = semantic.get_relationship(dim["model"], metric["base_model"])
-        parent = semantic.get_model(rel["from"])
-        child = semantic.get_model(rel["to"])
-
-        joins.append(
-            f"JOIN {child['table']} ON {child['table']}.{rel['on']} = {parent['table']}.{parent['primary_key']}"
+def build_sql(intent: dict) -> str:
+    """Smallest covering rollup if one is current, else the raw tables."""
+    filters = intent.get("filters") or {}
+    template = rollups.route(intent) if ROLLUPS_ENABLED else None
+    if template is None:
+        template = semantic.compile_query(
+            intent["metric"], tuple(intent["dimensions"]), tuple(filters)
         )
 
-    return (
-        f"SELECT {', '.join(select)} "
-        f"FROM {base_model['table']} "
-        f"{' '.join(joins)} "
-        f"GROUP BY {', '.join(group_by)}"
-    )
+    parts = [template["head"]]
+    where = template.get("where", []) + _filter_clauses(filters, template.get("columns"))
+    if where:
+        parts.append(f"WHERE {' AND '.join(where)}")
+    if template["group_by"]:
+        parts.append(template["group_by"])
+    return " ".join(parts)
 
 # ======================
 # API
 # ======================
-@app.post("/chat")
-def chat(req: Query):
-    try:
-        history = get_last_messages(req.session_id)
-        intent = extract_intent(req.question, history)
-        semantic.validate(intent)
+def _http_error(e: Exception) -> HTTPException:
+    """Bad intents are the caller's fault; upstream and database failures are not."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, LLMError):
+        return HTTPException(status_code=502, detail=f"LLM unavailable: {e}")
+    if isinstance(e, pg_errors.QueryCanceled):
+        return HTTPException(status_code=504, detail=f"Query timed out: {e}")
+    if isinstance(e, (PoolTimeout, psycopg2.OperationalError)):
+        return HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
+
+def _token_header(trace: RequestTrace) -> str:
+    a = trace.attributes
+    return f"prompt={a['prompt_tokens']}, completion={a['completion_tokens']}, estimated={a['prompt_estimated_tokens']}"
+
+
+def _observe_query(trace: RequestTrace, intent: dict, backend: str, seconds: float, rows: int):
+    labels = {
+        "metric": intent["metric"],
+        "dimensions": metrics.dimension_label(intent["dimensions"]),
+        "backend": backend,
+    }
+    metrics.query_seconds.observe(seconds, **labels)
+    metrics.query_rows.observe(rows, **labels)
+    metrics.log_query({"intent": intent, "backend": backend, "ms": round(seconds * 1000, 3), "rows": rows})
+    trace.set(**labels, rows=rows)
 
-        sql = build_sql(intent)
-        result = run_sql(sql)
 
-        save_message(req.session_id, req.question, intent)
+@app.post("/chat")
+async def chat(req: Query, response: Response):
+    trace = RequestTrace("/chat")
+    status = 200
+    try:
+        history = await run_in_threadpool(get_last_messages, req.session_id)
+        trace.mark("history")
+        intent = await resolve_intent(req.question, history, trace)
+
+        cached = await run_in_threadpool(get_from_cache, intent)
+        trace.mark("cache")
+        if cached is not None:
+            sql, result, backend = cached["sql"], cached["result"], "cache"
+        else:
+            # build_sql and choose() read data_version, a pooled query once
+            # per poll interval: never on the event loop
+            sql = sql_guard.prepare(await run_in_threadpool(build_sql, intent))
+            trace.mark("build_sql")
+            started = time.perf_counter()
+            snapshot = None
+            if COLUMNAR_ENABLED:
+                snapshot = await run_in_threadpool(columnar.choose, intent, req.max_staleness_seconds)
+            if snapshot is not None:
+                # same cap prepare() put on the SQL this answer is cached with
+                result = await run_in_threadpool(columnar.execute, intent, snapshot, sql_guard.max_rows)
+                backend = "columnar"
+            else:
+                result = await run_sql_async(sql)
+                backend = "postgres"
+            trace.mark("execute")
+            _observe_query(trace, intent, backend, time.perf_counter() - started, len(result))
+            # a stale snapshot answer must not be cached under the current version
+            if snapshot is None or await run_in_threadpool(columnar.is_fresh, snapshot):
+                await run_in_threadpool(store_in_cache, intent, {"sql": sql, "result": result})
+            trace.mark("cache_store")
+
+        save_message(req.session_id, req.question, intent)  # write-behind, non-blocking
+        trace.mark("save")
+        trace.set(backend=backend)
+        response.headers["Server-Timing"] = trace.header()
+        if "prompt_tokens" in trace.attributes:
+            response.headers["X-LLM-Tokens"] = _token_header(trace)
 
         return {
             "intent": intent,
             "sql": sql,
+            "backend": backend,
             "result": result
         }
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        trace.fail(e)
+        error = _http_error(e)
+        status = error.status_code
+        raise error from e
+
+    finally:
+        trace.finish(status)
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: Query):
+    """
+    Same pipeline as /chat, but rows are streamed as NDJSON instead of
+    being materialised into one JSON body. Results are not cached here
+    since a streamed answer can be arbitrarily large.
+    """
+    # only the time to first byte is traced; the rows are timed by the client
+    trace = RequestTrace("/chat/stream")
+    status = 200
+    try:
+        history = await run_in_threadpool(get_last_messages, req.session_id)
+        trace.mark("history")
+        intent = await resolve_intent(req.question, history, trace)
+
+        # streaming exists for large answers: no row cap, but cost budget and timeout still apply
+        sql = sql_guard.prepare(await run_in_threadpool(build_sql, intent), max_rows=0)
+        trace.mark("build_sql")
+        cached = await run_in_threadpool(get_from_cache, intent)
+        trace.mark("cache")
+
+        columnar_result = None
+        if cached is None and COLUMNAR_ENABLED:
+            snapshot = await run_in_threadpool(columnar.choose, intent, req.max_staleness_seconds)
+            if snapshot is not None:
+                started = time.perf_counter()
+                columnar_result = await run_in_threadpool(columnar.execute, intent, snapshot)
+                trace.mark("execute")
+                _observe_query(trace, intent, "columnar", time.perf_counter() - started, len(columnar_result))
+
+        meta = {"intent": intent, "sql": sql}
+        if cached is not None:
+            body = stream_cached(cached["result"], {**meta, "backend": "cache"})
+        elif columnar_result is not None:
+            body = stream_cached(columnar_result, {**meta, "backend": "columnar"}, cached=False)
+        else:
+            # admission and the first batch run before the response starts,
+            # so a cost rejection is a 400 rather than an error line in a 200
+            body = stream_sql(sql, {**meta, "backend": "postgres"})
+            body = itertools.chain([await run_in_threadpool(next, body)], body)
+            trace.mark("execute")
+
+        save_message(req.session_id, req.question, intent)  # write-behind, non-blocking
+        trace.mark("save")
+
+    except Exception as e:
+        trace.fail(e)
+        error = _http_error(e)
+        status = error.status_code
+        raise error from e
+
+    finally:
+        trace.finish(status)
+
+    headers = {"X-LLM-Tokens": _token_header(trace)} if "prompt_tokens" in trace.attributes else None
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/livez")
+def liveness():
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+def readiness_check(response: Response):
+    report = readiness.check()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/db/pool")
+def pool_stats():
+    return db_pool.stats()
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {
+        **cache_stats(),
+        "semantic": semantic_cache.stats(),
+        "fast_path": intent_matcher.stats(),
+        "chat_memory": memory_stats()
+    }
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    return llm.stats()
+
+
+@app.get("/prompt/stats")
+def prompt_stats():
+    return prompt_builder.stats()
+
+
+@app.get("/guard/stats")
+def guard_stats():
+    return sql_guard.stats()
+
+
+@app.get("/rollups/stats")
+def rollup_stats():
+    return rollups.stats()
+
+
+@app.get("/columnar/stats")
+def columnar_stats():
+    return columnar.stats()
+
+
+# ======================
+# METRICS (read from the stats the components already keep)
+# ======================
+# A scrape must not create what warm-up creates lazily (HTTP client, pool):
+# a component that does not exist yet has no samples.
+def _once_initialized(component, collect):
+    return lambda: collect() if is_initialized(component) else {}
+
+
+def _cache_counters() -> dict:
+    s = cache_stats()
+    values = {}
+    for name in ("intent", "result"):
+        for tier, stats in (("l1", s[name]["l1"]), ("l2", s[name].get("l2"))):
+            if stats:
+                values[(name, tier, "hit")] = stats["hits"]
+                values[(name, tier, "miss")] = stats["misses"]
+    if is_initialized(semantic_cache):
+        semantic_stats = semantic_cache.stats()
+        values[("semantic", "index", "hit")] = semantic_stats["hits"]
+        values[("semantic", "index", "miss")] = semantic_stats["lookups"] - semantic_stats["hits"]
+    if is_initialized(intent_matcher):
+        fast_path = intent_matcher.stats()
+        values[("fast_path", "rules", "hit")] = fast_path["hits"]
+        values[("fast_path", "rules", "miss")] = fast_path["attempts"] - fast_path["hits"]
+    return values
+
+
+def _pick(stats: dict, keys: tuple) -> dict:
+    return {k: stats[k] for k in keys}
+
+
+metrics.registry.collected(
+    "nl2sql_cache_lookups_total", "Cache lookups by cache, tier and outcome.", "counter",
+    ("cache", "tier", "outcome"), _cache_counters)
+metrics.registry.collected(
+    "nl2sql_llm_tokens_total", "LLM tokens used, from the upstream usage field.", "counter",
+    ("type",), _once_initialized(llm, lambda: {
+        k.replace("_tokens", ""): v for k, v in _pick(llm.stats(), ("prompt_tokens", "completion_tokens")).items()}))
+metrics.registry.collected(
+    "nl2sql_llm_calls_total", "LLM client calls by kind.", "counter",
+    ("kind",), _once_initialized(llm, lambda: _pick(
+        llm.stats(), ("requests", "upstream_calls", "coalesced", "retries", "failures"))))
+metrics.registry.collected(
+    "nl2sql_sql_guard_total", "SQL guard decisions.", "counter",
+    ("outcome",), _once_initialized(sql_guard, lambda: _pick(
+        sql_guard.stats(), ("checked", "rejected", "limited", "rejected_by_cost", "downgraded"))))
+metrics.registry.collected(
+    "nl2sql_db_pool_connections", "Connection pool size by state.", "gauge",
+    ("state",), _once_initialized(db_pool, lambda: _pick(db_pool.stats(), ("in_use", "idle", "size", "max_size"))))
+metrics.registry.collected(
+    "nl2sql_db_pool_wait_seconds_total", "Time spent waiting for a pooled connection.", "counter",
+    (), _once_initialized(db_pool, lambda: {(): db_pool.stats()["wait_total_ms"] / 1000}))
+metrics.registry.collected(
+    "nl2sql_ready", "1 once every warm-up step has succeeded.", "gauge",
+    (), lambda: {(): int(readiness.ready)})
+metrics.registry.collected(
+    "nl2sql_startup_ready_seconds", "Time from import to ready.", "gauge",
+    (), lambda: {(): readiness.ready_seconds})
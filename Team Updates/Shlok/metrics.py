@@ -0,0 +1,252 @@
+# app/core/metrics.py
+#
+# Minimal Prometheus registry (text format 0.0.4) and per-request traces.
+# No client library: counters and histograms live in process memory and
+# collectors read the stats the caches / LLM client already keep.
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from typing import Callable
+
+# =========================
+# ENV
+# =========================
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+# JSONL of executed intents, read by `python -m app.core.index_advisor --log`
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+TOKEN_BUCKETS = (25, 50, 100, 200, 300, 400, 600, 800, 1_000, 1_500, 2_000, 4_000)
+
+logger = logging.getLogger("app.core.metrics")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# =========================
+# METRIC TYPES
+# =========================
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            # non-cumulative here; cumulated at render time
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(float(series[-2]))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Collected:
+    """Values read from a callback at scrape time: {label tuple: value}."""
+
+    def __init__(self, name: str, help: str, kind: str, labels: tuple, collect: Callable[[], dict]):
+        self.name, self.help, self.kind, self.label_names = name, help, kind, tuple(labels)
+        self.collect = collect
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.collect()
+        except Exception:
+            return lines
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collected(self, name, help, kind, labels, collect):
+        return self.register(Collected(name, help, kind, labels, collect))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# =========================
+# PIPELINE METRICS
+# =========================
+request_seconds = registry.histogram(
+    "nl2sql_request_seconds", "End-to-end request latency.", ("endpoint", "status"))
+stage_seconds = registry.histogram(
+    "nl2sql_stage_seconds", "Latency of one pipeline stage.", ("stage",))
+query_seconds = registry.histogram(
+    "nl2sql_query_seconds", "Query execution time by metric/dimension combination.",
+    ("metric", "dimensions", "backend"))
+query_rows = registry.histogram(
+    "nl2sql_query_rows", "Rows returned by metric/dimension combination.",
+    ("metric", "dimensions", "backend"), ROW_BUCKETS)
+intent_source = registry.counter(
+    "nl2sql_intent_source_total", "Where the intent came from.", ("source",))
+llm_prompt_tokens = registry.histogram(
+    "nl2sql_llm_prompt_tokens", "Prompt tokens per intent extraction call.", (), TOKEN_BUCKETS)
+llm_completion_tokens = registry.histogram(
+    "nl2sql_llm_completion_tokens", "Completion tokens per intent extraction call.", (), TOKEN_BUCKETS)
+json_repairs = registry.counter(
+    "nl2sql_intent_json_repairs_total", "LLM replies whose JSON had to be auto-repaired.")
+errors = registry.counter(
+    "nl2sql_errors_total", "Failed requests by last completed stage and error type.",
+    ("after_stage", "type"))
+
+
+def dimension_label(dimensions) -> str:
+    """Order-insensitive label for a dimension set; bounded by the semantic layer."""
+    return "+".join(sorted(dimensions)) or "none"
+
+
+# =========================
+# REQUEST TRACE
+# =========================
+class RequestTrace:
+    """
+    Sequential stage timings of one request. Every mark() is observed in
+    nl2sql_stage_seconds; finish() records the request, and logs the full
+    breakdown if it took longer than SLOW_REQUEST_MS.
+    """
+
+    def __init__(self, endpoint: str, slow_ms: float = SLOW_REQUEST_MS):
+        self.endpoint = endpoint
+        self.slow_ms = slow_ms
+        self.stages = []
+        self.attributes = {}
+        self.stage = "start"
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        seconds = now - self._last
+        self.stages.append((stage, seconds * 1000))
+        stage_seconds.observe(seconds, stage=stage)
+        self._last = now
+        self.stage = stage
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: Exception):
+        # the stage that raised is the one following the last completed mark
+        errors.inc(after_stage=self.stage, type=type(error).__name__)
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def header(self) -> str:
+        return ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in self.stages)
+
+    def finish(self, status: int) -> float:
+        total_ms = (time.perf_counter() - self._started) * 1000
+        request_seconds.observe(total_ms / 1000, endpoint=self.endpoint, status=status)
+        if total_ms >= self.slow_ms:
+            logger.warning("slow request %s", json.dumps({
+                "endpoint": self.endpoint,
+                "status": status,
+                "total_ms": round(total_ms, 2),
+                "stages": {stage: round(ms, 2) for stage, ms in self.stages},
+                **self.attributes,
+            }, default=str))
+        return total_ms
+
+
+# =========================
+# QUERY LOG
+# =========================
+_query_log_lock = threading.Lock()
+
+
+def log_query(record: dict):
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({"ts": round(time.time(), 3), **record}, default=str)
+    with _query_log_lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def render() -> str:
+    return registry.render()
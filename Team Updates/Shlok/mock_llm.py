@@ -0,0 +1,124 @@
+import os
+import sys
+import math
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned intents keyed by a lowercase substring of the user question.
+MOCK_INTENTS = {
+    "stock": {"metric": "current_stock", "dimensions": ["item"], "filters": {}},
+    "units": {"metric": "units_sold", "dimensions": ["item"], "filters": {}},
+    "revenue": {"metric": "item_revenue", "dimensions": ["item"], "filters": {}},
+    "customer": {"metric": "total_sales_amount", "dimensions": ["customer"], "filters": {}},
+}
+
+DEFAULT_INTENT = {"metric": "total_sales_amount", "dimensions": [], "filters": {}}
+
+# Optional JSON file {"question substring": intent, ...} replacing MOCK_INTENTS
+MOCK_LLM_INTENTS_PATH = os.getenv("MOCK_LLM_INTENTS_PATH", "")
+
+# Simulated upstream latency in milliseconds, and a failure rate to
+# exercise the client's retry path. MOCK_LLM_LATENCY_MS is the mean
+# (median for lognormal) of MOCK_LLM_LATENCY_DIST:
+#   fixed | uniform (± JITTER_MS) | exponential | lognormal (SIGMA)
+MOCK_LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+MOCK_LLM_LATENCY_DIST = os.getenv("MOCK_LLM_LATENCY_DIST", "fixed")
+MOCK_LLM_LATENCY_JITTER_MS = float(os.getenv("MOCK_LLM_LATENCY_JITTER_MS", "0"))
+MOCK_LLM_LATENCY_SIGMA = float(os.getenv("MOCK_LLM_LATENCY_SIGMA", "0.5"))
+MOCK_LLM_FAIL_RATE = float(os.getenv("MOCK_LLM_FAIL_RATE", "0"))
+MOCK_LLM_SEED = int(os.getenv("MOCK_LLM_SEED", "42"))
+
+if MOCK_LLM_INTENTS_PATH:
+    with open(MOCK_LLM_INTENTS_PATH, "r", encoding="utf-8") as f:
+        MOCK_INTENTS = json.load(f)
+
+_rng = random.Random(MOCK_LLM_SEED)
+_rng_lock = threading.Lock()
+
+
+def sample_latency_ms() -> float:
+    mean = MOCK_LLM_LATENCY_MS
+    if not mean:
+        return 0.0
+    with _rng_lock:
+        if MOCK_LLM_LATENCY_DIST == "uniform":
+            return max(0.0, _rng.uniform(mean - MOCK_LLM_LATENCY_JITTER_MS, mean + MOCK_LLM_LATENCY_JITTER_MS))
+        if MOCK_LLM_LATENCY_DIST == "exponential":
+            return _rng.expovariate(1 / mean)
+        if MOCK_LLM_LATENCY_DIST == "lognormal":
+            return _rng.lognormvariate(math.log(mean), MOCK_LLM_LATENCY_SIGMA)
+    return mean
+
+
+def pick_intent(question: str) -> dict:
+    q = question.lower()
+    for key, intent in MOCK_INTENTS.items():
+        if key in q:
+            return intent
+    return DEFAULT_INTENT
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, like the real provider
+    protocol_version = "HTTP/1.1"
+    calls = 0
+
+    def do_POST(self):
+        content_length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(content_length) or b"{}")
+
+        MockLLMHandler.calls += 1
+
+        latency = sample_latency_ms()
+        if latency:
+            time.sleep(latency / 1000)
+
+        if MOCK_LLM_FAIL_RATE and (MockLLMHandler.calls % round(1 / MOCK_LLM_FAIL_RATE) == 0):
+            self._send(503, {"error": {"message": "mock overloaded"}})
+            return
+
+        question = next(
+            (m["content"] for m in reversed(body.get("messages", [])) if m["role"] == "user"),
+            "",
+        )
+        content = json.dumps(pick_intent(question))
+
+        self._send(200, {
+            "id": f"mock-{MockLLMHandler.calls}",
+            "object": "chat.completion",
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": sum(len(m["content"].split()) for m in body.get("messages", [])),
+                "completion_tokens": len(content.split()),
+            },
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(port: int = 9100):
+    server = ThreadingHTTPServer(("localhost", port), MockLLMHandler)
+    print(f"✅ Mock LLM running on http://localhost:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 9100)
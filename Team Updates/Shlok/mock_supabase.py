@@ -0,0 +1,117 @@
+# app/core/mock_supabase.py
+#
+# In-process stand-in for the supabase client, covering the calls
+# chat_memory.py makes: table().insert(), and
+# table().select().eq().order().limit().execute().
+# Enable with CHAT_MEMORY_BACKEND=local.
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+
+MOCK_SUPABASE_LATENCY_MS = float(os.getenv("MOCK_SUPABASE_LATENCY_MS", "0"))
+MOCK_SUPABASE_FAIL_RATE = float(os.getenv("MOCK_SUPABASE_FAIL_RATE", "0"))
+
+
+class MockSupabaseError(RuntimeError):
+    pass
+
+
+class APIResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        self.client = client
+        self.table = table
+        self._insert = None
+        self._columns = None
+        self._eq = []
+        self._order = None
+        self._limit = None
+
+    def insert(self, rows):
+        self._insert = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def select(self, columns: str = "*"):
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column: str, value):
+        self._eq.append((column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def execute(self) -> APIResponse:
+        self.client._round_trip()
+        if self._insert is not None:
+            return APIResponse(self.client._insert(self.table, self._insert))
+        return APIResponse(self.client._select(self))
+
+
+class MockSupabaseClient:
+    def __init__(self, latency_ms: float = MOCK_SUPABASE_LATENCY_MS, fail_rate: float = MOCK_SUPABASE_FAIL_RATE):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.tables = {}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._fail_counter = 0.0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+            # deterministic failures: every 1/fail_rate-th call
+            self._fail_counter += self.fail_rate
+            fail = self._fail_counter >= 1.0
+            if fail:
+                self._fail_counter -= 1.0
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if fail:
+            raise MockSupabaseError("mock supabase unavailable")
+
+    def _insert(self, table: str, rows: list) -> list:
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            stored = self.tables.setdefault(table, [])
+            inserted = []
+            for row in rows:
+                row = {"created_at": now, **row}
+                row.setdefault("id", len(stored) + 1)
+                stored.append(row)
+                inserted.append(dict(row))
+            return inserted
+
+    def _select(self, q: _Query) -> list:
+        with self._lock:
+            rows = [dict(r) for r in self.tables.get(q.table, [])]
+
+        for column, value in q._eq:
+            rows = [r for r in rows if r.get(column) == value]
+        if q._order:
+            column, desc = q._order
+            rows.sort(key=lambda r: r.get(column), reverse=desc)
+        if q._limit is not None:
+            rows = rows[:q._limit]
+        if q._columns:
+            rows = [{c: r.get(c) for c in q._columns} for r in rows]
+        return rows
+
+
+def create_client(url: str = "", key: str = "") -> MockSupabaseClient:
+    return MockSupabaseClient()
@@ -0,0 +1,165 @@
+# app/core/product_classifier.py
+#
+# Brand / sub-category / category for product names, from the rules in
+# Deepak/Dataset/Table_First_generation_code.ipynb. No app.* imports so
+# the notebooks can use it straight off sys.path.
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# RULES (priority order: first matching rule wins)
+# =========================
+# Patterns are matched against the upper-cased name as plain substrings;
+# a leading "^" means "name starts with".
+
+BRAND_RULES = [
+    ("Hikvision", ["HIK", "EZVIZ", "ECO"]),
+    ("CP Plus", ["^CP", "CP-"]),
+    ("Dahua", ["DAHUA", "^DH-"]),
+    ("Prama", ["PRAMA"]),
+    ("Daichi", ["DAICHI"]),
+    ("Irange", ["IRANGE"]),
+    ("Beetel", ["BEETEL"]),
+]
+
+SUB_CATEGORY_RULES = [
+    # Cameras & core devices
+    ("Video Door Phone", ["VDP", "DOOR PHONE"]),
+    ("Camera", ["CAM", "DOME", "BULLET"]),
+    ("Recorder", ["NVR", "DVR"]),
+    ("Access Control Unit", ["ACCESS CONTROL", "PROXIMITY"]),
+    # Storage
+    ("Hard Drive", ["HDD", "HARD DISK"]),
+    ("SD Card", ["SD", "MICRO SD"]),
+    # Locks
+    ("Door Lock", ["LOCK"]),
+    # Power
+    ("SMPS", ["SMPS"]),
+    ("Power Adapter", ["ADAPTER", "POWER"]),
+    ("Solar Panel", ["SOLAR"]),
+    # Networking
+    ("POE", ["POE"]),
+    ("Network Switch", ["SWITCH"]),
+    ("Connector", ["CONNECTOR", "BNC", "RJ"]),
+    # Cabling (more specific first)
+    ("3+1 Cable", ["3+1"]),
+    ("CAT 6 Cable", ["CAT 6", "CAT6"]),
+    ("HDMI Cable", ["HDMI"]),
+    ("Cable", ["CABLE", "WIRE"]),
+    # Mounting & hardware
+    ("Rack", ["RACK"]),
+    ("Bracket", ["BRACKET"]),
+    # Display & input
+    ("Monitor", ["MONITOR"]),
+    ("Input Device", ["MOUSE", "KEYBOARD"]),
+]
+
+CAMERA_SUB_CATEGORIES = {"Camera", "Video Door Phone", "Recorder", "Access Control Unit"}
+
+UNKNOWN = "Unknown"
+
+
+# =========================
+# MATCHER
+# =========================
+class RuleMatcher:
+    """
+    All patterns of a rule list compiled into one regex of the form
+    (?=(?P<r0>...)|(?P<r1>...)|...). Scanning it once finds, at every
+    position, the highest-priority rule matching there; the lowest rule
+    index over the name is the answer. Results are memoized per distinct
+    name (bounded), since catalogs are tiny next to line items.
+    """
+
+    def __init__(self, rules: list, default: str, cache_size: int = 100_000):
+        self.labels = [label for label, _ in rules]
+        self.default = default
+        self.cache_size = cache_size
+
+        alternatives = []
+        for i, (_, patterns) in enumerate(rules):
+            parts = [
+                "^" + re.escape(p[1:]) if p.startswith("^") else re.escape(p)
+                for p in patterns
+            ]
+            alternatives.append(f"(?P<r{i}>{'|'.join(parts)})")
+        self.regex = re.compile(f"(?=(?:{'|'.join(alternatives)}))")
+
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _classify(self, name: str) -> str:
+        best = len(self.labels)
+        for m in self.regex.finditer(name):
+            rule = int(m.lastgroup[1:])
+            if rule < best:
+                best = rule
+                if best == 0:
+                    break
+        return self.labels[best] if best < len(self.labels) else self.default
+
+    def match(self, product_name) -> str:
+        if product_name is None or (not isinstance(product_name, str) and pd.isna(product_name)):
+            return UNKNOWN
+
+        label = self._cache.get(product_name)
+        if label is not None:
+            self.hits += 1
+            return label
+
+        self.misses += 1
+        label = self._classify(str(product_name).upper())
+        self._cache[product_name] = label
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return label
+
+    def match_series(self, names: pd.Series) -> pd.Series:
+        """Classify each distinct value once, then broadcast back by code."""
+        codes, uniques = pd.factorize(names)
+        # factorize gives missing values code -1, i.e. the trailing UNKNOWN
+        labels = np.array([self.match(u) for u in uniques] + [UNKNOWN], dtype=object)
+        return pd.Series(labels[codes], index=names.index, dtype="object")
+
+
+brand_matcher = RuleMatcher(BRAND_RULES, default="Other")
+sub_category_matcher = RuleMatcher(SUB_CATEGORY_RULES, default="Other Accessories")
+
+
+# =========================
+# API
+# =========================
+def extract_brand(product_name) -> str:
+    return brand_matcher.match(product_name)
+
+
+def extract_sub_category(product_name) -> str:
+    return sub_category_matcher.match(product_name)
+
+
+def extract_category_from_sub(sub_category) -> str:
+    return "Cameras" if sub_category in CAMERA_SUB_CATEGORIES else "Accessories"
+
+
+def classify_product(product_name) -> dict:
+    sub_category = extract_sub_category(product_name)
+    return {
+        "brand": extract_brand(product_name),
+        "sub_category": sub_category,
+        "category": extract_category_from_sub(sub_category),
+    }
+
+
+def classify_frame(df: pd.DataFrame, column: str = "FIRM_PRODUCT") -> pd.DataFrame:
+    """Add brand, sub_category and category columns (in place) and return df."""
+    df["brand"] = brand_matcher.match_series(df[column])
+    df["sub_category"] = sub_category_matcher.match_series(df[column])
+    df["category"] = np.where(
+        df["sub_category"].isin(CAMERA_SUB_CATEGORIES), "Cameras", "Accessories"
+    )
+    return df
@@ -0,0 +1,366 @@
+# app/core/prompt_builder.py
+#
+# Token-budgeted prompt assembly. The static instructions are compiled
+# once; per question only the relevant parts are added (the semantic-layer
+# metrics plus the best-matching dimensions for the intent prompt, rule
+# sections for the hand-written NL2SQL prompts) and history is folded
+# into one structured state line. A prompt never exceeds its budget of
+# estimated tokens.
+# No app.* imports at module level, so the notebooks can use it directly.
+
+import os
+import re
+import json
+import difflib
+import threading
+
+import numpy as np
+
+# =========================
+# ENV
+# =========================
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "600"))
+PROMPT_MAX_METRICS = int(os.getenv("PROMPT_MAX_METRICS", "3"))
+PROMPT_MIN_SCORE = float(os.getenv("PROMPT_MIN_SCORE", "0.5"))
+PROMPT_HISTORY_QUESTIONS = int(os.getenv("PROMPT_HISTORY_QUESTIONS", "2"))
+PROMPT_HISTORY_QUESTION_TOKENS = int(os.getenv("PROMPT_HISTORY_QUESTION_TOKENS", "24"))
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d|([^\sA-Za-z\d])\1*")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokenizer-free BPE estimate: one token per 4 letters of a word, one
+    per digit, one per 8 repeats of a punctuation mark ("-----" rulers).
+    Errs high for common long words, which is the safe side for a budget.
+    """
+    n = 0
+    for m in _TOKEN_RE.finditer(text):
+        t = m.group()
+        n += (len(t) + 3) // 4 if t.isalpha() else (len(t) + 7) // 8
+    return n
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    out, used = [], 0
+    for word in text.split():
+        cost = estimate_tokens(word)
+        if used + cost > max_tokens:
+            return " ".join(out) + " …"
+        out.append(word)
+        used += cost
+    return " ".join(out)
+
+
+def _words(text: str) -> list:
+    return _WORD_RE.findall(text.lower())
+
+
+def _contains(words: list, phrase: list) -> bool:
+    n = len(phrase)
+    return any(words[i:i + n] == phrase for i in range(len(words) - n + 1))
+
+
+class _Budget:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.dropped = 0
+
+    def take(self, tokens: int) -> bool:
+        if self.used + tokens > self.limit:
+            self.dropped += 1
+            return False
+        self.used += tokens
+        return True
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._s = {"builds": 0, "estimated_tokens": 0, "full_tokens": 0, "budget_drops": 0,
+                   "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_estimated_tokens": 0}
+
+    def built(self, estimated, full, dropped):
+        with self._lock:
+            self._s["builds"] += 1
+            self._s["estimated_tokens"] += estimated
+            self._s["full_tokens"] += full
+            self._s["budget_drops"] += dropped
+
+    def usage(self, estimated, usage: dict):
+        with self._lock:
+            self._s["llm_calls"] += 1
+            self._s["llm_estimated_tokens"] += estimated
+            self._s["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self._s["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            s = dict(self._s)
+        builds, calls = s["builds"] or 1, s["llm_calls"] or 1
+        return {
+            "builds": s["builds"],
+            "budget_drops": s["budget_drops"],
+            "estimated_tokens_avg": round(s["estimated_tokens"] / builds, 1),
+            # what the unpruned prompt would have cost
+            "full_tokens_avg": round(s["full_tokens"] / builds, 1),
+            "llm_calls": s["llm_calls"],
+            "prompt_tokens_avg": round(s["prompt_tokens"] / calls, 1),
+            "completion_tokens_avg": round(s["completion_tokens"] / calls, 1),
+            # actual / estimated prompt tokens; tune the budget with it
+            "estimate_ratio": round(s["prompt_tokens"] / s["llm_estimated_tokens"], 3)
+            if s["llm_estimated_tokens"] and s["prompt_tokens"] else None,
+        }
+
+
+# =========================
+# INTENT PROMPT
+# =========================
+INTENT_HEADER = """You are an intent extraction engine.
+
+Return ONLY valid JSON in this EXACT format:
+
+{
+  "metric": "",
+  "dimensions": [],
+  "filters": {}
+}"""
+
+INTENT_FILTERS = """Filters (optional), keyed by dimension:
+- exact match: {"customer": "ABC Traders"}
+- date range: {"voucher_date": {"gte": "YYYY-MM-DD", "lt": "YYYY-MM-DD"}}"""
+
+
+class _CatalogEntry:
+    def __init__(self, name, spec):
+        self.name = name
+        description = spec.get("description")
+        self.line = f"- {name}: {description}" if description else f"- {name}"
+        self.tokens = estimate_tokens(self.line)
+        self.texts = [name.replace("_", " ")] + spec.get("synonyms", [])
+        self.phrases = [_words(p) for p in self.texts]
+
+
+class IntentPromptBuilder:
+    """
+    System prompt for extract_intent, rebuilt per question from parts
+    compiled once. Every metric is listed when the whole list fits the
+    budget (best match first); dimensions are ordered by how well they
+    match the question (synonym phrase or embedding similarity), and the
+    history becomes a single "current state" line plus the last few
+    questions.
+
+    Parts are admitted in priority order until the budget is spent:
+    header/filters/question, metrics, state, dimensions, then earlier
+    questions. Only if the metrics alone overflow the budget are they cut
+    to the best max_metrics relevant ones (plus whatever else fits).
+    """
+
+    def __init__(self, semantic, budget: int = PROMPT_TOKEN_BUDGET,
+                 max_metrics: int = PROMPT_MAX_METRICS, min_score: float = PROMPT_MIN_SCORE,
+                 history_questions: int = PROMPT_HISTORY_QUESTIONS, embedder=None):
+        from app.core.semantic_cache import HashedNgramEmbedder
+
+        self.budget = budget
+        self.max_metrics = max_metrics
+        self.min_score = min_score
+        self.history_questions = history_questions
+        self.embedder = embedder or HashedNgramEmbedder()
+
+        self.metrics = [_CatalogEntry(n, s) for n, s in semantic.metrics.items()]
+        self.dimensions = [_CatalogEntry(n, s) for n, s in semantic.dimensions.items()]
+        entries = self.metrics + self.dimensions
+        # one row per name/synonym phrase; an entry scores its best phrase
+        self._owners = np.array([i for i, e in enumerate(entries) for _ in e.texts])
+        self._vectors = np.stack([self.embedder.embed(t) for e in entries for t in e.texts])
+        self.vocabulary = sorted({w for e in entries for p in e.phrases for w in p})
+
+        # the estimate ignores whitespace, so part costs add up exactly
+        self.fixed_tokens = sum(map(estimate_tokens, (
+            INTENT_HEADER, INTENT_FILTERS, "Allowed metrics:", "Allowed dimensions:")))
+        self.full_tokens = self.fixed_tokens + sum(e.tokens for e in entries)
+        self._stats = _Stats()
+
+    # ----------------------
+    # SELECTION
+    # ----------------------
+    def _normalise(self, word: str) -> str:
+        # plurals and typos ("customers", "stok") → the synonym vocabulary
+        if len(word) <= 3 or word in self.vocabulary:
+            return word
+        close = difflib.get_close_matches(word, self.vocabulary, n=1, cutoff=0.8)
+        return close[0] if close else word
+
+    def score(self, question: str) -> dict:
+        """name → relevance; a synonym phrase in the question scores ≥ 1."""
+        words = [self._normalise(w) for w in _words(question)]
+        entries = self.metrics + self.dimensions
+        sims = np.full(len(entries), -1.0)
+        np.maximum.at(sims, self._owners, self._vectors @ self.embedder.embed(question))
+        scores = {}
+        for entry, sim in zip(entries, sims):
+            lexical = any(p and _contains(words, p) for p in entry.phrases)
+            scores[entry.name] = float(sim) + (1.0 if lexical else 0.0)
+        return scores
+
+    @staticmethod
+    def _state(history: list):
+        """Last intent of the conversation, the context follow-ups modify."""
+        for h in reversed(history or []):
+            intent = h.get("intent")
+            if isinstance(intent, dict) and intent.get("metric"):
+                return intent
+        return None
+
+    # ----------------------
+    # BUILD
+    # ----------------------
+    def build(self, question: str, history: list = None) -> dict:
+        """{"messages", "estimated_tokens", "metrics", "dimensions"} for one question."""
+        budget = _Budget(self.budget)
+        if not budget.take(self.fixed_tokens + estimate_tokens(question)):
+            raise ValueError(f"Question too long for the {self.budget}-token prompt budget")
+
+        scores = self.score(question)
+        state = self._state(history)
+        pinned = set()
+        if state:
+            pinned = {state["metric"], *state.get("dimensions", []), *(state.get("filters") or {})}
+        by_score = lambda entries: sorted(
+            entries, key=lambda e: (e.name not in pinned, -scores[e.name]))
+
+        metrics = by_score(self.metrics)
+        # a score picks the order, never what is hidden: the model has to
+        # see "sales_amount" next to "item_revenue" to choose between them
+        if budget.take(sum(e.tokens for e in metrics)):
+            chosen_metrics = list(metrics)
+        else:
+            relevant = [e for e in metrics if e.name in pinned or scores[e.name] >= self.min_score]
+            relevant = relevant[:max(self.max_metrics, 1)]
+
+            chosen_metrics = []
+            best = relevant[0] if relevant else metrics[0]
+            if not budget.take(best.tokens):
+                raise ValueError(f"Prompt budget of {self.budget} tokens is too small")
+            chosen_metrics.append(best)
+            for e in relevant[1:]:
+                if budget.take(e.tokens):
+                    chosen_metrics.append(e)
+
+        state_line = None
+        if state:
+            state_line = "Current state (the previous answer; follow-ups modify it):\n" + json.dumps(
+                {k: state.get(k) for k in ("metric", "dimensions", "filters")},
+                separators=(",", ":"), default=str)
+            if not budget.take(estimate_tokens(state_line)):
+                state_line = None
+
+        # dimensions are few and cheap; irrelevant ones only go under budget pressure
+        chosen_dimensions = [e for e in by_score(self.dimensions) if budget.take(e.tokens)]
+
+        if len(chosen_metrics) < len(metrics):
+            # the list was cut: fill what budget remains after the dimensions
+            for e in metrics:
+                if e not in chosen_metrics and budget.take(e.tokens):
+                    chosen_metrics.append(e)
+
+        earlier = []
+        for h in reversed((history or [])[-self.history_questions:] if self.history_questions else []):
+            line = "- " + _truncate(str(h.get("question", "")), PROMPT_HISTORY_QUESTION_TOKENS)
+            label = 0 if earlier else estimate_tokens("Earlier questions:")
+            if not budget.take(estimate_tokens(line) + label):
+                break
+            earlier.insert(0, line)
+
+        parts = [INTENT_HEADER]
+        if state_line:
+            parts.append(state_line)
+        if earlier:
+            parts.append("Earlier questions:\n" + "\n".join(earlier))
+        parts.append("Allowed metrics:\n" + "\n".join(e.line for e in chosen_metrics))
+        if chosen_dimensions:
+            parts.append("Allowed dimensions:\n" + "\n".join(e.line for e in chosen_dimensions))
+        parts.append(INTENT_FILTERS)
+        system = "\n\n".join(parts)
+
+        estimated = estimate_tokens(system) + estimate_tokens(question)
+        self._stats.built(estimated, self.full_tokens + estimate_tokens(question), budget.dropped)
+        return {
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": question},
+            ],
+            "estimated_tokens": estimated,
+            "metrics": [e.name for e in chosen_metrics],
+            "dimensions": [e.name for e in chosen_dimensions],
+        }
+
+    def record_usage(self, prompt: dict, usage: dict):
+        self._stats.usage(prompt["estimated_tokens"], usage or {})
+
+    def stats(self) -> dict:
+        return {"budget": self.budget, **self._stats.snapshot()}
+
+
+# =========================
+# SECTIONED PROMPTS
+# =========================
+_SECTION_RE = re.compile(r"^-{5,}\n(.+?)\n-{5,}\n", re.MULTILINE)
+
+
+class SectionPromptBuilder:
+    """
+    Budgeted form of a hand-written system prompt whose sections are
+    delimited by dashed header lines (the Sakeena NL2SQL notebooks).
+    Sections named in `triggers` are sent only when the question contains
+    one of their keywords; the others are always sent.
+    """
+
+    def __init__(self, prompt: str, triggers: dict = None, budget: int = PROMPT_TOKEN_BUDGET * 2):
+        self.budget = budget
+        self.triggers = {title: [_words(k) for k in keywords] for title, keywords in (triggers or {}).items()}
+
+        matches = list(_SECTION_RE.finditer(prompt))
+        self.preamble = prompt[:matches[0].start()].strip() if matches else prompt.strip()
+        self.sections = []  # (title, text, tokens)
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(prompt)
+            text = prompt[m.start():end].strip()
+            self.sections.append((m.group(1).strip(), text, estimate_tokens(text)))
+
+        unknown = set(self.triggers) - {title for title, _, _ in self.sections}
+        if unknown:
+            raise ValueError(f"No such prompt sections: {sorted(unknown)}")
+        self.full_tokens = estimate_tokens(prompt)
+        self._stats = _Stats()
+
+    def build(self, question: str) -> dict:
+        words = _words(question)
+        budget = _Budget(self.budget)
+        if not budget.take(estimate_tokens(self.preamble) + estimate_tokens(question)):
+            raise ValueError(f"Question too long for the {self.budget}-token prompt budget")
+
+        always = [s for s in self.sections if s[0] not in self.triggers]
+        triggered = [s for s in self.sections if s[0] in self.triggers
+                     and any(_contains(words, k) for k in self.triggers[s[0]])]
+        keep = {title for title, _, tokens in always + triggered if budget.take(tokens)}
+
+        system = "\n\n".join([self.preamble] + [text for title, text, _ in self.sections if title in keep])
+        estimated = estimate_tokens(system) + estimate_tokens(question)
+        self._stats.built(estimated, self.full_tokens + estimate_tokens(question), budget.dropped)
+        return {
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": question},
+            ],
+            "estimated_tokens": estimated,
+            "sections": [title for title, _, _ in self.sections if title in keep],
+        }
+
+    def record_usage(self, prompt: dict, usage: dict):
+        self._stats.usage(prompt["estimated_tokens"], usage or {})
+
+    def stats(self) -> dict:
+        return {"budget": self.budget, **self._stats.snapshot()}
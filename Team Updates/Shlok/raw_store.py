@@ -0,0 +1,313 @@
+# app/core/raw_store.py
+#
+# Content-addressed store for raw Tally payloads. Each blob is keyed by the
+# sha256 of its uncompressed bytes and written once, compressed, under
+# RAW_STORE_PATH/ab/cd/<sha256>.xml.<ext>; re-fetching the same export
+# only costs the hash. The database envelope keeps just the reference
+# returned by put()/writer(), and replay/audit read the blob back as a
+# stream over a memory map of the compressed file.
+#
+#   python -m app.core.raw_store stats
+#   python -m app.core.raw_store verify [SHA256 ...]
+#   python -m app.core.raw_store cat SHA256 > export.xml
+
+import os
+import sys
+import gzip
+import mmap
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# =========================
+# ENV
+# =========================
+RAW_STORE_PATH = os.getenv("RAW_STORE_PATH", "storage/raw")
+RAW_STORE_CODEC = os.getenv("RAW_STORE_CODEC", "")  # "zstd" | "gzip"; empty → best available
+RAW_STORE_LEVEL = int(os.getenv("RAW_STORE_LEVEL", "0"))  # 0 → codec default
+
+CHUNK_SIZE = 1 << 20
+
+# =========================
+# OPTIONAL ZSTD
+# =========================
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _Gzip:
+    name, ext, default_level = "gzip", ".gz", 6
+
+    def compressor(self, raw, level):
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0)
+
+    def decompressor(self, raw):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+
+
+class _Zstd:
+    name, ext, default_level = "zstd", ".zst", 3
+
+    def compressor(self, raw, level):
+        return zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=False)
+
+    def decompressor(self, raw):
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+
+
+CODECS = {"gzip": _Gzip()}
+if zstandard is not None:
+    CODECS["zstd"] = _Zstd()
+
+
+def _default_codec():
+    if RAW_STORE_CODEC:
+        if RAW_STORE_CODEC not in CODECS:
+            raise ValueError(f"RAW_STORE_CODEC={RAW_STORE_CODEC!r} not available (have {sorted(CODECS)})")
+        return RAW_STORE_CODEC
+    return "zstd" if "zstd" in CODECS else "gzip"
+
+
+# =========================
+# WRITER
+# =========================
+class BlobWriter:
+    """
+    File-like sink: hashes and compresses everything written into a temp
+    file in the store. commit() moves it to its content address (or drops
+    it if that blob already exists) and returns the reference.
+    """
+
+    def __init__(self, store, codec, level):
+        self.store = store
+        self.codec = CODECS[codec]
+        self._hash = hashlib.sha256()
+        self.bytes = 0
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        self._tmp_path = os.path.join(store.tmp_dir, f"{uuid.uuid4().hex}.part")
+        self._raw = open(self._tmp_path, "wb")
+        self._out = self.codec.compressor(self._raw, level or self.codec.default_level)
+        self.ref = None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._hash.update(data)
+        self._out.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+    def commit(self) -> dict:
+        if self.ref is not None:
+            return self.ref
+        self._out.close()
+        self._raw.close()
+        sha256 = self._hash.hexdigest()
+
+        existing = self.store.locate(sha256)
+        if existing:
+            # same content already stored (possibly under the other codec)
+            os.remove(self._tmp_path)
+            path, deduped = existing, True
+        else:
+            path = self.store.path_for(sha256, self.codec.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+            deduped = False
+
+        self.ref = {
+            "sha256": sha256,
+            "path": os.path.relpath(path, self.store.root),
+            "codec": _codec_of(path),
+            "bytes": self.bytes,
+            "stored_bytes": os.path.getsize(path),
+        }
+        self.store._record(self.ref, deduped)
+        return {**self.ref, "deduped": deduped}
+
+    def abort(self):
+        if self.ref is None:
+            for f in (self._out, self._raw):
+                try:
+                    f.close()
+                except Exception:
+                    pass
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+def _codec_of(path):
+    for codec in CODECS.values():
+        if path.endswith(codec.ext):
+            return codec.name
+    return None
+
+
+# =========================
+# STORE
+# =========================
+class RawStore:
+    def __init__(self, root: str = RAW_STORE_PATH, codec: str = "", level: int = RAW_STORE_LEVEL):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.codec = codec or _default_codec()
+        self.level = level
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "deduped": 0, "bytes_in": 0, "bytes_written": 0}
+
+    # ---------- addressing ----------
+    def path_for(self, sha256: str, codec: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}.xml{CODECS[codec].ext}")
+
+    def locate(self, sha256: str):
+        for codec in CODECS:
+            path = self.path_for(sha256, codec)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, sha256: str) -> bool:
+        return self.locate(sha256) is not None
+
+    # ---------- writes ----------
+    @contextmanager
+    def writer(self):
+        """`with store.writer() as w: w.write(...)`; w.ref holds the reference after the block."""
+        w = BlobWriter(self, self.codec, self.level)
+        try:
+            yield w
+            w.commit()
+        except BaseException:
+            w.abort()
+            raise
+
+    def put(self, data) -> dict:
+        w = BlobWriter(self, self.codec, self.level)
+        try:
+            w.write(data)
+            return w.commit()
+        except BaseException:
+            w.abort()
+            raise
+
+    def _record(self, ref, deduped):
+        with self._lock:
+            self._stats["puts"] += 1
+            self._stats["bytes_in"] += ref["bytes"]
+            if deduped:
+                self._stats["deduped"] += 1
+            else:
+                self._stats["bytes_written"] += ref["stored_bytes"]
+
+    # ---------- reads ----------
+    @contextmanager
+    def open(self, ref):
+        """
+        Decompressed, read-only stream of a blob (`ref` is the reference
+        dict or a bare sha256). The compressed file is memory-mapped, so
+        replaying a large export reads straight from the page cache.
+        """
+        sha256 = ref["sha256"] if isinstance(ref, dict) else ref
+        path = self.locate(sha256)
+        if path is None:
+            raise FileNotFoundError(f"raw blob {sha256} not in {self.root}")
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"raw blob {sha256} is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                stream = CODECS[_codec_of(path)].decompressor(mapped)
+                try:
+                    yield stream
+                finally:
+                    stream.close()
+
+    def iter_chunks(self, ref, size: int = CHUNK_SIZE):
+        with self.open(ref) as stream:
+            while True:
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_text(self, ref) -> str:
+        return b"".join(self.iter_chunks(ref)).decode("utf-8")
+
+    def verify(self, ref) -> bool:
+        """Re-hash a blob; False when its content no longer matches its address."""
+        sha256 = ref["sha256"] if isinstance(ref, dict) else ref
+        h = hashlib.sha256()
+        for chunk in self.iter_chunks(sha256):
+            h.update(chunk)
+        return h.hexdigest() == sha256
+
+    # ---------- introspection ----------
+    def blobs(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != "tmp"]
+            for name in filenames:
+                if _codec_of(name):
+                    yield name.split(".", 1)[0], os.path.join(dirpath, name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["codec"] = self.codec
+        s["dedup_ratio"] = round(s["deduped"] / s["puts"], 3) if s["puts"] else None
+        return s
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_store() -> RawStore:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = RawStore()
+        return _default
+
+
+# =========================
+# CLI
+# =========================
+def _disk_stats(store):
+    count = stored = 0
+    for _, path in store.blobs():
+        count += 1
+        stored += os.path.getsize(path)
+    return count, stored
+
+
+def main(argv):
+    store = get_store()
+    cmd = argv[0] if argv else "stats"
+
+    if cmd == "stats":
+        count, stored = _disk_stats(store)
+        print(f"{store.root}: {count} blobs, {stored / 1e6:.2f} MB stored ({store.codec} for new writes)")
+        return 0
+
+    if cmd == "verify":
+        targets = argv[1:] or [sha for sha, _ in store.blobs()]
+        bad = [sha for sha in targets if not store.verify(sha)]
+        for sha in bad:
+            print(f"❌ {sha} does not match its content")
+        print(f"✅ {len(targets) - len(bad)}/{len(targets)} blobs verified")
+        return 1 if bad else 0
+
+    if cmd == "cat" and len(argv) == 2:
+        out = sys.stdout.buffer
+        for chunk in store.iter_chunks(argv[1]):
+            out.write(chunk)
+        return 0
+
+    print("usage: python -m app.core.raw_store [stats | verify [SHA256 ...] | cat SHA256]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
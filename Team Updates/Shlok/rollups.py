@@ -0,0 +1,593 @@
+# app/core/rollups.py
+
+import os
+import re
+import sys
+import time
+import threading
+from typing import Optional
+
+# =========================
+# ENV
+# =========================
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "2"))
+
+_AGG_RE = re.compile(r"^\s*(SUM|COUNT)\s*\(", re.IGNORECASE)
+
+
+class RollupManager:
+    """
+    Pre-aggregated tables declared under "rollups" in the semantic layer.
+
+    Day-grained rollups ("grain": "day") are built from the raw tables,
+    bucketed by the date dimension or, for tables without one (stock
+    movements), by a "day_column" kept as a `day` column; coarser ones
+    ("source": ...) are re-summed from a day-grained parent, e.g. a
+    per-item running stock balance from per-item daily movements.
+    Triggers on the source tables record changed days in
+    rollup_dirty_days, and a background refresher rebuilds just those
+    days. Queries are only routed to rollups that are current for the
+    latest data_version; otherwise build_sql falls back to the raw tables.
+    Metrics with a "window" only read the window's days of a rollup.
+
+    Only the path to the day is inner-joined. Dimension models are LEFT
+    JOINed with a has_<model> flag per row, so a sale with an unknown
+    customer still counts in the daily total, and route() keeps just the
+    rows the raw query's own inner joins would keep.
+    """
+
+    def __init__(self, semantic, pool, refresh_seconds: float = ROLLUP_REFRESH_SECONDS):
+        self.semantic = semantic
+        self.pool = pool
+        self.refresh_seconds = refresh_seconds
+
+        self.rollups = semantic.schema.get("rollups", {})
+        self.date_dimension = next(
+            (d for d in semantic.dimensions if semantic.is_date_dimension(d)), None
+        )
+        self._validate()
+
+        # day-grained parents first, then the rollups derived from them
+        self.order = sorted(self.rollups, key=lambda n: "source" in self.rollups[n])
+
+        self.row_counts = {}
+        self._fresh_version = None  # data_version the rollups are current for
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        self.routed = 0
+        self.fallbacks = 0
+        self.refreshes = 0
+        self.refreshed_days = 0
+        self.last_refresh_ms = 0.0
+        self.last_error = None
+
+    # ----------------------
+    # VALIDATION
+    # ----------------------
+    def _validate(self):
+        for name, spec in self.rollups.items():
+            for dim in spec["dimensions"]:
+                if dim not in self.semantic.dimensions:
+                    raise ValueError(f"Rollup '{name}': unknown dimension '{dim}'")
+            for metric in spec["metrics"]:
+                if metric not in self.semantic.metrics:
+                    raise ValueError(f"Rollup '{name}': unknown metric '{metric}'")
+
+            if "source" in spec:
+                parent = self.rollups.get(spec["source"])
+                if parent is None or "source" in parent:
+                    raise ValueError(f"Rollup '{name}': source must be a day-grained rollup")
+                if not set(spec["dimensions"]) <= set(parent["dimensions"]):
+                    raise ValueError(f"Rollup '{name}': dimensions must be a subset of '{spec['source']}'")
+                continue
+
+            if spec.get("grain") != "day" or (
+                self.date_dimension not in spec["dimensions"] and "day_column" not in spec
+            ):
+                raise ValueError(
+                    f"Rollup '{name}': needs grain 'day' and the '{self.date_dimension}' dimension or a day_column"
+                )
+            for measure, expr in spec["measures"].items():
+                # only additive measures can be re-summed across days/dimensions
+                if not _AGG_RE.match(expr):
+                    raise ValueError(f"Rollup '{name}': measure '{measure}' must be SUM or COUNT")
+            reachable = self.semantic.join_paths[spec["base_model"]]
+            for dim in spec["dimensions"]:
+                if self.semantic.dimensions[dim]["model"] not in reachable:
+                    raise ValueError(f"Rollup '{name}': no approved join path to '{dim}'")
+
+    def _measures(self, name: str) -> list:
+        spec = self.rollups[name]
+        return list(self.rollups[spec.get("source", name)]["measures"])
+
+    def _day_key(self, name: str) -> Optional[str]:
+        """Column of the rollup's table holding the day; None if it keeps no day."""
+        spec = self.rollups[name]
+        if "source" not in spec and "day_column" in spec:
+            return "day"
+        return self.date_dimension if self.date_dimension in spec["dimensions"] else None
+
+    def _day_expression(self, name: str) -> str:
+        """The day a raw row belongs to, for a day-grained rollup."""
+        return self.rollups[name].get("day_column") or self.semantic.dimension_columns[self.date_dimension]
+
+    def _keys(self, name: str) -> list:
+        """Grouping columns of the rollup's table."""
+        dims = list(self.rollups[name]["dimensions"])
+        day = self._day_key(name)
+        keys = dims + [day] if day and day not in dims else dims
+        return keys + [f"has_{m}" for m in self._optional(name)]
+
+    # ----------------------
+    # JOINS
+    # ----------------------
+    def _day_parent(self, name: str) -> str:
+        return self.rollups[name].get("source", name)
+
+    def _hops(self, name: str) -> list:
+        """(model, join condition) of the day-grained build, the path to the day first."""
+        spec = self.rollups[self._day_parent(name)]
+        paths = self.semantic.join_paths[spec["base_model"]]
+        targets = [] if "day_column" in spec else [self.semantic.dimensions[self.date_dimension]["model"]]
+        targets += [self.semantic.dimensions[d]["model"] for d in spec["dimensions"]]
+        hops = []
+        for model in targets:
+            for hop in paths[model]:
+                if hop not in hops:
+                    hops.append(hop)
+        return hops
+
+    def _required(self, name: str) -> set:
+        """Models every row must join: the ones on the path to the day."""
+        spec = self.rollups[self._day_parent(name)]
+        if "day_column" in spec:
+            return set()
+        day_model = self.semantic.dimensions[self.date_dimension]["model"]
+        return {m for m, _ in self.semantic.join_paths[spec["base_model"]][day_model]}
+
+    def _optional(self, name: str) -> list:
+        """LEFT JOINed models, each kept as a has_<model> key column."""
+        required = self._required(name)
+        return [m for m, _ in self._hops(name) if m not in required]
+
+    def _presence(self, model: str, condition: str) -> str:
+        # the joined table's side of the condition is NULL when nothing matched
+        table = self.semantic.models[model]["table"]
+        column = next(s.strip() for s in condition.split("=") if s.strip().startswith(f"{table}."))
+        return f"{column} IS NOT NULL"
+
+    @staticmethod
+    def _same_keys(a: str, b: str, dims) -> str:
+        # NULL-safe like IS NOT DISTINCT FROM, but hashable: NULL keys are
+        # common under LEFT JOINs and a nested loop over many touched keys
+        # outlasts the statement timeout
+        return f"ROW({', '.join(f'{a}.{d}' for d in dims)})::text = ROW({', '.join(f'{b}.{d}' for d in dims)})::text"
+
+    def _raw_models(self, metric: str, dims) -> set:
+        """Models the raw query for `metric` by `dims` inner-joins."""
+        return set(self.semantic.compile_query(metric, (), tuple(sorted(dims)))["joins"])
+
+    # ----------------------
+    # SQL
+    # ----------------------
+    def _build_select(self, name: str, days: bool) -> str:
+        """SELECT producing the rollup's rows (optionally for %(days)s only)."""
+        spec = self.rollups[name]
+        dims = spec["dimensions"]
+
+        if "source" in spec:
+            parent = self.rollups[spec["source"]]
+            keys = self._keys(name)
+            measures = [f"SUM({m}) AS {m}" for m in self._measures(name)]
+            sql = f"SELECT {', '.join(keys + measures)} FROM {parent['table']}"
+            if days:
+                # keys touched on those days, collected by refresh_days
+                on = self._same_keys("p", "t", dims)
+                sql = (
+                    f"SELECT {', '.join([f'p.{k}' for k in keys] + [f'SUM(p.{m}) AS {m}' for m in self._measures(name)])} "
+                    f"FROM {parent['table']} p JOIN (SELECT DISTINCT {', '.join(dims)} FROM _rollup_touched_{name}) t ON {on}"
+                )
+                return sql + f" GROUP BY {', '.join(f'p.{k}' for k in keys)}"
+            return sql + f" GROUP BY {', '.join(keys)}"
+
+        base = spec["base_model"]
+        required = self._required(name)
+        hops = self._hops(name)
+        columns = [self.semantic.dimension_columns[d] for d in dims]
+        select = [f"{col} AS {d}" for col, d in zip(columns, dims)]
+        if "day_column" in spec:
+            columns.append(spec["day_column"])
+            select.append(f"{spec['day_column']} AS day")
+        for model, condition in hops:
+            if model not in required:
+                columns.append(self._presence(model, condition))
+                select.append(f"{columns[-1]} AS has_{model}")
+        select += [f"{expr} AS {m}" for m, expr in spec["measures"].items()]
+        joins = [
+            f"{'JOIN' if model in required else 'LEFT JOIN'} {self.semantic.models[model]['table']} ON {condition}"
+            for model, condition in hops
+        ]
+
+        parts = [f"SELECT {', '.join(select)}", f"FROM {self.semantic.models[base]['table']}", *joins]
+        if days:
+            parts.append(f"WHERE {self._day_expression(name)} = ANY(%(days)s)")
+        parts.append(f"GROUP BY {', '.join(columns)}")
+        return " ".join(parts)
+
+    def _trigger_sources(self) -> dict:
+        """
+        model → SELECT of the days its changed rows touch, for every model
+        a day-grained rollup reads. The model's transition table
+        ("changed") stands in for its table in the rollup's own join.
+        """
+        sources = {}
+        for name, spec in self.rollups.items():
+            if "source" in spec:
+                continue
+            date_column = self._day_expression(name)
+            base = spec["base_model"]
+            base_table = self.semantic.models[base]["table"]
+            required = self._required(name)
+            day_hops = [h for h in self._hops(name) if h[0] in required]
+
+            def clauses(hops, changed=None):
+                return " ".join(
+                    f"JOIN {'changed AS ' if m == changed else ''}{self.semantic.models[m]['table']} ON {c}"
+                    for m, c in hops
+                )
+
+            # a changed base row only needs its day; orphans of the LEFT
+            # JOINed models must still mark it
+            sources.setdefault(base, []).append(
+                f"SELECT {date_column} FROM changed AS {base_table} {clauses(day_hops)}"
+            )
+            for model, _ in self._hops(name):
+                path = self.semantic.join_paths[base][model]
+                hops = day_hops + [h for h in path if h not in day_hops]
+                sources.setdefault(model, []).append(
+                    f"SELECT {date_column} FROM {base_table} {clauses(hops, model)}"
+                )
+        return {model: " UNION ".join(queries) for model, queries in sources.items()}
+
+    def ddl(self) -> list:
+        """Statements creating rollup tables, indexes, dirty-day tracking and triggers."""
+        statements = [
+            """
+            CREATE TABLE IF NOT EXISTS rollup_dirty_days (
+                day DATE PRIMARY KEY,
+                marked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+        ]
+
+        for name in self.order:
+            spec = self.rollups[name]
+            keys = self._keys(name)
+            day = self._day_key(name)
+            measures = self._measures(name)
+            statements += [
+                f"DROP TABLE IF EXISTS {spec['table']}",
+                f"CREATE TABLE {spec['table']} AS {self._build_select(name, days=False)} WITH NO DATA",
+                # covering index: grouped reads are index-only scans
+                f"CREATE INDEX {spec['table']}_idx ON {spec['table']} "
+                f"({', '.join(keys)}) INCLUDE ({', '.join(measures)})",
+            ]
+            if day and keys[0] != day:
+                # refreshes and windowed metrics read a range of days
+                statements.append(f"CREATE INDEX {spec['table']}_day_idx ON {spec['table']} ({day})")
+
+        for model, days_sql in self._trigger_sources().items():
+            table = self.semantic.models[model]["table"]
+            statements.append(f"""
+            CREATE OR REPLACE FUNCTION rollup_mark_{table}() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO rollup_dirty_days (day)
+                SELECT DISTINCT day FROM ({days_sql}) AS touched(day)
+                WHERE day IS NOT NULL
+                ON CONFLICT DO NOTHING;
+                UPDATE data_version SET version = version + 1, updated_at = now() WHERE id = 1;
+                RETURN NULL;
+            END
+            $$
+            """)
+            # transition tables allow one event per trigger
+            for suffix, event, ref in (
+                ("ins", "INSERT", "NEW TABLE AS changed"),
+                ("upd_new", "UPDATE", "NEW TABLE AS changed"),
+                ("upd_old", "UPDATE", "OLD TABLE AS changed"),
+                ("del", "DELETE", "OLD TABLE AS changed"),
+            ):
+                trigger = f"rollup_mark_{table}_{suffix}"
+                statements += [
+                    f"DROP TRIGGER IF EXISTS {trigger} ON {table}",
+                    f"CREATE TRIGGER {trigger} AFTER {event} ON {table} "
+                    f"REFERENCING {ref} FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_{table}()",
+                ]
+        return statements
+
+    # ----------------------
+    # MAINTENANCE
+    # ----------------------
+    def init(self):
+        """(Re)create every rollup table and trigger, then build from scratch."""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            for statement in self.ddl():
+                cur.execute(statement)
+            cur.execute("DELETE FROM rollup_dirty_days")
+            self._rebuild(cur)
+            version = self._bump_version(cur)
+        self._load_row_counts()
+        self._after_refresh(version)
+
+    def _rebuild(self, cur):
+        for name in self.order:
+            table = self.rollups[name]["table"]
+            cur.execute(f"TRUNCATE {table}")
+            cur.execute(f"INSERT INTO {table} {self._build_select(name, days=False)}")
+            cur.execute(f"ANALYZE {table}")
+
+    def refresh_days(self, cur, days: list):
+        """
+        Recompute the given days in every day-grained rollup, then the keys
+        those days touched (before and after) in every derived rollup.
+        """
+        for name in self.order:
+            spec = self.rollups[name]
+            if "source" in spec:
+                continue
+            day = self._day_key(name)
+
+            children = [c for c in self.order if self.rollups[c].get("source") == name]
+            for child in children:
+                dims = ", ".join(self.rollups[child]["dimensions"])
+                cur.execute(
+                    f"CREATE TEMP TABLE _rollup_touched_{child} ON COMMIT DROP AS "
+                    f"SELECT DISTINCT {dims} FROM {spec['table']} WHERE {day} = ANY(%(days)s)",
+                    {"days": days},
+                )
+
+            cur.execute(f"DELETE FROM {spec['table']} WHERE {day} = ANY(%(days)s)", {"days": days})
+            cur.execute(f"INSERT INTO {spec['table']} {self._build_select(name, days=True)}", {"days": days})
+
+            for child in children:
+                child_spec = self.rollups[child]
+                dims = child_spec["dimensions"]
+                cur.execute(
+                    f"INSERT INTO _rollup_touched_{child} "
+                    f"SELECT DISTINCT {', '.join(dims)} FROM {spec['table']} WHERE {day} = ANY(%(days)s)",
+                    {"days": days},
+                )
+                on = self._same_keys("c", "t", dims)
+                cur.execute(
+                    f"DELETE FROM {child_spec['table']} c USING (SELECT DISTINCT {', '.join(dims)} "
+                    f"FROM _rollup_touched_{child}) t WHERE {on}"
+                )
+                cur.execute(f"INSERT INTO {child_spec['table']} {self._build_select(child, days=True)}")
+
+    def refresh_pending(self) -> int:
+        """Apply every day marked dirty since the last refresh. Returns days refreshed."""
+        started = time.perf_counter()
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM rollup_dirty_days RETURNING day")
+            days = [row[0] for row in cur.fetchall()]
+
+            if not days:
+                cur.execute("SELECT version FROM data_version WHERE id = 1")
+                row = cur.fetchone()
+                version = row[0] if row else 0
+            else:
+                self.refresh_days(cur, days)
+                version = self._bump_version(cur)
+
+        self._after_refresh(version, days)
+        if days:
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+        return len(days)
+
+    def _bump_version(self, cur) -> int:
+        # results cached before the refresh may have been computed from raw
+        # tables mid-update; a bump keeps the result cache honest
+        cur.execute(
+            "UPDATE data_version SET version = version + 1, updated_at = now() "
+            "WHERE id = 1 RETURNING version"
+        )
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+    def _after_refresh(self, version: int, days: list = ()):
+        from app.core.cache import data_version
+
+        if days or not self.row_counts:
+            # a fresh process routes by size from its first refresh on
+            self._load_row_counts()
+        if days:
+            with self._lock:
+                self.refreshes += 1
+                self.refreshed_days += len(days)
+        self._fresh_version = version
+        data_version.expire()
+
+    def _load_row_counts(self):
+        tables = {spec["table"]: name for name, spec in self.rollups.items()}
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)",
+                (list(tables),),
+            )
+            counts = {tables[t]: n for t, n in cur.fetchall()}
+            for name, spec in self.rollups.items():
+                if counts.get(name, -1) < 0:  # never analyzed
+                    cur.execute(f"SELECT COUNT(*) FROM {spec['table']}")
+                    counts[name] = cur.fetchone()[0]
+        self.row_counts = counts
+
+    # ----------------------
+    # BACKGROUND REFRESH
+    # ----------------------
+    def start(self):
+        if not self.rollups or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh_pending()
+                self.last_error = None
+            except Exception as e:
+                # tables not created yet, DB down, ...: keep routing to raw tables
+                self._fresh_version = None
+                self.last_error = str(e)
+            self._stopping.wait(self.refresh_seconds)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ----------------------
+    # ROUTING
+    # ----------------------
+    def route(self, intent: dict) -> Optional[dict]:
+        """
+        Query template over the smallest rollup that covers the intent's
+        metric, dimensions and filters, or None to use the raw tables.
+        """
+        from app.core.cache import data_version
+
+        if self._fresh_version is None or data_version.current() != self._fresh_version:
+            if self.rollups:
+                self.fallbacks += 1
+            return None
+
+        metric = intent["metric"]
+        dims = list(intent.get("dimensions") or [])
+        needed = set(dims) | set(intent.get("filters") or {})
+        window = self.semantic.metrics[metric].get("window")
+        if window:
+            # the bound is applied to the rollup's own copy of the dimension
+            needed.add(window["dimension"])
+        raw_models = self._raw_models(metric, needed)
+
+        # the rollup must hold every row the raw joins keep: its inner
+        # joins may not be more than the raw query's
+        candidates = [
+            name for name in self.order
+            if metric in self.rollups[name]["metrics"]
+            and needed <= set(self.rollups[name]["dimensions"])
+            and self._required(name) <= raw_models <= self._required(name) | set(self._optional(name))
+        ]
+        if not candidates:
+            self.fallbacks += 1
+            return None
+
+        name = min(
+            candidates,
+            key=lambda n: (self.row_counts.get(n, float("inf")), len(self._keys(n))),
+        )
+        spec = self.rollups[name]
+        self.routed += 1
+
+        select = [f"{spec['metrics'][metric]} AS {metric}"] + dims
+        where = [f"has_{m}" for m in self._optional(name) if m in raw_models]
+        if window:
+            where.append(self.semantic.window_predicate(metric, window["dimension"]))
+        return {
+            "rollup": name,
+            "head": f"SELECT {', '.join(select)} FROM {spec['table']}",
+            "where": where,
+            "group_by": f"GROUP BY {', '.join(dims)}" if dims else "",
+            "columns": {d: d for d in spec["dimensions"]},
+        }
+
+    # ----------------------
+    # CHECK
+    # ----------------------
+    def check(self) -> tuple:
+        """
+        Run each metric of every rollup, in total and by each single
+        dimension, on the raw tables and through route(); returns
+        (intents compared, intents whose rows differ).
+        """
+        def run(cur, template):
+            parts = [template["head"]]
+            if template["where"]:
+                parts.append(f"WHERE {' AND '.join(template['where'])}")
+            if template["group_by"]:
+                parts.append(template["group_by"])
+            cur.execute(" ".join(parts))
+            return sorted(cur.fetchall(), key=repr)
+
+        intents = []
+        for spec in self.rollups.values():
+            for metric in spec["metrics"]:
+                for dims in [[]] + [[d] for d in spec["dimensions"]]:
+                    intent = {"metric": metric, "dimensions": dims}
+                    if intent not in intents:
+                        intents.append(intent)
+
+        compared, mismatches = 0, []
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            for intent in intents:
+                template = self.route(intent)
+                if template is None:
+                    continue
+                raw = self.semantic.compile_query(intent["metric"], tuple(intent["dimensions"]))
+                compared += 1
+                if run(cur, template) != run(cur, raw):
+                    mismatches.append({**intent, "rollup": template["rollup"]})
+        return compared, mismatches
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def stats(self) -> dict:
+        return {
+            "enabled": self._fresh_version is not None,
+            "fresh_version": self._fresh_version,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "refreshes": self.refreshes,
+            "refreshed_days": self.refreshed_days,
+            "last_refresh_ms": self.last_refresh_ms,
+            "row_counts": self.row_counts,
+            "last_error": self.last_error,
+        }
+
+
+# =========================
+# CLI
+# =========================
+if __name__ == "__main__":
+    # python -m app.core.rollups ddl      print the DDL
+    # python -m app.core.rollups init     create tables + triggers and build
+    # python -m app.core.rollups refresh  apply pending dirty days once
+    # python -m app.core.rollups check    compare rollup and raw results
+    from app.core.main import semantic, db_pool
+
+    manager = RollupManager(semantic, db_pool)
+    command = sys.argv[1] if len(sys.argv) > 1 else "ddl"
+
+    if command == "ddl":
+        for statement in manager.ddl():
+            print(statement.strip() + ";\n")
+    elif command == "init":
+        manager.init()
+        print(f"✅ Built {len(manager.rollups)} rollups: {manager.row_counts}")
+    elif command == "refresh":
+        print(f"✅ Refreshed {manager.refresh_pending()} days")
+    elif command == "check":
+        manager.refresh_pending()
+        compared, mismatches = manager.check()
+        for m in mismatches:
+            print(f"❌ {m['metric']} by {m['dimensions'] or 'total'} differs on {m['rollup']}")
+        print(f"{'✅' if not mismatches else '❌'} {compared - len(mismatches)}/{compared} intents match the raw tables")
+        sys.exit(1 if mismatches else 0)
+    else:
+        raise SystemExit(f"unknown command: {command}")
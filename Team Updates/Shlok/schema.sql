@@ -0,0 +1,90 @@
+-- Supporting tables for the chat API and the ingestion pipeline.
+-- Safe to re-run.
+
+-- ------------------------------------------------------------
+-- Cache invalidation: bumped whenever new data is ingested
+-- (raw_tally_ingestion / staged_vouchers). See app/core/cache.py.
+-- ------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS data_version (
+    id          INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version     BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_version (id, version) VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
+
+-- ------------------------------------------------------------
+-- Delta Tally sync (tally_connector/sync.py)
+-- One watermark per company and entity; records are upserted by
+-- their Tally key and only replaced by a newer ALTERID.
+-- ------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS tally_sync_watermarks (
+    company_id          UUID NOT NULL,
+    entity_type         TEXT NOT NULL,
+    last_voucher_date   DATE,
+    last_alter_id       BIGINT NOT NULL DEFAULT 0,
+    last_synced_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (company_id, entity_type)
+);
+
+CREATE TABLE IF NOT EXISTS tally_records (
+    company_id      UUID NOT NULL,
+    entity_type     TEXT NOT NULL,
+    record_key      TEXT NOT NULL,
+    alter_id        BIGINT NOT NULL DEFAULT 0,
+    record_date     DATE,
+    payload         JSONB NOT NULL,
+    synced_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (company_id, entity_type, record_key)
+);
+
+-- ------------------------------------------------------------
+-- Inventory lines of staged vouchers, classified at ingestion
+-- (Backend/services/ingestion.py, app/core/product_classifier.py).
+-- ------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS staged_voucher_items (
+    upload_id     UUID NOT NULL,
+    voucher_no    TEXT,
+    stock_item    TEXT,
+    quantity      TEXT,
+    amount        TEXT,
+    brand         TEXT,
+    sub_category  TEXT,
+    category      TEXT
+);
+
+CREATE INDEX IF NOT EXISTS staged_voucher_items_upload_idx
+    ON staged_voucher_items (upload_id);
+
+-- ------------------------------------------------------------
+-- Staging replay (Backend/services/replay.py): one row per upload
+-- re-parsed into the shadow staging tables, written in the same
+-- transaction as its rows; cleared when the shadows are swapped in.
+--     python -m app.services.replay [--resume]
+-- ------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS replay_checkpoints (
+    upload_id    UUID PRIMARY KEY,
+    vouchers     INT NOT NULL,
+    items        INT NOT NULL,
+    seconds      REAL NOT NULL,
+    replayed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- ------------------------------------------------------------
+-- Rollup tables, rollup_dirty_days and their triggers are generated
+-- from "rollups" in semantic_layer.json:
+--     python -m app.core.rollups ddl | init | refresh
+-- ------------------------------------------------------------
+
+-- ------------------------------------------------------------
+-- sales_register_lines is created and COPY-loaded by the Excel
+-- preprocessing pipeline:
+--     python Akanksha/preprocessing.py <exports> --load
+-- ------------------------------------------------------------
+
+-- ------------------------------------------------------------
+-- Indexes on the semantic-layer tables are proposed and measured by
+--     python -m app.core.index_advisor propose | bench | ddl --report
+-- from the joins/filters in semantic_layer.json and QUERY_LOG_PATH.
+-- ------------------------------------------------------------
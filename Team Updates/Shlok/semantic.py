@@ -1,4 +1,12 @@
+import re
 import json
+from collections import deque
+from datetime import date
+
+FILTER_OPS = ("eq", "gte", "gt", "lte", "lt")
+
+_IDENT_RE = re.compile(r"'[^']*'|\b([a-z_][a-z0-9_]*)\b", re.IGNORECASE)
+
 
 class SemanticLayer:
     def __init__(self, path: str):
@@ -10,12 +18,113 @@ class SemanticLayer:
         self.models = self.schema["models"]
         self.relationships = self.schema["relationships"]
 
+        join_policy = self.schema.get("governance", {}).get("joinPolicy", {})
+        self.prevent_fanout = join_policy.get("preventFanoutJoins", False)
+
+        self._compile()
+
+    # ----------------------
+    # COMPILATION
+    # ----------------------
+    def _compile(self):
+        """
+        Build lookup structures once at load time:
+        - relationship by unordered model pair
+        - join hops (many → one, plus one → many if fan-out is allowed)
+        - shortest join path from every model to every reachable model
+        - models each metric expression needs beyond its base model
+        """
+        self.adjacency = {}
+        self.hops = {m: [] for m in self.models}
+
+        for r in self.relationships:
+            self.adjacency[(r["from"], r["to"])] = r
+            self.adjacency[(r["to"], r["from"])] = r
+
+            if r["type"] == "ONE_TO_MANY":
+                one, many = r["from"], r["to"]
+            elif r["type"] == "MANY_TO_ONE":
+                one, many = r["to"], r["from"]
+            else:  # ONE_TO_ONE
+                one, many = r["from"], r["to"]
+
+            one_model = self.models[one]
+            if "primary_key" not in one_model:
+                raise ValueError(f"Model '{one}' needs a primary_key for relationship on '{r['on']}'")
+
+            condition = (
+                f"{self.models[many]['table']}.{r['on']} = "
+                f"{one_model['table']}.{one_model['primary_key']}"
+            )
+            safe = r["type"] == "ONE_TO_ONE"
+
+            # many → one never multiplies rows of the fact table
+            self.hops[many].append((one, condition))
+            if safe or not self.prevent_fanout:
+                self.hops[one].append((many, condition))
+
+        self.join_paths = {m: self._shortest_paths(m) for m in self.models}
+
+        self.dimension_columns = {
+            name: f"{self.models[d['model']]['table']}.{d['column']}"
+            for name, d in self.dimensions.items()
+        }
+
+        self.metric_models = {
+            name: self._expression_models(m) for name, m in self.metrics.items()
+        }
+
+        # "window": {"dimension": ..., "days": N} declares that rows older
+        # than N days on that date dimension never change the metric
+        for name, m in self.metrics.items():
+            window = m.get("window")
+            if window is None:
+                continue
+            if window.get("dimension") not in self.dimensions or not self.is_date_dimension(window["dimension"]):
+                raise ValueError(f"Metric '{name}': window needs a date dimension")
+            model = self.dimensions[window["dimension"]]["model"]
+            if model != m["base_model"] and model not in self.metric_models[name]:
+                self.metric_models[name].append(model)
+
+        self._templates = {}
+
+    def _shortest_paths(self, start: str) -> dict:
+        """BFS: target model → [(model, join condition), ...] from start."""
+        paths = {start: []}
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for nxt, condition in self.hops[current]:
+                if nxt not in paths:
+                    paths[nxt] = paths[current] + [(nxt, condition)]
+                    queue.append(nxt)
+        return paths
+
+    def _expression_models(self, metric: dict) -> list:
+        """
+        Models whose columns appear in the metric expression but not on
+        the base model (e.g. product_sales_growth reads sales.voucher_date).
+        """
+        base = metric["base_model"]
+        base_columns = set(self.models[base].get("columns", []))
+        needed = []
+        for match in _IDENT_RE.finditer(metric["expression"]):
+            ident = match.group(1)
+            if not ident or ident in base_columns:
+                continue
+            for model, spec in self.models.items():
+                if model != base and ident in spec.get("columns", []) and model not in needed:
+                    needed.append(model)
+                    break
+        return needed
+
     # ----------------------
     # INTENT VALIDATION
     # ----------------------
     def validate(self, intent: dict) -> dict:
         metric = intent.get("metric")
         dimensions = intent.get("dimensions", [])
+        filters = intent.get("filters") or {}
 
         if metric not in self.metrics:
             raise ValueError(f"Metric '{metric}' not allowed")
@@ -24,35 +133,143 @@ class SemanticLayer:
             if dim not in self.dimensions:
                 raise ValueError(f"Dimension '{dim}' not allowed")
 
-        self._validate_relationships(metric, dimensions)
+        self._validate_filters(filters)
+        self._validate_relationships(metric, list(dimensions) + list(filters))
         return intent
 
+    # ----------------------
+    # FILTER VALIDATION
+    # ----------------------
+    def _validate_filters(self, filters: dict):
+        """
+        filters: {dimension: value} or {dimension: {"gte": ..., "lt": ...}}
+        Date dimensions only accept ISO dates.
+        """
+        if not isinstance(filters, dict):
+            raise ValueError("Filters must be an object")
+
+        for dim, cond in filters.items():
+            if dim not in self.dimensions:
+                raise ValueError(f"Filter on '{dim}' not allowed")
+
+            ops = cond if isinstance(cond, dict) else {"eq": cond}
+            for op, value in ops.items():
+                if op not in FILTER_OPS:
+                    raise ValueError(f"Filter operator '{op}' not allowed")
+                if not isinstance(value, (str, int, float)):
+                    raise ValueError(f"Invalid filter value for '{dim}'")
+                if self.is_date_dimension(dim):
+                    try:
+                        date.fromisoformat(str(value))
+                    except ValueError:
+                        raise ValueError(f"Filter on '{dim}' must be an ISO date")
+
     # ----------------------
     # RELATIONSHIP GOVERNANCE
     # ----------------------
     def _validate_relationships(self, metric: str, dimensions: list):
         base_model = self.metrics[metric]["base_model"]
+        reachable = self.join_paths[base_model]
+
+        for model in self.metric_models[metric]:
+            if model not in reachable:
+                raise ValueError(
+                    f"Metric '{metric}' needs '{model}' but no approved join path exists"
+                )
 
         for dim in dimensions:
             dim_model = self.dimensions[dim]["model"]
 
-            if base_model == dim_model:
-                continue
-
-            allowed = any(
-                (
-                    r["from"] == base_model and r["to"] == dim_model
-                ) or (
-                    r["from"] == dim_model and r["to"] == base_model
-                )
-                for r in self.relationships
-            )
-
-            if not allowed:
+            if dim_model not in reachable:
+                reason = " without fan-out" if self.prevent_fanout else ""
                 raise ValueError(
-                    f"No approved relationship between '{base_model}' and '{dim_model}'"
+                    f"No approved relationship between '{base_model}' and '{dim_model}'{reason}"
                 )
 
+    # ----------------------
+    # SQL TEMPLATES
+    # ----------------------
+    def compile_query(self, metric: str, dimensions: tuple, filter_dims: tuple = ()) -> dict:
+        """
+        SELECT/FROM/JOIN and GROUP BY text for one metric/dimension
+        combination, cached after first use. Filter values are not
+        part of the template.
+        """
+        key = (metric, tuple(dimensions), tuple(sorted(filter_dims)))
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        spec = self.metrics[metric]
+        base = spec["base_model"]
+
+        select = [f"{spec['expression']} AS {metric}"]
+        group_by = []
+        joined = {base}
+
+        needed = list(self.metric_models[metric])
+        for d in list(dimensions) + [f for f in filter_dims if f not in dimensions]:
+            needed.append(self.dimensions[d]["model"])
+            if d in dimensions:
+                column = self.dimension_columns[d]
+                select.append(f"{column} AS {d}")
+                group_by.append(column)
+
+        joins = self.join_clauses(base, needed, joined)
+
+        window = self.window_predicate(metric)
+        template = {
+            "head": " ".join(
+                [f"SELECT {', '.join(select)}", f"FROM {self.models[base]['table']}", *joins]
+            ),
+            "where": [window] if window else [],
+            "group_by": f"GROUP BY {', '.join(group_by)}" if group_by else "",
+            "joins": [m for m in joined if m != base],
+        }
+        self._templates[key] = template
+        return template
+
+    def join_clauses(self, base: str, models: list, joined: set = None) -> list:
+        """
+        JOIN clauses reaching every model in `models` from `base` along the
+        precomputed shortest paths. `joined` collects the models joined.
+        """
+        joined = joined if joined is not None else {base}
+        joined.add(base)
+        paths = self.join_paths[base]
+        joins = []
+        for model in models:
+            for hop_model, condition in paths[model]:
+                if hop_model in joined:
+                    continue
+                joined.add(hop_model)
+                joins.append(f"JOIN {self.models[hop_model]['table']} ON {condition}")
+        return joins
+
+    def window_predicate(self, metric: str, column: str = None):
+        """
+        Lower bound on the metric's window dimension (None if it has no
+        window), so a query reads the last N days rather than all history.
+        `column` overrides where the dimension lives, e.g. in a rollup.
+        """
+        window = self.metrics[metric].get("window")
+        if window is None:
+            return None
+        column = column or self.dimension_columns[window["dimension"]]
+        return f"{column} >= CURRENT_DATE - INTERVAL '{int(window['days'])} days'"
+
+    def precompile(self) -> int:
+        """Templates for every metric, alone and by each single dimension (warm-up)."""
+        count = 0
+        for metric in self.metrics:
+            for dimensions in [()] + [(d,) for d in self.dimensions]:
+                try:
+                    self.compile_query(metric, dimensions)
+                    count += 1
+                except KeyError:
+                    pass  # dimension not reachable from this metric's model
+        return count
+
     # ----------------------
     # HELPERS
     # ----------------------
@@ -65,13 +282,11 @@ class SemanticLayer:
     def get_model(self, model: str):
         return self.models[model]
 
-    # ✅ THIS METHOD WAS MISSING
+    def is_date_dimension(self, dim: str) -> bool:
+        return self.dimensions[dim]["column"].endswith("_date")
+
+    def get_join_path(self, from_model: str, to_model: str):
+        return self.join_paths[from_model].get(to_model)
+
     def get_relationship(self, from_model: str, to_model: str):
-        for r in self.relationships:
-            if (
-                r["from"] == from_model and r["to"] == to_model
-            ) or (
-                r["from"] == to_model and r["to"] == from_model
-            ):
-                return r
-        return None
+        return self.adjacency.get((from_model, to_model))
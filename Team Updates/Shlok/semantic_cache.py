@@ -0,0 +1,321 @@
+# app/core/semantic_cache.py
+
+import os
+import re
+import json
+import time
+import zlib
+import threading
+from typing import Optional
+
+import numpy as np
+
+from app.core.startup import Lazy
+
+# =========================
+# ENV
+# =========================
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90"))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "5000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")  # empty → memory only
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "50"))
+
+# =========================
+# OPTIONAL HNSW
+# =========================
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Above this many entries HNSW beats a NumPy matmul; below it the
+# brute-force scan is both exact and faster.
+HNSW_MIN_ENTRIES = 20000
+
+
+# =========================
+# EMBEDDER
+# =========================
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "by", "to", "per", "each", "all",
+    "me", "my", "our", "we", "i", "us", "is", "are", "was", "were", "be",
+    "show", "give", "get", "list", "display", "tell", "find", "what", "whats",
+    "how", "much", "many", "please", "wise", "and", "with", "from", "can", "you",
+}
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ies", "es", "s"):
+        if len(word) > 4 and word.endswith(suffix):
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+# Tokens that change the answer even when the rest of the sentence is
+# identical ("sales in december" vs "sales in november", "S23" vs "S24").
+_GUARD_RE = re.compile(
+    r"\b([a-z]*\d[a-z0-9]*|jan\w*|feb\w*|mar\w*|apr\w*|may|jun\w*|jul\w*|aug\w*|sep\w*|oct\w*|nov\w*|dec\w*"
+    r"|today|yesterday|last|this|previous|next|top|bottom|week\w*|month\w*|year\w*|quarter\w*)\b"
+)
+
+# Dates relative to today: the extracted intent holds absolute dates, so
+# it is only right on the day it was extracted.
+_RELATIVE_RE = re.compile(r"\b(today|yesterday|tomorrow|last|this|previous|past|next|ago)\b")
+
+
+class HashedNgramEmbedder:
+    """
+    Dependency-free sentence embedding: stemmed content words plus their
+    character 3/4-grams, signed-hashed into `dim` buckets and L2-normalised.
+
+    crc32 is used instead of hash() so vectors are stable across processes
+    and the persisted index stays valid after a restart.
+    """
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = [_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+        for w in words:
+            yield "w:" + w, 1.0
+            # char n-grams per word: robust to typos, insensitive to word order
+            padded = " " + w + " "
+            for n in (3, 4):
+                for i in range(len(padded) - n + 1):
+                    yield "c:" + padded[i:i + n], 0.3
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode())
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vec[h % self.dim] += sign * weight
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+def guard_signature(text: str) -> str:
+    return " ".join(sorted(set(_GUARD_RE.findall(text.lower()))))
+
+
+def filter_literals(question: str, intent: dict) -> list:
+    """Question words that ended up in a filter value ("sharma" → customer = 'Sharma Traders')."""
+    values = set()
+    for cond in (intent.get("filters") or {}).values():
+        for value in (cond.values() if isinstance(cond, dict) else [cond]):
+            values.update(_WORD_RE.findall(str(value).lower()))
+    return sorted(set(_WORD_RE.findall(question.lower())) & values)
+
+
+def _cacheable(question: str, intent: dict) -> bool:
+    return not (intent.get("filters") and _RELATIVE_RE.search(question.lower()))
+
+
+def _context_key(history: list) -> str:
+    """Follow-up questions only match entries asked in the same context."""
+    last = history[-1].get("intent") if history else None
+    return json.dumps(last, sort_keys=True) if last else ""
+
+
+# =========================
+# INDEX
+# =========================
+class SemanticQuestionCache:
+    """
+    Nearest-neighbour lookup from a question to a previously extracted
+    intent. Capacity-bounded with least-recently-hit eviction.
+
+    A neighbour is only reused if it has the same guard tokens and the
+    question contains every word of the neighbour's filter values, so
+    "sales for Sharma" never answers "sales for Verma". Filtered intents
+    of relative-date questions are not stored at all.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        capacity: int = SEMANTIC_CACHE_CAPACITY,
+        path: str = SEMANTIC_CACHE_PATH,
+        embedder: Optional[HashedNgramEmbedder] = None,
+    ):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.path = path
+        self.embedder = embedder or HashedNgramEmbedder()
+
+        dim = self.embedder.dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._entries = [None] * capacity  # {question, intent, guard, literals, context}
+        self._last_hit = np.zeros(capacity, dtype=np.float64)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._dirty = 0
+
+        self._hnsw = None
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.rejected_by_guard = 0
+        self.skipped_relative = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    # ----------------------
+    # LOOKUP
+    # ----------------------
+    def lookup(self, question: str, history: list) -> Optional[dict]:
+        vec = self.embedder.embed(question)
+        guard = guard_signature(question)
+        words = set(_WORD_RE.findall(question.lower()))
+        context = _context_key(history)
+
+        with self._lock:
+            self.lookups += 1
+            for slot, score in self._candidates(vec):
+                if score < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is None or entry["context"] != context:
+                    continue
+                if entry["guard"] != guard or not words.issuperset(entry.get("literals", ())):
+                    self.rejected_by_guard += 1
+                    continue
+                self._last_hit[slot] = time.time()
+                self.hits += 1
+                return entry["intent"]
+        return None
+
+    def _candidates(self, vec: np.ndarray, k: int = 8):
+        """(slot, cosine) pairs, best first."""
+        used = len(self._entries) - len(self._free)
+        if not used:
+            return []
+
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(vec, k=min(k, used))
+            return [(int(l), 1.0 - float(d)) for l, d in zip(labels[0], distances[0])]
+
+        scores = self._vectors @ vec
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    # ----------------------
+    # INSERT / EVICT
+    # ----------------------
+    def add(self, question: str, history: list, intent: dict):
+        if not _cacheable(question, intent):
+            self.skipped_relative += 1
+            return
+        vec = self.embedder.embed(question)
+        entry = {
+            "question": question,
+            "intent": intent,
+            "guard": guard_signature(question),
+            "literals": filter_literals(question, intent),
+            "context": _context_key(history),
+        }
+
+        with self._lock:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = int(np.argmin(self._last_hit))
+                self.evictions += 1
+
+            self._vectors[slot] = vec
+            self._entries[slot] = entry
+            self._last_hit[slot] = time.time()
+            self._index_slot(slot)
+            self._dirty += 1
+            should_save = self.path and self._dirty >= SEMANTIC_CACHE_SAVE_EVERY
+
+        if should_save:
+            self.save()
+
+    def _index_slot(self, slot: int):
+        used = len(self._entries) - len(self._free)
+        if self._hnsw is None and hnswlib is not None and used >= HNSW_MIN_ENTRIES:
+            self._build_hnsw()
+        elif self._hnsw is not None:
+            # re-adding an existing label overwrites the evicted vector
+            self._hnsw.add_items(self._vectors[slot:slot + 1], [slot])
+
+    def _build_hnsw(self):
+        index = hnswlib.Index(space="cosine", dim=self.embedder.dim)
+        index.init_index(max_elements=self.capacity, ef_construction=200, M=16)
+        slots = [i for i, e in enumerate(self._entries) if e is not None]
+        index.add_items(self._vectors[slots], slots)
+        index.set_ef(64)
+        self._hnsw = index
+
+    # ----------------------
+    # PERSISTENCE
+    # ----------------------
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            slots = [i for i, e in enumerate(self._entries) if e is not None]
+            vectors = self._vectors[slots].copy()
+            last_hit = self._last_hit[slots].copy()
+            meta = json.dumps([self._entries[i] for i in slots])
+            self._dirty = 0
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, vectors=vectors, last_hit=last_hit, meta=np.array(meta))
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            last_hit = data["last_hit"]
+            entries = json.loads(str(data["meta"]))
+
+        if vectors.shape[1:] != (self.embedder.dim,):
+            return  # embedder changed; start cold
+
+        # keep the most recently hit entries if capacity shrank; files from
+        # before relative dates were skipped may still hold some
+        order = [
+            i for i in np.argsort(-last_hit)
+            if _cacheable(entries[i]["question"], entries[i]["intent"])
+        ][: self.capacity]
+        with self._lock:
+            for slot, i in enumerate(order):
+                self._vectors[slot] = vectors[i]
+                self._last_hit[slot] = last_hit[i]
+                self._entries[slot] = entries[i]
+            self._free = list(range(self.capacity - 1, len(order) - 1, -1))
+            if hnswlib is not None and len(order) >= HNSW_MIN_ENTRIES:
+                self._build_hnsw()
+
+    # ----------------------
+    # METRICS
+    # ----------------------
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries) - len(self._free)
+            return {
+                "size": size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "index": "hnsw" if self._hnsw is not None else "numpy",
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "rejected_by_guard": self.rejected_by_guard,
+                "skipped_relative": self.skipped_relative,
+            }
+
+
+# built (and loaded from SEMANTIC_CACHE_PATH) on first use, or by warm-up
+semantic_cache = Lazy(SemanticQuestionCache, "semantic_cache")
@@ -0,0 +1,528 @@
+# app/core/sql_guard.py
+#
+# Query governance for SQL that reaches the shared database: a tokenizer
+# and scope tree (no SQL parser dependency), the semantic layer's
+# sqlRestrictions, LIMIT injection per query scope, an EXPLAIN cost
+# budget and a per-transaction statement_timeout.
+# No app.* imports so the notebooks can use it straight off sys.path.
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Optional
+
+# =========================
+# ENV
+# =========================
+SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "10000"))
+# cap for CTE bodies and derived tables; 0 = leave them alone, since a
+# LIMIT there truncates what the outer query aggregates
+SQL_GUARD_SUBQUERY_ROWS = int(os.getenv("SQL_GUARD_SUBQUERY_ROWS", "0"))
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "1000000"))
+SQL_GUARD_SOFT_COST = float(os.getenv("SQL_GUARD_SOFT_COST", "100000"))
+SQL_GUARD_MAX_PLAN_ROWS = float(os.getenv("SQL_GUARD_MAX_PLAN_ROWS", "0"))
+SQL_GUARD_TIMEOUT_MS = int(os.getenv("SQL_GUARD_TIMEOUT_MS", "15000"))
+SQL_GUARD_DOWNGRADE_TIMEOUT_MS = int(os.getenv("SQL_GUARD_DOWNGRADE_TIMEOUT_MS", "5000"))
+
+# writes hidden inside a SELECT: data-modifying CTEs, SELECT INTO
+ALWAYS_DISALLOWED = {"INSERT", "UPDATE", "DELETE", "MERGE", "INTO"}
+QUERY_KEYWORDS = {"SELECT", "WITH", "VALUES"}
+
+BLOCKED_FUNCTIONS = {
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until",
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file",
+    "lo_import", "lo_export", "lo_get", "lo_put",
+    "dblink", "dblink_exec", "dblink_connect",
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf",
+    "set_config", "current_setting", "pg_advisory_lock", "pg_advisory_xact_lock",
+}
+# families that run SQL of their own or touch the server: the *_to_xml
+# exports (query_to_xml('select * from pg_shadow', ...), table_to_xml and
+# their _and_xmlschema variants) read any relation past the table
+# allow-list, which only sees the FROM clauses of this statement
+BLOCKED_FUNCTION_RE = re.compile(
+    r"^(?:(?:query|table|cursor|schema|database)_to_xml|dblink|lo_|pg_read_|pg_ls_)")
+
+
+class SQLRejected(ValueError):
+    pass
+
+
+# =========================
+# TOKENIZER
+# =========================
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*[\s\S]*?\*/)
+  | (?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z0-9_]*)?\$[\s\S]*?\$(?P=tag)?\$)
+  | (?P<estr>[Ee]'(?:\\.|''|[^'\\])*')
+  | (?P<str>(?:[BbXxNn])?'(?:''|[^'])*')
+  | (?P<ident>"(?:""|[^"])*")
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>\$\d+|%\(\w+\)s|%s)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<punct>[(),;.\[\]])
+  | (?P<op>::|[-+*/%<>=~!@#^&|`?:]+)
+""", re.VERBOSE)
+
+
+def tokenize(sql: str) -> list:
+    """(kind, text, start, end) tuples; whitespace and comments dropped."""
+    tokens, pos = [], 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise SQLRejected(f"Cannot parse SQL near: {sql[pos:pos + 20]!r}")
+        kind = m.lastgroup if m.lastgroup != "tag" else "dollar"
+        if kind == "estr":
+            kind = "str"
+        if kind not in ("ws", "comment"):
+            tokens.append((kind, m.group(), m.start(), m.end()))
+        pos = m.end()
+    return tokens
+
+
+def _upper(token) -> Optional[str]:
+    return token[1].upper() if token is not None and token[0] == "word" else None
+
+
+def _name(token) -> str:
+    if token[0] == "ident":
+        return token[1][1:-1].replace('""', '"')
+    return token[1].lower()
+
+
+# =========================
+# SCOPE TREE
+# =========================
+class _Scope:
+    """One query level: the statement itself, a CTE body or a subquery."""
+
+    def __init__(self, role: str, parent=None):
+        self.role = role          # root | cte | from | expr
+        self.parent = parent
+        self.clause = None        # last clause keyword seen at this level
+        self.limit = None         # token index of LIMIT at this level
+        self.fetch = None         # token index of FETCH at this level
+        self.markers = []         # token indices of OFFSET / FETCH / FOR
+        self.last = None          # token index of the last token inside
+        self.children = []
+
+
+class _Group:
+    """A parenthesised join in a FROM list, e.g. FROM (a JOIN b ON ...)."""
+
+    def __init__(self, scope: _Scope):
+        self.scope = scope
+
+
+class _Statement:
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.tokens = tokenize(sql)
+        if not self.tokens:
+            raise SQLRejected("Empty SQL")
+        self.root = _Scope("root")
+        self.scopes = [self.root]
+        self.relations = set()
+        self.ctes = set()
+        self.calls = set()
+        self._build()
+
+    def _build(self):
+        tokens = self.tokens
+        # each frame: the scope its parenthesis opened, a _Group, or None
+        # for a plain one
+        stack = []
+        scope = self.root
+        end = len(tokens)
+
+        for i, token in enumerate(tokens):
+            kind, text = token[0], token[1]
+
+            if text == ";" and kind == "punct":
+                if stack:
+                    raise SQLRejected("Unbalanced parentheses")
+                if any(t[1] != ";" for t in tokens[i + 1:]):
+                    raise SQLRejected("Only a single statement is allowed")
+                end = i
+                break
+
+            top = stack[-1] if stack else scope
+            at_level = (top.scope if isinstance(top, _Group) else top) is scope
+
+            if text == "(" and kind == "punct":
+                if _upper(tokens[i + 1] if i + 1 < len(tokens) else None) in QUERY_KEYWORDS:
+                    child = _Scope(self._role(i, scope, at_level), scope)
+                    scope.children.append(child)
+                    self.scopes.append(child)
+                    if child.role == "cte":
+                        self.ctes.add(self._cte_name(i))
+                    stack.append(child)
+                    scope = child
+                elif at_level and scope.clause == "FROM" and self._from_item(i):
+                    # the relations inside are part of this scope's FROM list
+                    stack.append(_Group(scope))
+                    self._relation(i + 1)
+                else:
+                    stack.append(None)
+                continue
+
+            if text == ")" and kind == "punct":
+                if not stack:
+                    raise SQLRejected("Unbalanced parentheses")
+                frame = stack.pop()
+                if isinstance(frame, _Scope):
+                    frame.last = i - 1
+                    scope = frame.parent
+                continue
+
+            if kind not in ("word", "ident"):
+                continue
+
+            if i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+                self.calls.add(_name(token))
+
+            if not at_level:
+                continue
+            if scope.clause == "FROM" and tokens[i - 1][1] == ",":
+                self._relation(i)
+            if kind != "word":
+                continue
+
+            word = text.upper()
+            if word in ("SELECT", "FROM", "WHERE", "GROUP", "HAVING", "WINDOW", "ORDER"):
+                scope.clause = word
+            elif word == "LIMIT":
+                scope.clause, scope.limit = word, i
+            elif word in ("OFFSET", "FETCH", "FOR"):
+                scope.clause = word
+                scope.markers.append(i)
+                if word == "FETCH":
+                    scope.fetch = i
+                if word == "FOR" and _upper(tokens[i + 1] if i + 1 < len(tokens) else None) in (
+                        "UPDATE", "SHARE", "NO", "KEY"):
+                    raise SQLRejected("Row locking clauses are not allowed")
+
+            if word in ("FROM", "JOIN"):
+                self._relation(i + 1)
+
+        if stack:
+            raise SQLRejected("Unbalanced parentheses")
+        self.end = end
+        self.root.last = end - 1
+
+    def _role(self, i: int, scope: _Scope, at_level: bool) -> str:
+        prev = _upper(self.tokens[i - 1]) if i else None
+        if prev in ("AS", "MATERIALIZED"):
+            return "cte"
+        if at_level and scope.clause == "FROM" and self._from_item(i):
+            return "from"
+        return "expr"
+
+    def _from_item(self, i: int) -> bool:
+        """Whether the parenthesis at i starts an item of a FROM list."""
+        prev = self.tokens[i - 1] if i else None
+        # "(" only reaches here at level inside a _Group
+        return _upper(prev) in ("FROM", "JOIN", "LATERAL") or (prev is not None and prev[1] in (",", "("))
+
+    def _cte_name(self, i: int) -> str:
+        # name [(columns)] AS [NOT] [MATERIALIZED] (
+        j = i - 1
+        while _upper(self.tokens[j]) in ("AS", "NOT", "MATERIALIZED"):
+            j -= 1
+        if self.tokens[j][1] == ")":
+            depth = 0
+            while True:
+                depth += {")": 1, "(": -1}.get(self.tokens[j][1], 0)
+                j -= 1
+                if depth == 0:
+                    break
+        return _name(self.tokens[j])
+
+    def _relation(self, i: int):
+        tokens = self.tokens
+        while i < len(tokens) and _upper(tokens[i]) in ("LATERAL", "ONLY"):
+            i += 1
+        if i >= len(tokens) or tokens[i][0] not in ("word", "ident"):
+            return
+        parts = [_name(tokens[i])]
+        while i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("word", "ident"):
+            i += 2
+            parts.append(_name(tokens[i]))
+        if i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            return  # set-returning function, checked with the other calls
+        self.relations.add(".".join(parts))
+
+    # ----------------------
+    # REWRITE
+    # ----------------------
+    def limit_edits(self, scope: _Scope, cap: int) -> list:
+        """(start, end, text) edits that make scope return at most cap rows."""
+        tokens, sql = self.tokens, self.sql
+
+        if scope.limit is not None:
+            following = [m for m in scope.markers if m > scope.limit]
+            stop = following[0] - 1 if following else scope.last
+            start, end = tokens[scope.limit + 1][2], tokens[stop][3]
+            value = sql[start:end]
+            single = scope.limit + 1 == stop
+            if single and tokens[stop][0] == "num" and float(value) <= cap:
+                return []
+            if single and (tokens[stop][0] == "num" or value.upper() == "ALL"):
+                return [(start, end, str(cap))]
+            return [(start, end, f"LEAST({value}, {cap})")]
+
+        if scope.fetch is not None:
+            # FETCH {FIRST|NEXT} [n] {ROW|ROWS} ...; without n it is one row
+            count = tokens[scope.fetch + 2] if scope.fetch + 2 < len(tokens) else None
+            if count is not None and count[0] == "num" and float(count[1]) > cap:
+                return [(count[2], count[3], str(cap))]
+            return []
+
+        at = tokens[scope.last][3]
+        return [(at, at, f" LIMIT {cap}")]
+
+
+def _apply(sql: str, edits: list) -> str:
+    for start, end, text in sorted(edits, reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+
+# =========================
+# GUARD
+# =========================
+class SQLGuard:
+    """
+    check()   → parse and enforce the restrictions, raise SQLRejected
+    prepare() → check() plus LIMIT injection, returns the SQL to run
+    admit()   → EXPLAIN against the cost budget, then SET LOCAL the
+                statement_timeout (and read-only) for the transaction
+    execute() → all of the above on a caller-owned connection
+    """
+
+    def __init__(
+        self,
+        allowed=("SELECT",),
+        disallowed=(),
+        tables=None,
+        max_rows: int = SQL_GUARD_MAX_ROWS,
+        subquery_rows: int = SQL_GUARD_SUBQUERY_ROWS,
+        max_cost: float = SQL_GUARD_MAX_COST,
+        soft_cost: float = SQL_GUARD_SOFT_COST,
+        max_plan_rows: float = SQL_GUARD_MAX_PLAN_ROWS,
+        timeout_ms: int = SQL_GUARD_TIMEOUT_MS,
+        downgrade_timeout_ms: int = SQL_GUARD_DOWNGRADE_TIMEOUT_MS,
+        read_only: bool = True,
+    ):
+        self.allowed = {a.upper() for a in allowed}
+        self.disallowed = {d.upper() for d in disallowed} | ALWAYS_DISALLOWED
+        self.tables = {t.lower() for t in tables} if tables is not None else None
+        self.max_rows = max_rows
+        self.subquery_rows = subquery_rows
+        self.max_cost = max_cost
+        self.soft_cost = soft_cost
+        self.max_plan_rows = max_plan_rows
+        self.timeout_ms = timeout_ms
+        self.downgrade_timeout_ms = downgrade_timeout_ms
+        self.read_only = read_only
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "checked": 0,
+            "rejected": 0,
+            "limited": 0,
+            "explained": 0,
+            "rejected_by_cost": 0,
+            "downgraded": 0,
+            "explain_ms_total": 0.0,
+        }
+
+    @classmethod
+    def from_semantic(cls, schema: dict, **kwargs):
+        """Restrictions from governance.sqlRestrictions, tables from models and rollups."""
+        restrictions = schema.get("governance", {}).get("sqlRestrictions", {})
+        tables = {m["table"] for m in schema.get("models", {}).values()}
+        tables |= {r["table"] for r in schema.get("rollups", {}).values()}
+        kwargs.setdefault("tables", tables)
+        return cls(
+            allowed=restrictions.get("allowed", ["SELECT"]),
+            disallowed=restrictions.get("disallowed", []),
+            **kwargs,
+        )
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _reject(self, reason: str):
+        self._count("rejected")
+        raise SQLRejected(reason)
+
+    # ----------------------
+    # STATIC CHECKS
+    # ----------------------
+    def check(self, sql: str) -> _Statement:
+        self._count("checked")
+        try:
+            stmt = _Statement(sql)
+        except SQLRejected:
+            self._count("rejected")
+            raise
+
+        tokens = stmt.tokens[:stmt.end]
+        first = next((t for t in tokens if t[1] != "("), None)
+        leading = _upper(first)
+        if leading not in QUERY_KEYWORDS or (leading != "WITH" and leading not in self.allowed | {"VALUES"}):
+            self._reject(f"Only {', '.join(sorted(self.allowed))} statements are allowed")
+
+        for i, token in enumerate(tokens):
+            word = _upper(token)
+            # t.update is a column, "update" an identifier; neither is a keyword
+            if word in self.disallowed and not (i and tokens[i - 1][1] == "."):
+                self._reject(f"Keyword {word} is not allowed")
+
+        blocked = {c for c in stmt.calls
+                   if c.lower() in BLOCKED_FUNCTIONS or BLOCKED_FUNCTION_RE.match(c.lower())}
+        if blocked:
+            self._reject(f"Function {sorted(blocked)[0]} is not allowed")
+
+        if self.tables is not None:
+            for relation in stmt.relations:
+                schema, _, table = relation.rpartition(".")
+                if relation in stmt.ctes or (schema in ("", "public") and table in self.tables):
+                    continue
+                self._reject(f"Table {relation} is not allowed")
+
+        return stmt
+
+    def prepare(self, sql: str, max_rows: Optional[int] = None) -> str:
+        """Checked SQL with a row cap on the statement (0 = none) and, if configured, its row sources."""
+        stmt = self.check(sql)
+        max_rows = self.max_rows if max_rows is None else max_rows
+
+        edits = []
+        if max_rows:
+            edits += stmt.limit_edits(stmt.root, max_rows)
+        if self.subquery_rows:
+            for scope in stmt.scopes:
+                if scope.role in ("cte", "from"):
+                    edits += stmt.limit_edits(scope, self.subquery_rows)
+
+        if edits:
+            self._count("limited")
+        return _apply(sql[:stmt.tokens[stmt.end - 1][3]], edits)
+
+    # ----------------------
+    # ADMISSION
+    # ----------------------
+    def explain(self, cur, sql: str) -> dict:
+        started = time.perf_counter()
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+        row = cur.fetchone()
+        plan = next(iter(row.values())) if isinstance(row, dict) else row[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self._count("explained")
+        self._count("explain_ms_total", (time.perf_counter() - started) * 1000)
+        top = plan[0]["Plan"]
+        return {"cost": top["Total Cost"], "rows": top["Plan Rows"]}
+
+    def admit(self, cur, sql: str) -> dict:
+        """
+        Must run first in the transaction that executes sql: read-only mode
+        can only be set before any query, and SET LOCAL ends with it.
+        """
+        if self.read_only:
+            cur.execute("SET TRANSACTION READ ONLY")
+
+        decision = {"cost": None, "rows": None, "timeout_ms": self.timeout_ms, "downgraded": False}
+        if self.max_cost or self.soft_cost or self.max_plan_rows:
+            decision.update(self.explain(cur, sql))
+            if self.max_cost and decision["cost"] > self.max_cost:
+                self._count("rejected_by_cost")
+                self._reject(f"Estimated cost {decision['cost']:.0f} exceeds the budget of {self.max_cost:.0f}")
+            if self.max_plan_rows and decision["rows"] > self.max_plan_rows:
+                self._count("rejected_by_cost")
+                self._reject(f"Estimated {decision['rows']:.0f} rows exceed the budget of {self.max_plan_rows:.0f}")
+            if self.soft_cost and decision["cost"] > self.soft_cost:
+                self._count("downgraded")
+                decision.update(timeout_ms=self.downgrade_timeout_ms, downgraded=True)
+
+        cur.execute(f"SET LOCAL statement_timeout = {int(decision['timeout_ms'])}")
+        return decision
+
+    def execute(self, conn, sql: str, max_rows: Optional[int] = None, **cursor_kwargs) -> list:
+        """prepare + admit + fetchall; the caller owns (and ends) the transaction."""
+        sql = self.prepare(sql, max_rows)
+        with conn.cursor(**cursor_kwargs) as cur:
+            self.admit(cur, sql)
+            cur.execute(sql)
+            return cur.fetchall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["explain_ms_avg"] = s["explain_ms_total"] / (s["explained"] or 1)
+        return s
+
+
+# =========================
+# SELF-CHECK
+# =========================
+# python -m app.core.sql_guard   (or python sql_guard.py from the notebooks)
+_ACCEPTED = [
+    "SELECT * FROM sales",
+    "SELECT * FROM sales LIMIT 5000 OFFSET 10",
+    "SELECT * FROM (SELECT * FROM sales LIMIT 5) s",
+    "WITH x AS (SELECT customer_id FROM sales GROUP BY 1) SELECT * FROM x",
+    "SELECT * FROM (sales JOIN sales_items USING (voucher_no))",
+    "SELECT * FROM sales s JOIN ((SELECT * FROM sales_items) i CROSS JOIN customers) ON s.voucher_no = i.voucher_no",
+    "SELECT * FROM sales WHERE (customer_id, total_amount) IN ((1, 2))",
+    "SELECT n FROM generate_series(1, 3) AS g(n)",
+]
+_REJECTED = [
+    "DELETE FROM sales",
+    "SELECT 1; DROP TABLE sales",
+    "SELECT pg_sleep(10)",
+    "SELECT * FROM pg_authid",
+    "SELECT * FROM sales FOR SHARE",
+    "SELECT * FROM (sales JOIN pg_authid ON true)",
+    "SELECT * FROM sales, (pg_authid CROSS JOIN sales) x",
+    "SELECT * FROM sales JOIN ((sales_items JOIN pg_authid ON true)) ON true",
+    "SELECT * FROM (sales JOIN (SELECT * FROM pg_authid) a ON true)",
+    "SELECT query_to_xml('select * from pg_authid', true, false, '')",
+    "SELECT * FROM sales t, LATERAL query_to_xml('select usename, passwd from pg_shadow',true,false,'') x",
+    "SELECT pg_catalog.query_to_xml_and_xmlschema('select 1', true, false, '')",
+    "SELECT table_to_xml('chat_history', true, false, '')",
+    "SELECT \"table_to_xmlschema\"('chat_history', true, false, '')",
+    "SELECT cursor_to_xml('c', 10, true, false, '')",
+    "SELECT schema_to_xml('public', true, false, '')",
+    "SELECT database_to_xml(true, false, '')",
+    "SELECT current_setting('data_directory')",
+]
+
+
+def self_check() -> int:
+    guard = SQLGuard(tables={"sales", "sales_items", "customers"})
+    failures = 0
+    for sql, expected in [(q, True) for q in _ACCEPTED] + [(q, False) for q in _REJECTED]:
+        try:
+            guard.check(sql)
+            accepted = True
+        except SQLRejected:
+            accepted = False
+        if accepted != expected:
+            failures += 1
+            print(f"❌ {'rejected' if expected else 'accepted'}: {sql}")
+    total = len(_ACCEPTED) + len(_REJECTED)
+    print(f"{'✅' if not failures else '❌'} {total - failures}/{total} statements handled as expected")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(self_check())
@@ -0,0 +1,169 @@
+# app/core/startup.py
+#
+# Lazy clients and the warm-up that main.py runs from its lifespan.
+# Importing the app builds nothing that talks to the network: each client
+# is a Lazy created on first use, and warm-up creates them all in parallel
+# in the background. /livez answers as soon as the worker listens; /readyz
+# turns 200 once every warm-up step has succeeded, and names the ones that
+# have not.
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# =========================
+# ENV
+# =========================
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "30"))
+# how often /readyz may re-run failed steps while the worker is not ready
+READINESS_RETRY_SECONDS = float(os.getenv("READINESS_RETRY_SECONDS", "5"))
+
+logger = logging.getLogger("app.core.startup")
+
+_UNSET = object()
+
+
+# =========================
+# LAZY CLIENTS
+# =========================
+class Lazy:
+    """
+    Stands in for the object `factory()` returns and creates it on first
+    attribute access, once, under a lock. A factory that raises is not
+    remembered: the next access tries again.
+    """
+
+    def __init__(self, factory, name: str = ""):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "lazy")
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        state = "unset" if self._value is _UNSET else repr(self._value)
+        return f"<Lazy {self._name}: {state}>"
+
+
+def resolve(obj):
+    """The object behind a Lazy (created now if needed); anything else as is."""
+    return obj._resolve() if isinstance(obj, Lazy) else obj
+
+
+def is_initialized(obj) -> bool:
+    return not isinstance(obj, Lazy) or obj._value is not _UNSET
+
+
+# =========================
+# WARM-UP / READINESS
+# =========================
+class Readiness:
+    """
+    Named warm-up steps run in parallel, each recorded as ready or with
+    its error. Steps that failed or timed out are re-run by check(), at
+    most every retry_seconds, so a worker that started before its
+    database did becomes ready without a restart.
+    """
+
+    def __init__(self, steps: dict, timeout: float = STARTUP_WARMUP_TIMEOUT,
+                 retry_seconds: float = READINESS_RETRY_SECONDS):
+        self.steps = steps
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+
+        self._created = time.perf_counter()
+        self._lock = threading.Lock()
+        self._running = set()
+        self._attempted_at = None
+        self._thread = None
+        self.ready_seconds = None  # creation → every step ready
+        self.components = {
+            name: {"ready": False, "seconds": None, "error": "pending"} for name in steps
+        }
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(c["ready"] for c in self.components.values())
+
+    def start(self):
+        """Warm up on a background thread; returns at once."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.warm_up, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def warm_up(self, names=None) -> bool:
+        """Run `names` (default: every step not ready yet) in parallel; True if all are ready after."""
+        with self._lock:
+            self._attempted_at = time.monotonic()
+            todo = [
+                n for n in (names or self.steps)
+                if not self.components[n]["ready"] and n not in self._running
+            ]
+            self._running.update(todo)
+        if todo:
+            self._run(todo)
+
+        ready = self.ready
+        if ready and self.ready_seconds is None:
+            self.ready_seconds = time.perf_counter() - self._created
+            logger.info("ready in %.3fs", self.ready_seconds)
+        return ready
+
+    def _run(self, names: list):
+        # not a `with` block: a hung step must not hold up the others' results
+        executor = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="warm-up")
+        futures = {executor.submit(self._step, n): n for n in names}
+        _, pending = wait(futures, timeout=self.timeout)
+        executor.shutdown(wait=False)
+        for future in pending:
+            name = futures[future]
+            with self._lock:
+                self.components[name].update(ready=False, error=f"timed out after {self.timeout}s")
+            logger.warning("warm-up step %s timed out after %ss", name, self.timeout)
+
+    def _step(self, name: str):
+        started = time.perf_counter()
+        try:
+            self.steps[name]()
+            result = {"ready": True, "error": None}
+        except Exception as e:
+            result = {"ready": False, "error": f"{type(e).__name__}: {str(e).strip()}"}
+            logger.warning("warm-up step %s failed: %s", name, result["error"])
+        result["seconds"] = round(time.perf_counter() - started, 4)
+        with self._lock:
+            self.components[name].update(result)
+            self._running.discard(name)
+
+    def check(self) -> dict:
+        """Readiness report; re-runs failed steps in the background if it is time to."""
+        with self._lock:
+            due = (
+                self._attempted_at is not None
+                and time.monotonic() - self._attempted_at >= self.retry_seconds
+            )
+        if due and not self.ready:
+            self.start()
+        return self.report()
+
+    def report(self) -> dict:
+        with self._lock:
+            components = {name: dict(c) for name, c in self.components.items()}
+        return {
+            "ready": all(c["ready"] for c in components.values()),
+            "ready_seconds": round(self.ready_seconds, 4) if self.ready_seconds is not None else None,
+            "components": components,
+        }
@@ -8,3 +8,5 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 
 CONNECTOR_NAME = os.getenv("CONNECTOR_NAME", "tally-connector")
 CONNECTOR_VERSION = os.getenv("CONNECTOR_VERSION", "v1")
+
+STAGING_BATCH_SIZE = int(os.getenv("STAGING_BATCH_SIZE", "1000"))
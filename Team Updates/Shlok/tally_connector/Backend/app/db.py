@@ -1,66 +1,140 @@
-import psycopg2
+import time
 
-from app.config import DATABASE_URL
+from psycopg2.extras import execute_values
+
+from app.config import DATABASE_URL, STAGING_BATCH_SIZE
+from app.core.db_pool import get_pool
 
 
 def get_connection():
-    return psycopg2.connect(DATABASE_URL)
+    """Pooled connection; commits on exit, rolls back on error."""
+    return get_pool(DATABASE_URL).connection()
 
 
 def insert_raw_payload(ingestion_id, company_id, entity_type, payload):
-    conn = get_connection()
-    cur = conn.cursor()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO raw_tally_ingestion
+            (ingestion_id, company_id, entity_type, fetched_at, payload, source)
+            VALUES (%s, %s, %s, now(), %s, %s)
+            """,
+            (ingestion_id, company_id, entity_type, payload, "tally")
+        )
 
-    cur.execute(
-        """
-        INSERT INTO raw_tally_ingestion
-        (ingestion_id, company_id, entity_type, fetched_at, payload, source)
-        VALUES (%s, %s, %s, now(), %s, %s)
-        """,
-        (ingestion_id, company_id, entity_type, payload, "tally")
-    )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def insert_audit_log(upload_id, message):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO upload_audit_logs
+            (audit_id, upload_id, message)
+            VALUES (gen_random_uuid(), %s, %s)
+            """,
+            (upload_id, message)
+        )
 
 
-def insert_audit_log(upload_id, message):
-    conn = get_connection()
-    cur = conn.cursor()
+def write_upload(upload_id, company_id, entity_type, payload, vouchers, audit_messages,
+                 batch_size=STAGING_BATCH_SIZE):
+    """
+    Raw payload, staged vouchers and audit trail for one upload in a
+    single transaction: either the whole upload is visible or none of it.
 
-    cur.execute(
-        """
-        INSERT INTO upload_audit_logs
-        (audit_id, upload_id, message)
-        VALUES (gen_random_uuid(), %s, %s)
-        """,
-        (upload_id, message)
-    )
+    `vouchers` may be any iterable (e.g. a streaming parser); rows are
+    sent in multi-row INSERT pages of `batch_size`. `payload` may be a
+    callable, evaluated once the vouchers are consumed (e.g. to reference
+    a raw blob whose hash is only known at the end of the stream).
+    """
+    counter = {"rows": 0, "items": 0}
+    items = []
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    def flush_items(item_cur):
+        execute_values(
+            item_cur,
+            """
+            INSERT INTO staged_voucher_items
+            (upload_id, voucher_no, stock_item, quantity, amount, brand, sub_category, category)
+            VALUES %s
+            """,
+            items,
+            page_size=batch_size
+        )
+        counter["items"] += len(items)
+        items.clear()
 
+    def rows(item_cur):
+        for v in vouchers:
+            counter["rows"] += 1
+            for e in v.get("inventory_entries") or ():
+                items.append((
+                    upload_id, v["voucher_no"], e["stock_item"], e["quantity"], e["amount"],
+                    e.get("brand"), e.get("sub_category"), e.get("category")
+                ))
+            # items go out on a second cursor of the same transaction, so
+            # memory stays at one page however large the upload
+            if len(items) >= batch_size:
+                flush_items(item_cur)
+            yield (upload_id, v["voucher_no"], v["voucher_date"], v["amount"])
 
-def insert_staged_voucher(upload_id, voucher):
-    conn = get_connection()
-    cur = conn.cursor()
+    started = time.perf_counter()
 
+    with get_connection() as conn, conn.cursor() as cur, conn.cursor() as item_cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO staged_vouchers
+            (id, upload_id, voucher_no, voucher_date, amount)
+            VALUES %s
+            """,
+            rows(item_cur),
+            template="(gen_random_uuid(), %s, %s, %s, %s)",
+            page_size=batch_size
+        )
+        if items:
+            flush_items(item_cur)
+
+        cur.execute(
+            """
+            INSERT INTO raw_tally_ingestion
+            (ingestion_id, company_id, entity_type, fetched_at, payload, source)
+            VALUES (%s, %s, %s, now(), %s, %s)
+            """,
+            (upload_id, company_id, entity_type, payload() if callable(payload) else payload, "tally")
+        )
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            "rows": counter["rows"],
+            "items": counter["items"],
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(counter["rows"] / elapsed, 1) if elapsed else None
+        }
+
+        messages = list(audit_messages) + [
+            "Raw payload stored in DB",
+            f"Staging tables populated: {stats['rows']} rows, {stats['items']} items "
+            f"in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)"
+        ]
+        execute_values(
+            cur,
+            "INSERT INTO upload_audit_logs (audit_id, upload_id, message) VALUES %s",
+            [(upload_id, m) for m in messages],
+            template="(gen_random_uuid(), %s, %s)"
+        )
+
+        bump_data_version(cur)
+
+    return stats
+
+
+def bump_data_version(cur):
+    """Invalidate chat-side caches; see schema.sql (data_version)."""
     cur.execute(
         """
-        INSERT INTO staged_vouchers
-        (id, upload_id, voucher_no, voucher_date, amount)
-        VALUES (gen_random_uuid(), %s, %s, %s, %s)
-        """,
-        (
-            upload_id,
-            voucher["voucher_no"],
-            voucher["voucher_date"],
-            voucher["amount"]
-        )
+        INSERT INTO data_version (id, version, updated_at)
+        VALUES (1, 1, now())
+        ON CONFLICT (id) DO UPDATE
+        SET version = data_version.version + 1, updated_at = now()
+        """
     )
-
-    conn.commit()
-    cur.close()
-    conn.close()
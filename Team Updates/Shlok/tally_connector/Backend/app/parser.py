@@ -1,15 +1,63 @@
+import io
 import xml.etree.ElementTree as ET
 
+# Mock Tally uses LEDGERENTRIES/LEDGERENTRY; real exports use *.LIST tags
+LEDGER_ENTRY_TAGS = ("LEDGERENTRY", "ALLLEDGERENTRIES.LIST", "LEDGERENTRIES.LIST")
+INVENTORY_ENTRY_TAGS = ("INVENTORYENTRY", "ALLINVENTORYENTRIES.LIST", "INVENTORYENTRIES.LIST")
 
-def parse_tally_vouchers(xml_string: str):
-    root = ET.fromstring(xml_string)
-    vouchers = []
 
-    for v in root.findall(".//VOUCHER"):
-        vouchers.append({
-            "voucher_no": v.findtext("VOUCHERNUMBER"),
-            "voucher_date": v.findtext("DATE"),
-            "amount": v.findtext("AMOUNT"),
-        })
+def _voucher_to_dict(v):
+    entries = []
+    for tag in LEDGER_ENTRY_TAGS:
+        for e in v.iter(tag):
+            entries.append({
+                "ledger_name": e.findtext("LEDGERNAME"),
+                "amount": e.findtext("AMOUNT"),
+            })
+
+    items = []
+    for tag in INVENTORY_ENTRY_TAGS:
+        for e in v.iter(tag):
+            items.append({
+                "stock_item": e.findtext("STOCKITEMNAME"),
+                "quantity": e.findtext("ACTUALQTY") or e.findtext("BILLEDQTY"),
+                "amount": e.findtext("AMOUNT"),
+            })
+
+    return {
+        "voucher_no": v.findtext("VOUCHERNUMBER"),
+        "voucher_date": v.findtext("DATE"),
+        "voucher_type": v.findtext("VOUCHERTYPENAME"),
+        "amount": v.findtext("AMOUNT"),
+        "ledger_entries": entries,
+        "inventory_entries": items,
+    }
+
+
+def iter_tally_vouchers(source):
+    """
+    Yield one voucher dict at a time from a file-like object (e.g. a
+    streamed HTTP body) or path.
+
+    Each finished <VOUCHER> is detached from its parent once yielded, so
+    peak memory is one voucher regardless of export size.
+    """
+    stack = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
 
-    return vouchers
+        stack.pop()
+        if elem.tag != "VOUCHER":
+            continue
+
+        yield _voucher_to_dict(elem)
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def parse_tally_vouchers(xml_string: str):
+    return list(iter_tally_vouchers(io.BytesIO(xml_string.encode("utf-8"))))
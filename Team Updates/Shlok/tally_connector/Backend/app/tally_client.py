@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 import requests
 from app.config import TALLY_URL
 
@@ -11,3 +13,45 @@ def send_request(xml_request: str) -> str:
     )
     response.raise_for_status()
     return response.text
+
+
+@contextmanager
+def stream_request(xml_request: str):
+    """
+    Yield the response body as a raw, unbuffered file-like object so
+    large exports can be parsed while they download.
+    """
+    response = requests.post(
+        TALLY_URL,
+        data=xml_request.encode("utf-8"),
+        headers={"Content-Type": "application/xml"},
+        timeout=30,
+        stream=True
+    )
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        yield response.raw
+    finally:
+        response.close()
+
+
+class TeeReader:
+    """File-like wrapper that copies everything read into `sink`."""
+
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        if chunk:
+            self.sink.write(chunk)
+            self.bytes_read += len(chunk)
+        return chunk
+
+    def drain(self, size=1 << 16):
+        """Copy whatever the consumer left unread (trailing XML) into `sink`."""
+        while self.read(size):
+            pass
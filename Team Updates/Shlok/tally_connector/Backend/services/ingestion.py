@@ -1,69 +1,79 @@
-import os
 import uuid
 import json
 from datetime import datetime, timezone
 
-from app.tally_client import send_request
-from app.parser import parse_tally_vouchers
-from app.db import (
-    insert_raw_payload,
-    insert_audit_log,
-    insert_staged_voucher
-)
+from app.tally_client import stream_request, TeeReader
+from app.parser import iter_tally_vouchers
+from app.db import insert_audit_log, write_upload
 from app.config import CONNECTOR_NAME, CONNECTOR_VERSION
+from app.core.product_classifier import classify_product
+from app.core.raw_store import get_store
 
-RAW_STORAGE_PATH = "storage/raw"
-os.makedirs(RAW_STORAGE_PATH, exist_ok=True)
+
+def classify_items(vouchers):
+    """Tag each inventory line with brand / sub_category / category."""
+    for v in vouchers:
+        for item in v.get("inventory_entries") or ():
+            item.update(classify_product(item["stock_item"]))
+        yield v
 
 
 def ingest(entity_type, request_type, xml_request):
     upload_id = str(uuid.uuid4())
     company_id = str(uuid.uuid4())
 
-    insert_audit_log(upload_id, "Ingestion started")
-
-    # Fetch XML from Tally / Mock
-    xml_response = send_request(xml_request)
-    insert_audit_log(upload_id, "XML received")
+    # Audit entries are written with the upload, in the same transaction
+    audit = ["Ingestion started"]
 
-    # Save raw XML file (IMMUTABLE)
-    file_path = f"{RAW_STORAGE_PATH}/{upload_id}.xml"
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(xml_response)
+    try:
+        # Build envelope
+        envelope = {
+            "connector": {
+                "name": CONNECTOR_NAME,
+                "version": CONNECTOR_VERSION
+            },
+            "company_id": company_id,
+            "entity_type": entity_type,
+            "request_type": request_type,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            # filled with the content-addressed blob reference (see raw_store.py)
+            "raw": None
+        }
 
-    insert_audit_log(upload_id, "Raw XML stored to filesystem")
+        # Stream XML from Tally / Mock: the body is hashed and compressed
+        # into the raw store (IMMUTABLE, deduplicated) and parsed voucher
+        # by voucher straight into staging
+        with stream_request(xml_request) as body, get_store().writer() as blob:
+            audit.append("XML stream opened")
+            tee = TeeReader(body, blob)
 
-    # Build envelope
-    envelope = {
-        "connector": {
-            "name": CONNECTOR_NAME,
-            "version": CONNECTOR_VERSION
-        },
-        "company_id": company_id,
-        "entity_type": entity_type,
-        "request_type": request_type,
-        "fetched_at": datetime.now(timezone.utc).isoformat(),
-        "raw_xml_path": file_path
-    }
+            def raw_payload():
+                tee.drain()
+                envelope["raw"] = blob.commit()
+                return json.dumps(envelope)
 
-    insert_raw_payload(
-        ingestion_id=upload_id,
-        company_id=company_id,
-        entity_type=entity_type,
-        payload=json.dumps(envelope)
-    )
+            stats = write_upload(
+                upload_id=upload_id,
+                company_id=company_id,
+                entity_type=entity_type,
+                payload=raw_payload,
+                vouchers=classify_items(iter_tally_vouchers(tee)),
+                audit_messages=audit + [
+                    "Raw XML streamed to content store",
+                ]
+            )
 
-    insert_audit_log(upload_id, "Raw payload stored in DB")
-
-    # Parse XML → staging
-    vouchers = parse_tally_vouchers(xml_response)
-    for v in vouchers:
-        insert_staged_voucher(upload_id, v)
-
-    insert_audit_log(upload_id, "Staging tables populated")
+    except Exception as e:
+        insert_audit_log(upload_id, f"Ingestion failed after '{audit[-1]}': {e}")
+        raise
 
     return {
         "status": "success",
         "upload_id": upload_id,
-        "entity_type": entity_type
+        "entity_type": entity_type,
+        "staged_rows": stats["rows"],
+        "staged_items": stats["items"],
+        "rows_per_sec": stats["rows_per_sec"],
+        "raw_sha256": envelope["raw"]["sha256"],
+        "raw_deduped": envelope["raw"]["deduped"]
     }
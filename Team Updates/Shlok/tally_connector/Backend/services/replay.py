@@ -0,0 +1,320 @@
+# Rebuild the staging tables from the raw payloads already on disk.
+#
+# Every voucher upload in raw_tally_ingestion is re-parsed from its raw
+# blob (app/core/raw_store.py, or the legacy storage/raw/<upload_id>.xml)
+# in a process pool and COPY-loaded into shadow copies of staged_vouchers /
+# staged_voucher_items. Each upload is checkpointed in the same transaction
+# as its rows, so an interrupted run resumes where it stopped. When every
+# upload has landed, the live tables are refilled from the shadows in one
+# transaction; they are never dropped, so their grants, row-level security
+# policies, dependent views and indexes stay as they are.
+#
+#   python -m app.services.replay                   # fresh run, then swap
+#   python -m app.services.replay --resume          # continue an interrupted run
+#   python -m app.services.replay --workers 8 --no-swap
+
+import io
+import json
+import sys
+import time
+import uuid
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+from psycopg2 import sql
+
+from app.config import DATABASE_URL
+from app.parser import iter_tally_vouchers
+from app.db import bump_data_version
+from app.services.ingestion import classify_items
+from app.core.raw_store import get_store
+
+# live table -> (shadow table, COPY columns)
+TABLES = {
+    "staged_vouchers": (
+        "staged_vouchers__replay",
+        ("id", "upload_id", "voucher_no", "voucher_date", "amount"),
+    ),
+    "staged_voucher_items": (
+        "staged_voucher_items__replay",
+        ("upload_id", "voucher_no", "stock_item", "quantity", "amount", "brand", "sub_category", "category"),
+    ),
+}
+
+# Flush a COPY once its buffer holds this much text; bounds worker memory
+COPY_BUFFER_BYTES = 8 << 20
+
+# Only uploads made by ingest() (they carry an audit trail) are replayed;
+# the connector's delta-sync envelopes never went through staging.
+UPLOADS_SQL = """
+    SELECT r.ingestion_id::text, r.payload
+    FROM raw_tally_ingestion r
+    WHERE r.entity_type = 'voucher'
+      AND (r.payload ? 'raw' OR r.payload ? 'raw_xml_path')
+      AND EXISTS (SELECT 1 FROM upload_audit_logs a WHERE a.upload_id = r.ingestion_id)
+    ORDER BY r.fetched_at
+"""
+
+
+def _connect(dsn):
+    conn = psycopg2.connect(dsn)
+    conn.set_client_encoding("UTF8")
+    # bulk loads and index builds outlive the pool's statement_timeout
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = 0")
+    conn.commit()
+    return conn
+
+
+def _source(payload):
+    """Blob reference (or legacy file path) of one raw envelope."""
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return payload.get("raw") or {"path": payload["raw_xml_path"]}
+
+
+@contextmanager
+def _open_source(source):
+    if source.get("sha256"):
+        with get_store().open(source) as stream:
+            yield stream
+    else:
+        with open(source["path"], "rb") as f:
+            yield f
+
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class _CopyBuffer:
+    """Tab-separated COPY text for one shadow table, flushed in chunks."""
+
+    def __init__(self, cur, live):
+        self.cur = cur
+        self.shadow, self.columns = TABLES[live]
+        self.buf = io.StringIO()
+        self.rows = 0
+
+    def add(self, row):
+        self.buf.write("\t".join(_copy_value(v) for v in row))
+        self.buf.write("\n")
+        self.rows += 1
+        if self.buf.tell() >= COPY_BUFFER_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self.buf.tell():
+            return
+        self.buf.seek(0)
+        self.cur.copy_expert(
+            sql.SQL("COPY {} ({}) FROM STDIN").format(
+                sql.Identifier(self.shadow),
+                sql.SQL(", ").join(map(sql.Identifier, self.columns))
+            ).as_string(self.cur),
+            self.buf
+        )
+        self.buf = io.StringIO()
+
+
+# =========================
+# WORKER
+# =========================
+_worker_conn = None
+
+
+def replay_upload(upload_id, source, dsn):
+    """Re-parse one upload into the shadow tables and checkpoint it (worker process)."""
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        _worker_conn = _connect(dsn)
+
+    started = time.perf_counter()
+    with _worker_conn, _worker_conn.cursor() as cur:
+        vouchers = _CopyBuffer(cur, "staged_vouchers")
+        items = _CopyBuffer(cur, "staged_voucher_items")
+
+        with _open_source(source) as stream:
+            for v in classify_items(iter_tally_vouchers(stream)):
+                vouchers.add((str(uuid.uuid4()), upload_id, v["voucher_no"], v["voucher_date"], v["amount"]))
+                for e in v.get("inventory_entries") or ():
+                    items.add((
+                        upload_id, v["voucher_no"], e["stock_item"], e["quantity"], e["amount"],
+                        e.get("brand"), e.get("sub_category"), e.get("category")
+                    ))
+        vouchers.flush()
+        items.flush()
+
+        seconds = time.perf_counter() - started
+        cur.execute(
+            """
+            INSERT INTO replay_checkpoints (upload_id, vouchers, items, seconds)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (upload_id, vouchers.rows, items.rows, seconds)
+        )
+
+    return {"upload_id": upload_id, "vouchers": vouchers.rows, "items": items.rows,
+            "seconds": round(seconds, 3)}
+
+
+# =========================
+# SHADOW TABLES
+# =========================
+def _shadow_exists(cur):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (TABLES["staged_vouchers"][0],))
+    return cur.fetchone()[0]
+
+
+def prepare_shadow(conn):
+    """Fresh, index-less shadow tables and an empty checkpoint table."""
+    with conn, conn.cursor() as cur:
+        for live, (shadow, _) in TABLES.items():
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(shadow)))
+            # no indexes: only the live tables' are needed, and they are
+            # maintained by the INSERT in swap()
+            cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL EXCLUDING INDEXES)").format(
+                sql.Identifier(shadow), sql.Identifier(live)))
+        cur.execute("TRUNCATE replay_checkpoints")
+
+
+def swap(conn, lock_timeout_ms=10000):
+    """
+    Replace the live staging tables' rows with the shadows' in one
+    transaction (TRUNCATE + INSERT ... SELECT). Uploads without a
+    checkpoint (ingested during the replay, or failed with --keep-failed)
+    keep their current rows.
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout_ms,))
+        cur.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(
+            sql.SQL(", ").join(map(sql.Identifier, TABLES))))
+
+        carried = 0
+        for live, (shadow, _) in TABLES.items():
+            cur.execute(sql.SQL(
+                """
+                INSERT INTO {shadow} SELECT * FROM {live} s
+                WHERE NOT EXISTS (SELECT 1 FROM replay_checkpoints c WHERE c.upload_id = s.upload_id)
+                """).format(shadow=sql.Identifier(shadow), live=sql.Identifier(live)))
+            carried += cur.rowcount
+
+        # one TRUNCATE for both tables, in case one references the other
+        cur.execute(sql.SQL("TRUNCATE {}").format(sql.SQL(", ").join(map(sql.Identifier, TABLES))))
+        for live, (shadow, _) in TABLES.items():
+            cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM {}").format(
+                sql.Identifier(live), sql.Identifier(shadow)))
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(shadow)))
+            cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(live)))
+
+        cur.execute("TRUNCATE replay_checkpoints")
+        bump_data_version(cur)
+
+    return carried
+
+
+# =========================
+# RUN
+# =========================
+def run(workers=None, resume=False, do_swap=True, keep_failed=False, dsn=DATABASE_URL):
+    if not dsn:
+        raise RuntimeError("DATABASE_URL not set")
+    started = time.perf_counter()
+
+    conn = _connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            resumable = _shadow_exists(cur)
+        if resume and not resumable:
+            print("No interrupted replay found; starting fresh")
+        if not (resume and resumable):
+            prepare_shadow(conn)
+
+        with conn, conn.cursor() as cur:
+            cur.execute(UPLOADS_SQL)
+            uploads = [(upload_id, _source(payload)) for upload_id, payload in cur.fetchall()]
+            cur.execute("SELECT upload_id::text FROM replay_checkpoints")
+            done = {row[0] for row in cur.fetchall()}
+
+        todo = [(upload_id, source) for upload_id, source in uploads if upload_id not in done]
+        print(f"Replaying {len(todo)} of {len(uploads)} uploads ({len(done)} already checkpointed)")
+
+        results, failed = [], []
+        if todo:
+            # spawn, not fork: children must not inherit the parent's connection
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = {
+                    pool.submit(replay_upload, upload_id, source, dsn): upload_id
+                    for upload_id, source in todo
+                }
+                for future in as_completed(futures):
+                    upload_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed.append({"upload_id": upload_id, "error": str(e)})
+                        print(f"❌ {upload_id}: {e}")
+                        continue
+                    results.append(result)
+                    rate = result["vouchers"] / result["seconds"] if result["seconds"] else 0
+                    print(f"✅ {upload_id}: {result['vouchers']} vouchers, {result['items']} items "
+                          f"in {result['seconds']}s ({rate:.0f} vouchers/s)")
+
+        parse_seconds = time.perf_counter() - started
+        summary = {
+            "uploads": len(uploads),
+            "replayed": len(results),
+            "resumed": len(done),
+            "failed": failed,
+            "vouchers": sum(r["vouchers"] for r in results),
+            "items": sum(r["items"] for r in results),
+            "swapped": False,
+            "carried_rows": 0,
+        }
+        records = summary["vouchers"] + summary["items"]
+        summary["records_per_sec"] = round(records / parse_seconds, 1) if parse_seconds else None
+
+        if do_swap and (keep_failed or not failed):
+            summary["carried_rows"] = swap(conn)
+            summary["swapped"] = True
+    finally:
+        conn.close()
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse raw voucher uploads into fresh staging tables.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted replay")
+    parser.add_argument("--no-swap", action="store_true", help="load the shadow tables but keep the live ones")
+    parser.add_argument("--keep-failed", action="store_true",
+                        help="swap even if some uploads failed; they keep their current rows")
+    args = parser.parse_args(argv)
+
+    summary = run(args.workers, args.resume, not args.no_swap, args.keep_failed)
+    print(
+        f"\n✅ {summary['replayed']} replayed, {summary['resumed']} resumed, "
+        f"{len(summary['failed'])} failed of {summary['uploads']} uploads: "
+        f"{summary['vouchers']} vouchers, {summary['items']} items "
+        f"({summary['records_per_sec']} records/s) in {summary['seconds']}s"
+    )
+    if summary["swapped"]:
+        print(f"✅ Staging tables swapped in ({summary['carried_rows']} rows carried over)")
+    elif summary["failed"]:
+        print("❌ Not swapped: fix the failed uploads and rerun with --resume (or --keep-failed)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
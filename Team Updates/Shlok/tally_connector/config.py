@@ -1,4 +1,5 @@
 import os
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,3 +11,30 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 CONNECTOR_NAME = "tally-connector"
 CONNECTOR_VERSION = "v1"
 SOURCE = "tally-http-xml"
+
+# Company name as shown in Tally (SVCURRENTCOMPANY); empty → Tally's active company
+TALLY_COMPANY = os.getenv("TALLY_COMPANY", "")
+
+
+def company_id_for(url, company):
+    # Stable per company so watermarks and upserts line up across runs
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"tally:{url}/{company}"))
+
+
+COMPANY_ID = os.getenv("COMPANY_ID") or company_id_for(TALLY_URL, TALLY_COMPANY)
+
+# Several companies: "Company A=http://host1:9000,Company B=http://host2:9000"
+# (a bare name uses TALLY_URL). Empty → the single TALLY_COMPANY above.
+TALLY_COMPANIES = os.getenv("TALLY_COMPANIES", "")
+
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "1000"))
+
+# Fetch scheduler (scheduler.py)
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "8"))
+TALLY_HOST_CONCURRENCY = int(os.getenv("TALLY_HOST_CONCURRENCY", "2"))
+SYNC_CHUNK_DAYS = int(os.getenv("SYNC_CHUNK_DAYS", "30"))
+SYNC_MAX_RETRIES = int(os.getenv("SYNC_MAX_RETRIES", "3"))
+SYNC_RETRY_BACKOFF = float(os.getenv("SYNC_RETRY_BACKOFF", "1.0"))
+# First-run start date (ISO) so the initial export can be chunked; empty → one unbounded request
+SYNC_HISTORY_START = os.getenv("SYNC_HISTORY_START", "")
+TALLY_TIMEOUT = float(os.getenv("TALLY_TIMEOUT", "30"))
@@ -1,14 +1,13 @@
-import psycopg2
+import json
 import uuid
-from config import DATABASE_URL
+from psycopg2.extras import execute_values
+from config import DATABASE_URL, SYNC_BATCH_SIZE
+from app.core.db_pool import get_pool
 
 def get_connection():
-    return psycopg2.connect(DATABASE_URL)
+    return get_pool(DATABASE_URL).connection()
 
 def insert_raw_payload(company_id, entity_type, payload):
-    conn = get_connection()
-    cur = conn.cursor()
-
     query = """
     INSERT INTO raw_tally_ingestion (
         ingestion_id,
@@ -21,17 +20,118 @@ def insert_raw_payload(company_id, entity_type, payload):
     VALUES (%s, %s, %s, NOW(), %s, %s)
     """
 
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            query,
+            (
+                str(uuid.uuid4()),
+                company_id,
+                entity_type,
+                payload,
+                "tally"
+            )
+        )
+        bump_data_version(cur)
+
+def bump_data_version(cur):
     cur.execute(
-        query,
-        (
-            str(uuid.uuid4()),
-            company_id,
-            entity_type,
-            payload,
-            "tally"
+        """
+        INSERT INTO data_version (id, version, updated_at)
+        VALUES (1, 1, now())
+        ON CONFLICT (id) DO UPDATE
+        SET version = data_version.version + 1, updated_at = now()
+        """
+    )
+
+def get_watermark(company_id, entity_type):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT last_voucher_date, last_alter_id, last_synced_at
+            FROM tally_sync_watermarks
+            WHERE company_id = %s AND entity_type = %s
+            """,
+            (company_id, entity_type)
         )
+        row = cur.fetchone()
+
+    if row is None:
+        return None
+    return {
+        "last_voucher_date": row[0],
+        "last_alter_id": row[1],
+        "last_synced_at": row[2],
+    }
+
+def apply_sync(company_id, entity_type, envelope, records, watermark):
+    """
+    Store one delta in a single transaction: the upserted records, the
+    advanced watermark and (if anything changed) the raw envelope.
+
+    records: [(record_key, alter_id, record_date, payload_dict), ...]
+    A record only replaces the stored one when its ALTERID is newer, so
+    re-running a window (or the lookback overlap) changes nothing.
+    watermark=None leaves the watermark alone (chunked syncs advance it
+    once every chunk has landed).
+    Returns the number of inserted or updated records.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        changed = []
+        if records:
+            changed = execute_values(
+                cur,
+                """
+                INSERT INTO tally_records
+                    (company_id, entity_type, record_key, alter_id, record_date, payload)
+                VALUES %s
+                ON CONFLICT (company_id, entity_type, record_key) DO UPDATE
+                SET alter_id = EXCLUDED.alter_id,
+                    record_date = EXCLUDED.record_date,
+                    payload = EXCLUDED.payload,
+                    synced_at = now()
+                WHERE tally_records.alter_id < EXCLUDED.alter_id
+                RETURNING record_key
+                """,
+                [
+                    (company_id, entity_type, key, alter_id, record_date, json.dumps(payload))
+                    for key, alter_id, record_date, payload in records
+                ],
+                page_size=SYNC_BATCH_SIZE,
+                fetch=True
+            )
+
+        if watermark is not None:
+            _upsert_watermark(cur, company_id, entity_type, watermark)
+
+        if changed:
+            # raw envelope only when the delta actually changed something
+            cur.execute(
+                """
+                INSERT INTO raw_tally_ingestion
+                    (ingestion_id, company_id, entity_type, fetched_at, payload, source)
+                VALUES (%s, %s, %s, NOW(), %s, %s)
+                """,
+                (str(uuid.uuid4()), company_id, entity_type, json.dumps(envelope), "tally")
+            )
+            bump_data_version(cur)
+
+    return len(changed)
+
+def _upsert_watermark(cur, company_id, entity_type, watermark):
+    # GREATEST: concurrent or out-of-order windows never move it backwards
+    cur.execute(
+        """
+        INSERT INTO tally_sync_watermarks
+            (company_id, entity_type, last_voucher_date, last_alter_id, last_synced_at)
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (company_id, entity_type) DO UPDATE
+        SET last_voucher_date = GREATEST(tally_sync_watermarks.last_voucher_date, EXCLUDED.last_voucher_date),
+            last_alter_id = GREATEST(tally_sync_watermarks.last_alter_id, EXCLUDED.last_alter_id),
+            last_synced_at = now()
+        """,
+        (company_id, entity_type, watermark.get("last_voucher_date"), watermark.get("last_alter_id") or 0)
     )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def advance_watermark(company_id, entity_type, watermark):
+    with get_connection() as conn, conn.cursor() as cur:
+        _upsert_watermark(cur, company_id, entity_type, watermark)
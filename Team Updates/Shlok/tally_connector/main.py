@@ -1,68 +1,20 @@
-from config import CONNECTOR_NAME, CONNECTOR_VERSION, SOURCE
+from config import CONNECTOR_NAME, CONNECTOR_VERSION, SOURCE, COMPANY_ID
 from tally_client import send_request
 from parser import xml_to_json
+from tally_requests import ledger_request_xml, voucher_request_xml
+from scheduler import run_sync
 from db import insert_raw_payload
+from app.core.raw_store import get_store
 from datetime import datetime, timezone
 import json
-import uuid
-
-
-# -----------------------------
-# XML REQUEST BUILDERS
-# -----------------------------
-
-def ledger_request_xml():
-    return """
-    <ENVELOPE>
-      <HEADER>
-        <TALLYREQUEST>Export Data</TALLYREQUEST>
-      </HEADER>
-      <BODY>
-        <EXPORTDATA>
-          <REQUESTDESC>
-            <REPORTNAME>List of Accounts</REPORTNAME>
-            <STATICVARIABLES>
-              <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
-            </STATICVARIABLES>
-          </REQUESTDESC>
-        </EXPORTDATA>
-      </BODY>
-    </ENVELOPE>
-    """
-
-
-def voucher_request_xml():
-    return """
-    <ENVELOPE>
-      <HEADER>
-        <TALLYREQUEST>Export Data</TALLYREQUEST>
-      </HEADER>
-      <BODY>
-        <EXPORTDATA>
-          <REQUESTDESC>
-            <REPORTNAME>Voucher Register</REPORTNAME>
-            <STATICVARIABLES>
-              <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
-            </STATICVARIABLES>
-          </REQUESTDESC>
-        </EXPORTDATA>
-      </BODY>
-    </ENVELOPE>
-    """
-
-
-# -----------------------------
-# CONFIG
-# -----------------------------
-
-COMPANY_ID = str(uuid.uuid4())  # temp, will map later
+import sys
 
 
 # -----------------------------
 # ENVELOPE BUILDER
 # -----------------------------
 
-def build_envelope(entity_type, request_type, raw_payload):
+def build_envelope(entity_type, request_type, raw_ref):
     return {
         "connector": {
             "name": CONNECTOR_NAME,
@@ -73,7 +25,8 @@ def build_envelope(entity_type, request_type, raw_payload):
         "entity_type": entity_type,
         "request_type": request_type,
         "fetched_at": datetime.utcnow().isoformat(),
-        "raw_payload": raw_payload
+        # content-addressed blob of the raw XML (app/core/raw_store.py)
+        "raw": raw_ref
     }
 
 
@@ -83,12 +36,14 @@ def build_envelope(entity_type, request_type, raw_payload):
 
 def fetch_and_store(entity_type, request_type, xml_request):
     xml_response = send_request(xml_request)
-    parsed_json = xml_to_json(xml_response)
+    # parse before storing so a malformed response never reaches the store
+    xml_to_json(xml_response)
+    raw_ref = get_store().put(xml_response)
 
     envelope = build_envelope(
         entity_type=entity_type,
         request_type=request_type,
-        raw_payload=parsed_json
+        raw_ref=raw_ref
     )
 
     insert_raw_payload(
@@ -97,7 +52,8 @@ def fetch_and_store(entity_type, request_type, xml_request):
         payload=json.dumps(envelope)
     )
 
-    print(f"✅ Stored {entity_type} data successfully")
+    dedup = " (already stored)" if raw_ref["deduped"] else ""
+    print(f"✅ Stored {entity_type} data successfully: {raw_ref['sha256'][:12]}{dedup}")
 
 
 # -----------------------------
@@ -106,6 +62,12 @@ def fetch_and_store(entity_type, request_type, xml_request):
 
 if __name__ == "__main__":
 
+    # Default: parallel delta sync of every configured company (see scheduler.py)
+    if "--full" not in sys.argv:
+        summary = run_sync()
+        print(f"✅ Synced {summary['companies']} companies: {summary['changed']} changed of {summary['fetched']} fetched")
+        sys.exit(1 if summary["failed"] else 0)
+
     # Fetch Ledgers
     fetch_and_store(
         entity_type="ledger",
@@ -1,70 +1,239 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import re
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
 
-MOCK_LEDGER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+# Size of the generated history; vouchers are spread over the last N days
+MOCK_TALLY_DAYS = int(os.getenv("MOCK_TALLY_DAYS", "90"))
+MOCK_TALLY_VOUCHERS_PER_DAY = int(os.getenv("MOCK_TALLY_VOUCHERS_PER_DAY", "10"))
+
+# Simulated Tally behaviour: fixed latency per request plus per voucher,
+# and a random share of 503s to exercise retries
+MOCK_TALLY_PORT = int(os.getenv("MOCK_TALLY_PORT", "9000"))
+MOCK_TALLY_LATENCY_MS = float(os.getenv("MOCK_TALLY_LATENCY_MS", "0"))
+MOCK_TALLY_PER_VOUCHER_MS = float(os.getenv("MOCK_TALLY_PER_VOUCHER_MS", "0"))
+MOCK_TALLY_FAIL_RATE = float(os.getenv("MOCK_TALLY_FAIL_RATE", "0"))
+
+LEDGERS = [("Cash", "Cash-in-Hand"), ("Sales", "Income")]
+STOCK_ITEMS = [
+    "HIKVISION 2MP DOME CAM", "CP PLUS 8CH DVR", "DAHUA 4MP BULLET CAMERA",
+    "CAT6 CABLE 305M", "WD PURPLE 1TB HDD", "12V 2A POWER ADAPTER",
+]
+
+
+# -----------------------------
+# GENERATED DATA
+# -----------------------------
+# Every create/alter takes the next ALTERID, as in Tally.
+
+_lock = threading.Lock()
+_alter_seq = 0
+LEDGER_DATA = []   # dicts: name, parent, guid, alter_id
+VOUCHER_DATA = []  # dicts: guid, number, date, type, amount, alter_id
+
+
+def _next_alter_id():
+    global _alter_seq
+    _alter_seq += 1
+    return _alter_seq
+
+
+def add_ledger(name, parent):
+    with _lock:
+        ledger = {"name": name, "parent": parent, "guid": f"ledger-{name}", "alter_id": _next_alter_id()}
+        LEDGER_DATA.append(ledger)
+        return ledger
+
+
+def add_voucher(voucher_date, amount, voucher_type="Sales"):
+    with _lock:
+        number = len(VOUCHER_DATA) + 1
+        voucher = {
+            "guid": f"voucher-{number}",
+            "number": str(number),
+            "date": voucher_date,
+            "type": voucher_type,
+            "amount": amount,
+            "alter_id": _next_alter_id(),
+        }
+        VOUCHER_DATA.append(voucher)
+        return voucher
+
+
+def alter_voucher(guid, amount):
+    with _lock:
+        for voucher in VOUCHER_DATA:
+            if voucher["guid"] == guid:
+                voucher["amount"] = amount
+                voucher["alter_id"] = _next_alter_id()
+                return voucher
+    raise KeyError(guid)
+
+
+def seed(days=MOCK_TALLY_DAYS, per_day=MOCK_TALLY_VOUCHERS_PER_DAY, today=None):
+    today = today or date.today()
+    rng = random.Random(42)
+    for name, parent in LEDGERS:
+        add_ledger(name, parent)
+    for offset in range(days - 1, -1, -1):
+        for _ in range(per_day):
+            add_voucher(today - timedelta(days=offset), rng.randint(100, 5000))
+
+
+# -----------------------------
+# XML RENDERING
+# -----------------------------
+
+def render_ledgers(ledgers):
+    items = "".join(
+        f"""
+        <LEDGER NAME="{escape(l['name'])}">
+          <NAME>{escape(l['name'])}</NAME>
+          <PARENT>{escape(l['parent'])}</PARENT>
+          <GUID>{l['guid']}</GUID>
+          <ALTERID>{l['alter_id']}</ALTERID>
+        </LEDGER>"""
+        for l in ledgers
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
 <ENVELOPE>
   <BODY>
     <DATA>
-      <COLLECTION>
-        <LEDGER>
-          <NAME>Cash</NAME>
-          <PARENT>Cash-in-Hand</PARENT>
-        </LEDGER>
-        <LEDGER>
-          <NAME>Sales</NAME>
-          <PARENT>Income</PARENT>
-        </LEDGER>
+      <COLLECTION>{items}
       </COLLECTION>
     </DATA>
   </BODY>
 </ENVELOPE>
 """
 
-MOCK_VOUCHER_XML = """<?xml version="1.0" encoding="UTF-8"?>
-<ENVELOPE>
-  <BODY>
-    <DATA>
+
+def render_vouchers(vouchers):
+    items = "".join(
+        f"""
       <VOUCHER>
-        <VOUCHERTYPENAME>Sales</VOUCHERTYPENAME>
-        <DATE>20260119</DATE>
+        <GUID>{v['guid']}</GUID>
+        <ALTERID>{v['alter_id']}</ALTERID>
+        <VOUCHERNUMBER>{v['number']}</VOUCHERNUMBER>
+        <VOUCHERTYPENAME>{v['type']}</VOUCHERTYPENAME>
+        <DATE>{v['date'].strftime('%Y%m%d')}</DATE>
+        <AMOUNT>{v['amount']}</AMOUNT>
         <LEDGERENTRIES>
           <LEDGERENTRY>
             <LEDGERNAME>Sales</LEDGERNAME>
-            <AMOUNT>-1000</AMOUNT>
+            <AMOUNT>-{v['amount']}</AMOUNT>
           </LEDGERENTRY>
           <LEDGERENTRY>
             <LEDGERNAME>Cash</LEDGERNAME>
-            <AMOUNT>1000</AMOUNT>
+            <AMOUNT>{v['amount']}</AMOUNT>
           </LEDGERENTRY>
         </LEDGERENTRIES>
-      </VOUCHER>
+        <ALLINVENTORYENTRIES.LIST>
+          <STOCKITEMNAME>{escape(STOCK_ITEMS[int(v['number']) % len(STOCK_ITEMS)])}</STOCKITEMNAME>
+          <ACTUALQTY>1 Nos</ACTUALQTY>
+          <AMOUNT>-{v['amount']}</AMOUNT>
+        </ALLINVENTORYENTRIES.LIST>
+      </VOUCHER>"""
+        for v in vouchers
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<ENVELOPE>
+  <BODY>
+    <DATA>{items}
     </DATA>
   </BODY>
 </ENVELOPE>
 """
 
 
+# -----------------------------
+# REQUEST FILTERS
+# -----------------------------
+
+def _static_date(body, name):
+    match = re.search(rf"<{name}>(\d{{8}})</{name}>", body)
+    return datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+
+def _alter_id_floor(body):
+    match = re.search(r"\$ALTERID\s*(?:&gt;|>)\s*(\d+)", body)
+    return int(match.group(1)) if match else 0
+
+
+def ledger_response(body):
+    floor = _alter_id_floor(body)
+    with _lock:
+        ledgers = [l for l in LEDGER_DATA if l["alter_id"] > floor]
+    return render_ledgers(ledgers)
+
+
+def voucher_response(body):
+    """SVFROMDATE / SVTODATE are inclusive, as in Tally."""
+    from_date = _static_date(body, "SVFROMDATE")
+    to_date = _static_date(body, "SVTODATE")
+    floor = _alter_id_floor(body)
+    with _lock:
+        vouchers = [
+            v for v in VOUCHER_DATA
+            if (from_date is None or v["date"] >= from_date)
+            and (to_date is None or v["date"] <= to_date)
+            and v["alter_id"] > floor
+        ]
+    if MOCK_TALLY_PER_VOUCHER_MS:
+        time.sleep(len(vouchers) * MOCK_TALLY_PER_VOUCHER_MS / 1000)
+    return render_vouchers(vouchers)
+
+
 class MockTallyHandler(BaseHTTPRequestHandler):
 
+    # peak concurrent requests, to check client-side host limits
+    in_flight = 0
+    max_in_flight = 0
+    _counter_lock = threading.Lock()
+
     def do_POST(self):
+        cls = type(self)
+        with cls._counter_lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            self._handle()
+        finally:
+            with cls._counter_lock:
+                cls.in_flight -= 1
+
+    def _handle(self):
         content_length = int(self.headers.get("Content-Length", 0))
         body = self.rfile.read(content_length).decode("utf-8")
 
-        if "List of Accounts" in body:
-            response = MOCK_LEDGER_XML
-        elif "Voucher Register" in body:
-            response = MOCK_VOUCHER_XML
+        if MOCK_TALLY_LATENCY_MS:
+            time.sleep(MOCK_TALLY_LATENCY_MS / 1000)
+        if random.random() < MOCK_TALLY_FAIL_RATE:
+            self.send_error(503, "Tally busy")
+            return
+
+        if "List of Accounts" in body or "<TYPE>Ledger</TYPE>" in body:
+            response = ledger_response(body)
+        elif "Voucher Register" in body or "<TYPE>Voucher</TYPE>" in body:
+            response = voucher_response(body)
         else:
             response = "<ENVELOPE><BODY><ERROR>Unknown Request</ERROR></BODY></ENVELOPE>"
 
+        payload = response.encode("utf-8")
         self.send_response(200)
         self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
-        self.wfile.write(response.encode("utf-8"))
+        self.wfile.write(payload)
 
 
 def run():
-    server = HTTPServer(("localhost", 9000), MockTallyHandler)
-    print("✅ Mock Tally running on http://localhost:9000")
+    seed()
+    server = ThreadingHTTPServer(("localhost", MOCK_TALLY_PORT), MockTallyHandler)
+    print(f"✅ Mock Tally running on http://localhost:{MOCK_TALLY_PORT} ({len(VOUCHER_DATA)} vouchers)")
     server.serve_forever()
 
 
@@ -1,6 +1,5 @@
 import xmltodict
-import json
 
 def xml_to_json(xml_response: str) -> dict:
-    parsed = xmltodict.parse(xml_response)
-    return json.loads(json.dumps(parsed))  # ensure pure JSON
+    # plain dicts straight from the parser; no json dumps/loads round trip
+    return xmltodict.parse(xml_response, dict_constructor=dict)
@@ -0,0 +1,219 @@
+from config import (
+    TALLY_URL, TALLY_COMPANY, TALLY_COMPANIES, COMPANY_ID, company_id_for,
+    SYNC_WORKERS, TALLY_HOST_CONCURRENCY, SYNC_CHUNK_DAYS,
+    SYNC_MAX_RETRIES, SYNC_RETRY_BACKOFF, SYNC_HISTORY_START,
+)
+from sync import sync_ledgers, sync_voucher_window, voucher_sync_range
+from db import advance_watermark
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+import requests
+
+
+# -----------------------------
+# COMPANIES
+# -----------------------------
+
+def parse_companies(spec=TALLY_COMPANIES):
+    """
+    "Company A=http://host1:9000,Company B" → [{name, url, company_id}].
+    Empty spec → the single company from TALLY_COMPANY / TALLY_URL.
+    """
+    if not spec.strip():
+        return [{"name": TALLY_COMPANY, "url": TALLY_URL, "company_id": COMPANY_ID}]
+
+    companies = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, url = item.partition("=")
+        name, url = name.strip(), (url.strip() or TALLY_URL)
+        companies.append({"name": name, "url": url, "company_id": company_id_for(url, name)})
+    return companies
+
+
+# -----------------------------
+# PLANNING
+# -----------------------------
+
+def split_range(from_date, to_date, chunk_days=SYNC_CHUNK_DAYS):
+    """Inclusive [from, to] → inclusive chunks of at most chunk_days."""
+    chunks = []
+    start = from_date
+    while start <= to_date:
+        end = min(start + timedelta(days=chunk_days - 1), to_date)
+        chunks.append((start, end))
+        start = end + timedelta(days=1)
+    return chunks
+
+
+def plan_jobs(companies, today=None, chunk_days=SYNC_CHUNK_DAYS, history_start=None):
+    """
+    One ledger job per company plus one voucher job per date chunk of
+    the first, full export; later runs fetch the ALTERID delta in one job.
+    Jobs are interleaved across companies so one slow host does not hold
+    every worker.
+    """
+    if history_start is None and SYNC_HISTORY_START:
+        history_start = date.fromisoformat(SYNC_HISTORY_START)
+
+    per_company = []
+    for company in companies:
+        jobs = [{"kind": "ledger", "company": company}]
+
+        from_date, to_date, current = voucher_sync_range(
+            company["company_id"], today, history_start
+        )
+        after = current.get("last_alter_id") or 0
+        if to_date:
+            windows = split_range(from_date, to_date, chunk_days)
+            # open-ended tail: post-dated vouchers are past today, and the
+            # ALTERID deltas after this run never look below its watermark
+            windows[-1] = (windows[-1][0], None)
+        else:
+            windows = [(from_date, to_date)]
+        for window_from, window_to in windows:
+            jobs.append({
+                "kind": "voucher",
+                "company": company,
+                "from_date": window_from,
+                "to_date": window_to,
+                "after_alter_id": after,
+                "watermark": {
+                    "last_voucher_date": current.get("last_voucher_date"),
+                    "last_alter_id": after,
+                },
+            })
+        per_company.append(jobs)
+
+    interleaved = []
+    for i in range(max((len(jobs) for jobs in per_company), default=0)):
+        interleaved.extend(jobs[i] for jobs in per_company if i < len(jobs))
+    return interleaved
+
+
+# -----------------------------
+# HOST LIMITS + RETRIES
+# -----------------------------
+
+class HostLimiter:
+    """At most `limit` in-flight requests per Tally host:port."""
+
+    def __init__(self, limit=TALLY_HOST_CONCURRENCY):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+
+def _run_job(job, limiter, retries, backoff):
+    company = job["company"]
+    for attempt in range(retries + 1):
+        try:
+            with limiter.slot(company["url"]):
+                if job["kind"] == "ledger":
+                    result = sync_ledgers(company["company_id"], company["name"], company["url"])
+                else:
+                    # chunks never advance the watermark on their own; see run_sync
+                    result = sync_voucher_window(
+                        company["company_id"], company["name"],
+                        job["from_date"], job["to_date"], company["url"],
+                        job["watermark"], advance=False, after_alter_id=job["after_alter_id"],
+                    )
+            result["attempts"] = attempt + 1
+            return result
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            # full jitter, outside the host slot so other jobs can use it
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+
+# -----------------------------
+# SCHEDULER
+# -----------------------------
+
+def run_sync(companies=None, workers=SYNC_WORKERS, host_limit=TALLY_HOST_CONCURRENCY,
+             chunk_days=SYNC_CHUNK_DAYS, retries=SYNC_MAX_RETRIES,
+             backoff=SYNC_RETRY_BACKOFF, today=None, history_start=None):
+    """
+    Fan (company × report × date window) jobs out over a thread pool.
+
+    A company's voucher watermark only advances once all of its windows
+    succeeded; if any window fails after retries, the next run re-fetches
+    from the old watermark (upserts make that safe).
+    """
+    started = time.perf_counter()
+    companies = companies if companies is not None else parse_companies()
+    jobs = plan_jobs(companies, today, chunk_days, history_start)
+    limiter = HostLimiter(host_limit)
+
+    results, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_job, job, limiter, retries, backoff): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed.append({
+                    "company": job["company"]["name"],
+                    "company_id": job["company"]["company_id"],
+                    "kind": job["kind"],
+                    "from_date": job.get("from_date"),
+                    "to_date": job.get("to_date"),
+                    "error": str(e),
+                })
+
+    failed_companies = {f["company_id"] for f in failed if f["kind"] == "voucher"}
+    for company in companies:
+        if company["company_id"] in failed_companies:
+            continue
+        windows = [
+            r for r in results
+            if r["company_id"] == company["company_id"] and r["entity_type"] == "voucher"
+        ]
+        if not windows:
+            continue
+        dates = [r["watermark"]["last_voucher_date"] for r in windows if r["watermark"].get("last_voucher_date")]
+        advance_watermark(company["company_id"], "voucher", {
+            "last_voucher_date": max(dates) if dates else None,
+            "last_alter_id": max(r["watermark"].get("last_alter_id") or 0 for r in windows),
+        })
+
+    return {
+        "companies": len(companies),
+        "jobs": len(jobs),
+        "failed": failed,
+        "fetched": sum(r["fetched"] for r in results),
+        "changed": sum(r["changed"] for r in results),
+        "bytes": sum(r["bytes"] for r in results),
+        "retries": sum(r["attempts"] - 1 for r in results),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# -----------------------------
+# ENTRY POINT
+# -----------------------------
+
+if __name__ == "__main__":
+    summary = run_sync()
+    print(
+        f"✅ {summary['companies']} companies, {summary['jobs']} jobs: "
+        f"{summary['changed']} changed of {summary['fetched']} fetched, "
+        f"{summary['bytes']} bytes in {summary['seconds']}s"
+    )
+    for f in summary["failed"]:
+        print(f"❌ {f['company']} {f['kind']} {f['from_date']}..{f['to_date']}: {f['error']}")
@@ -0,0 +1,198 @@
+from config import (
+    CONNECTOR_NAME, CONNECTOR_VERSION, SOURCE,
+    TALLY_URL, TALLY_COMPANY, COMPANY_ID,
+)
+from tally_client import send_request
+from parser import xml_to_json
+from tally_requests import ledger_request_xml, voucher_request_xml
+from db import get_watermark, apply_sync
+from app.core.raw_store import get_store
+from datetime import date, datetime
+import time
+
+
+# -----------------------------
+# RECORD EXTRACTION
+# -----------------------------
+
+def find_records(node, tag):
+    """Every element named `tag` anywhere in an xmltodict tree."""
+    if isinstance(node, list):
+        for item in node:
+            yield from find_records(item, tag)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            if key == tag:
+                for item in value if isinstance(value, list) else [value]:
+                    if isinstance(item, dict):
+                        yield item
+            else:
+                yield from find_records(value, tag)
+
+
+def _alter_id(record):
+    try:
+        return int(record.get("ALTERID") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _voucher_date(record):
+    try:
+        return datetime.strptime(record.get("DATE") or "", "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def voucher_key(record):
+    # GUID is stable across edits; older exports without it fall back to
+    # the natural key
+    return record.get("GUID") or "|".join(
+        str(record.get(k) or "") for k in ("VOUCHERTYPENAME", "VOUCHERNUMBER", "DATE")
+    )
+
+
+def ledger_key(record):
+    return record.get("GUID") or record.get("NAME") or record.get("@NAME") or ""
+
+
+# -----------------------------
+# ENVELOPE BUILDER
+# -----------------------------
+
+def build_envelope(company_id, entity_type, request_type, raw_ref, window):
+    return {
+        "connector": {
+            "name": CONNECTOR_NAME,
+            "version": CONNECTOR_VERSION,
+            "source": SOURCE
+        },
+        "company_id": company_id,
+        "entity_type": entity_type,
+        "request_type": request_type,
+        "sync_window": window,
+        "fetched_at": datetime.utcnow().isoformat(),
+        # content-addressed blob of the raw XML (app/core/raw_store.py);
+        # the parsed records themselves live in tally_records
+        "raw": raw_ref
+    }
+
+
+# -----------------------------
+# DELTA SYNC
+# -----------------------------
+
+def _sync(company_id, entity_type, request_type, xml_request, window, tag, key_fn,
+          watermark, url=TALLY_URL, advance=True):
+    """
+    Fetch one request and store it. `watermark` is updated in place with
+    the highest date/ALTERID seen; it is only persisted when `advance`.
+    """
+    started = time.perf_counter()
+    xml_response = send_request(xml_request, url)
+    parsed = xml_to_json(xml_response)
+
+    records = []
+    for record in find_records(parsed, tag):
+        alter_id = _alter_id(record)
+        record_date = _voucher_date(record) if entity_type == "voucher" else None
+        records.append((key_fn(record), alter_id, record_date, record))
+
+        watermark["last_alter_id"] = max(watermark.get("last_alter_id") or 0, alter_id)
+        if record_date and (watermark.get("last_voucher_date") is None
+                            or record_date > watermark["last_voucher_date"]):
+            watermark["last_voucher_date"] = record_date
+
+    # identical responses (unchanged windows, repeated full exports) dedup
+    # to the blob already stored
+    raw_ref = get_store().put(xml_response)
+    envelope = build_envelope(company_id, entity_type, request_type, raw_ref, window)
+    changed = apply_sync(company_id, entity_type, envelope, records,
+                         watermark if advance else None)
+
+    return {
+        "company_id": company_id,
+        "entity_type": entity_type,
+        "window": window,
+        "bytes": len(xml_response.encode("utf-8")),
+        "fetched": len(records),
+        "changed": changed,
+        "seconds": round(time.perf_counter() - started, 3),
+        "watermark": watermark,
+    }
+
+
+def sync_ledgers(company_id=COMPANY_ID, company=TALLY_COMPANY, url=TALLY_URL):
+    current = get_watermark(company_id, "ledger") or {}
+    after = current.get("last_alter_id") or 0
+
+    return _sync(
+        company_id, "ledger", "list_of_accounts",
+        ledger_request_xml(company, after_alter_id=after),
+        {"after_alter_id": after},
+        "LEDGER", ledger_key,
+        {"last_alter_id": after},
+        url,
+    )
+
+
+def voucher_sync_range(company_id=COMPANY_ID, today=None, history_start=None):
+    """
+    (from_date, to_date, current watermark) for the next voucher sync.
+
+    After the first run the delta is selected by ALTERID, like ledgers:
+    old edits and back-dated entries carry a new ALTERID whatever their
+    date, so the range is only a bound (from `history_start`, open-ended).
+    The first run is a full export from `history_start`, or unbounded if
+    unset; `today` then ends the part plan_jobs splits into chunks, and
+    its last chunk is left open so post-dated vouchers are included.
+    """
+    today = today or date.today()
+    current = get_watermark(company_id, "voucher") or {}
+
+    if current.get("last_alter_id"):
+        return history_start, None, current
+    return history_start, today if history_start else None, current
+
+
+def sync_voucher_window(company_id, company, from_date, to_date, url=TALLY_URL,
+                        watermark=None, advance=True, after_alter_id=0):
+    return _sync(
+        company_id, "voucher", "voucher_register",
+        voucher_request_xml(company, from_date, to_date, after_alter_id),
+        {
+            "from_date": from_date.isoformat() if from_date else None,
+            "to_date": to_date.isoformat() if to_date else None,
+            "after_alter_id": after_alter_id,
+        },
+        "VOUCHER", voucher_key,
+        dict(watermark or {}),
+        url,
+        advance,
+    )
+
+
+def sync_vouchers(company_id=COMPANY_ID, company=TALLY_COMPANY, today=None, url=TALLY_URL):
+    from_date, to_date, current = voucher_sync_range(company_id, today)
+    after = current.get("last_alter_id") or 0
+    return sync_voucher_window(
+        company_id, company, from_date, to_date, url,
+        {"last_voucher_date": current.get("last_voucher_date"), "last_alter_id": after},
+        after_alter_id=after,
+    )
+
+
+def sync_company(company_id=COMPANY_ID, company=TALLY_COMPANY, url=TALLY_URL):
+    return [sync_ledgers(company_id, company, url), sync_vouchers(company_id, company, url=url)]
+
+
+# -----------------------------
+# ENTRY POINT
+# -----------------------------
+
+if __name__ == "__main__":
+    for result in sync_company():
+        print(
+            f"✅ Synced {result['entity_type']}: {result['changed']}/{result['fetched']} changed, "
+            f"{result['bytes']} bytes in {result['seconds']}s {result['window']}"
+        )
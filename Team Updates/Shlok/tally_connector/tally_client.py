@@ -1,13 +1,26 @@
+import threading
+
 import requests
-from app.config import TALLY_URL
+from config import TALLY_URL, TALLY_TIMEOUT
+
+# One keep-alive session per worker thread; requests.Session is not
+# safe to share across threads.
+_local = threading.local()
+
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
 
 
-def send_request(xml_request: str) -> str:
-    response = requests.post(
-        TALLY_URL,
+def send_request(xml_request: str, url: str = TALLY_URL) -> str:
+    response = _session().post(
+        url,
         data=xml_request.encode("utf-8"),
         headers={"Content-Type": "application/xml"},
-        timeout=30
+        timeout=TALLY_TIMEOUT
     )
     response.raise_for_status()
     return response.text
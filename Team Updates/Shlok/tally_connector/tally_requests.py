@@ -0,0 +1,128 @@
+from datetime import date
+from xml.sax.saxutils import escape
+
+
+# -----------------------------
+# XML REQUEST BUILDERS
+# -----------------------------
+
+def tally_date(d: date) -> str:
+    return d.strftime("%Y%m%d")
+
+
+def _static_variables(company="", from_date=None, to_date=None):
+    variables = ["<SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>"]
+    if company:
+        variables.append(f"<SVCURRENTCOMPANY>{escape(company)}</SVCURRENTCOMPANY>")
+    if from_date:
+        variables.append(f"<SVFROMDATE>{tally_date(from_date)}</SVFROMDATE>")
+    if to_date:
+        variables.append(f"<SVTODATE>{tally_date(to_date)}</SVTODATE>")
+    return "\n              ".join(variables)
+
+
+def ledger_request_xml(company="", after_alter_id=0):
+    """
+    Full "List of Accounts", or only ledgers altered after
+    `after_alter_id` via an inline TDL collection filter.
+    """
+    if not after_alter_id:
+        return f"""
+    <ENVELOPE>
+      <HEADER>
+        <TALLYREQUEST>Export Data</TALLYREQUEST>
+      </HEADER>
+      <BODY>
+        <EXPORTDATA>
+          <REQUESTDESC>
+            <REPORTNAME>List of Accounts</REPORTNAME>
+            <STATICVARIABLES>
+              {_static_variables(company)}
+            </STATICVARIABLES>
+          </REQUESTDESC>
+        </EXPORTDATA>
+      </BODY>
+    </ENVELOPE>
+    """
+
+    return f"""
+    <ENVELOPE>
+      <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>LedgerDelta</ID>
+      </HEADER>
+      <BODY>
+        <DESC>
+          <STATICVARIABLES>
+              {_static_variables(company)}
+          </STATICVARIABLES>
+          <TDL>
+            <TDLMESSAGE>
+              <COLLECTION NAME="LedgerDelta">
+                <TYPE>Ledger</TYPE>
+                <FETCH>NAME, PARENT, ALTERID, GUID</FETCH>
+                <FILTERS>AlteredSince</FILTERS>
+              </COLLECTION>
+              <SYSTEM TYPE="Formulae" NAME="AlteredSince">$ALTERID &gt; {int(after_alter_id)}</SYSTEM>
+            </TDLMESSAGE>
+          </TDL>
+        </DESC>
+      </BODY>
+    </ENVELOPE>
+    """
+
+
+def voucher_request_xml(company="", from_date=None, to_date=None, after_alter_id=0):
+    """
+    Voucher Register limited to [from_date, to_date] when given, or only
+    vouchers altered after `after_alter_id` (any date inside the bounds)
+    via an inline TDL collection filter.
+    """
+    if after_alter_id:
+        return f"""
+    <ENVELOPE>
+      <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>VoucherDelta</ID>
+      </HEADER>
+      <BODY>
+        <DESC>
+          <STATICVARIABLES>
+              {_static_variables(company, from_date, to_date)}
+          </STATICVARIABLES>
+          <TDL>
+            <TDLMESSAGE>
+              <COLLECTION NAME="VoucherDelta">
+                <TYPE>Voucher</TYPE>
+                <FETCH>GUID, ALTERID, VOUCHERNUMBER, VOUCHERTYPENAME, DATE, AMOUNT, LEDGERENTRIES.LIST, ALLINVENTORYENTRIES.LIST</FETCH>
+                <FILTERS>AlteredSince</FILTERS>
+              </COLLECTION>
+              <SYSTEM TYPE="Formulae" NAME="AlteredSince">$ALTERID &gt; {int(after_alter_id)}</SYSTEM>
+            </TDLMESSAGE>
+          </TDL>
+        </DESC>
+      </BODY>
+    </ENVELOPE>
+    """
+
+    return f"""
+    <ENVELOPE>
+      <HEADER>
+        <TALLYREQUEST>Export Data</TALLYREQUEST>
+      </HEADER>
+      <BODY>
+        <EXPORTDATA>
+          <REQUESTDESC>
+            <REPORTNAME>Voucher Register</REPORTNAME>
+            <STATICVARIABLES>
+              {_static_variables(company, from_date, to_date)}
+            </STATICVARIABLES>
+          </REQUESTDESC>
+        </EXPORTDATA>
+      </BODY>
+    </ENVELOPE>
+    """